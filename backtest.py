@@ -0,0 +1,205 @@
+"""
+Iron Gate 时点回测 (Point-in-Time Backtest)
+==========================================
+回答: "如果在过去每个季度末运行 Iron Gate，会筛出哪些股票？之后表现如何？"
+
+- 财报只使用在该时点之前已披露的部分 (filingDate <= 时点)
+- 财报与价格历史一次性加载，所有时点共享同一份数据，每个时点只做过滤 + 向量化筛选
+- TTM 净利率由季度 netIncome / revenue 重建；PE 走 IronGate 的备用路径 (股价 / TTM EPS)
+"""
+
+import argparse
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from phases.screener import PASS, INSUFFICIENT_DATA, IronGateScreener, Thresholds, UniversePanel
+from tools.fmp import FMPClient
+from tools.statement_store import COLUMNS, StatementStore
+
+
+def quarter_ends(start: date, end: date) -> List[pd.Timestamp]:
+    """start 与 end 之间的所有季度末日期"""
+    dates = []
+    for year in range(start.year, end.year + 1):
+        for month, day in ((3, 31), (6, 30), (9, 30), (12, 31)):
+            d = date(year, month, day)
+            if start <= d <= end:
+                dates.append(pd.Timestamp(d))
+    return dates
+
+
+class IronGateBacktest:
+    """
+    Iron Gate 历史回测引擎
+
+    用法:
+        bt = IronGateBacktest.from_store(store, tickers, price_history)
+        summary, membership = bt.run(quarter_ends(start, end))
+    """
+
+    def __init__(self, tickers: List[str], statements: pd.DataFrame, prices: pd.DataFrame,
+                 thresholds: Optional[Thresholds] = None):
+        """
+        Args:
+            tickers: 股票列表
+            statements: store 格式的财报 (所有股票合并)
+            prices: 宽表日线收盘价 (index 为日期，columns 为 ticker)
+            thresholds: 筛选阈值 (默认取自 config)
+        """
+        self.tickers = tickers
+        self.screener = IronGateScreener(thresholds)
+
+        statements = statements.copy()
+        # 披露日: 优先使用 filingDate，缺失时按报告期结束日 + 固定滞后估计
+        filed = pd.to_datetime(statements['filingDate'], errors='coerce')
+        lagged = pd.to_datetime(statements['date']) + pd.Timedelta(days=config.BACKTEST_FILING_LAG_DAYS)
+        statements['available'] = filed.fillna(lagged)
+        self.statements = statements.sort_values(['symbol', 'period_type', 'date'],
+                                                 ascending=[True, True, False]).reset_index(drop=True)
+
+        # 价格一次性前向填充，之后按时点直接取行
+        self.prices = prices.sort_index().ffill()
+
+    @classmethod
+    def from_store(cls, store: StatementStore, tickers: List[str], price_history: Dict[str, List[Dict]],
+                   thresholds: Optional[Thresholds] = None) -> "IronGateBacktest":
+        """
+        Args:
+            store: 本地财报存储 (需已回填足够长的历史)
+            tickers: 股票列表
+            price_history: {ticker: FMP historical-price-eod/light 响应}
+        """
+        frames = [f for f in (store.load(t) for t in tickers) if not f.empty]
+        statements = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+
+        series = {}
+        for ticker, rows in price_history.items():
+            if rows:
+                s = pd.Series({pd.Timestamp(r['date']): r.get('price') for r in rows}, dtype=float)
+                series[ticker] = s[~s.index.duplicated()]
+        prices = pd.DataFrame(series).reindex(columns=tickers)
+        return cls(tickers, statements, prices, thresholds)
+
+    def _price_on(self, when: pd.Timestamp) -> pd.Series:
+        """when 当日 (或之前最近交易日) 的收盘价；超出价格历史范围时为 NaN"""
+        if self.prices.empty or when < self.prices.index[0] or when > self.prices.index[-1]:
+            return pd.Series(np.nan, index=self.tickers)
+        return self.prices.loc[:when].iloc[-1]
+
+    def _ttm_net_margin(self, visible: pd.DataFrame) -> pd.Series:
+        quarters = visible[(visible['period_type'] == 'quarter') & visible['revenue'].notna()]
+        latest = quarters[quarters.groupby('symbol').cumcount() < config.QUARTERS_FOR_NI_SUM]
+        sums = latest.groupby('symbol')[['netIncome', 'revenue']].sum()
+        return (sums['netIncome'] / sums['revenue']).where(sums['revenue'] > 0)
+
+    def evaluate_date(self, asof: pd.Timestamp,
+                      thresholds: Optional[Thresholds] = None) -> pd.DataFrame:
+        """
+        在单个时点对全部股票执行 Iron Gate
+
+        Returns:
+            DataFrame[ticker, code, passed, forward_return]，code 为 phases.screener 中的判定编码
+        """
+        visible = self.statements[self.statements['available'] <= asof]
+        visible_symbols = set(visible['symbol'])
+        tickers = [t for t in self.tickers if t in visible_symbols]
+        if not tickers:
+            return pd.DataFrame(columns=['ticker', 'code', 'passed', 'forward_return'])
+
+        net_margin = self._ttm_net_margin(visible).reindex(tickers).fillna(0.0)
+        price_now = self._price_on(asof).reindex(tickers)
+        price_later = self._price_on(asof + pd.Timedelta(days=config.BACKTEST_FORWARD_DAYS)).reindex(tickers)
+
+        ratios = {t: {'netProfitMarginTTM': float(net_margin[t])} for t in tickers}
+        quotes = {t: {'price': float(price_now[t]) if pd.notna(price_now[t]) else 0} for t in tickers}
+        panel = UniversePanel.from_statement_frame(tickers, visible, ratios, quotes)
+
+        raw = self.screener.compute_raw(panel)
+        codes = self.screener.classify(raw, thresholds)
+        forward = (price_later / price_now - 1).to_numpy()
+
+        return pd.DataFrame({
+            'ticker': tickers,
+            'code': codes,
+            'passed': codes == PASS,
+            'forward_return': forward,
+        })
+
+    def run(self, dates: List[pd.Timestamp],
+            thresholds: Optional[Thresholds] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        在一系列时点上滚动回测
+
+        Returns:
+            (summary, membership)
+            summary: 每个时点的股票数、通过数、通过率与远期收益 (通过组 / 全体 / 超额)
+            membership: 每个 (时点, ticker) 的判定结果
+        """
+        summaries, memberships = [], []
+        for asof in dates:
+            result = self.evaluate_date(asof, thresholds)
+            evaluated = result[result['code'] != INSUFFICIENT_DATA]
+            passed = evaluated[evaluated['passed']]
+            fwd_passed = passed['forward_return'].mean()
+            fwd_all = evaluated['forward_return'].mean()
+            summaries.append({
+                'date': asof.date(),
+                'tickers': len(result),
+                'evaluated': len(evaluated),
+                'passed': len(passed),
+                'pass_rate': len(passed) / len(evaluated) if len(evaluated) else np.nan,
+                'fwd_return_passed': fwd_passed,
+                'fwd_return_universe': fwd_all,
+                'excess_return': fwd_passed - fwd_all,
+            })
+            memberships.append(result.assign(date=asof.date()))
+
+        summary = pd.DataFrame(summaries)
+        membership = pd.concat(memberships, ignore_index=True) if memberships else pd.DataFrame()
+        return summary, membership
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGP Iron Gate point-in-time backtest")
+    parser.add_argument("--tickers", type=str, required=True, help="Comma-separated list of tickers")
+    # DateOffset 在 2 月 29 日自动落到 2 月 28 日 (date.replace 会抛 ValueError)
+    default_start = (pd.Timestamp(date.today()) - pd.DateOffset(years=10)).date()
+    parser.add_argument("--start", type=str, default=str(default_start),
+                        help="First as-of date (YYYY-MM-DD)")
+    parser.add_argument("--end", type=str, default=str(date.today()), help="Last as-of date (YYYY-MM-DD)")
+    parser.add_argument("--offline", action="store_true", help="Use only the statement store and cached prices")
+    parser.add_argument("--out", type=str, default="backtest_summary.csv", help="Summary CSV path")
+    args = parser.parse_args()
+
+    tickers = [t.strip().upper() for t in args.tickers.split(",")]
+    start, end = date.fromisoformat(args.start), date.fromisoformat(args.end)
+    price_end = str(end + timedelta(days=config.BACKTEST_FORWARD_DAYS + 7))
+
+    fmp = FMPClient(offline=args.offline)
+    store = StatementStore()
+    if not args.offline:
+        print(f"Loading statement history for {len(tickers)} tickers...")
+        fmp.prefetch(tickers, lambda snapshot: store.refresh(fmp, snapshot.ticker, backfill=config.BACKTEST_BACKFILL))
+        print("Loading price history...")
+        fmp.prefetch(tickers, lambda snapshot: fmp.get_historical_prices(snapshot.ticker, args.start, price_end))
+
+    price_history = {}
+    for ticker in tickers:
+        price_history[ticker] = fmp.get_historical_prices(ticker, args.start, price_end)
+        fmp.release(ticker)
+
+    bt = IronGateBacktest.from_store(store, tickers, price_history)
+    summary, membership = bt.run(quarter_ends(start, end))
+
+    print(summary.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    summary.to_csv(args.out, index=False)
+    membership.to_csv(args.out.replace(".csv", "_membership.csv"), index=False)
+    print(f"Backtest saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,9 +43,173 @@ PEG_THRESHOLD_BUY = 1.5            # PEG 1.0 - 1.5 -> 合理买入
 PEG_THRESHOLD_BUBBLE = 2.0         # PEG > 2.0 -> 泡沫风险 (Iron Gate 淘汰线)
 PEG_THRESHOLD_SELL = 2.5           # PEG > 2.5 -> 卖出信号 (Watchtower)
 
+# Iron Gate 结果复用: 股价按对数分档计入输入指纹 (每档约 5%)，跨档时重新计算 PEG
+IRON_GATE_PRICE_BUCKET = 0.05
+
 # 毛利斜率噪音容忍度
 GROSS_MARGIN_SLOPE_TOLERANCE = -0.005  # 允许轻微下降
 
+# 稀释盾: TTM SBC 占营收比例上限
+SBC_REVENUE_RATIO_MAX = 0.20       # SBC / Revenue > 20% -> 淘汰
+
+# --- Phase 3: Intelligence ---
+# "per_prompt": 每个字段单独一次 LLM 调用；"research_pack": 一次结构化调用填充全部字段
+INTELLIGENCE_MODE = "per_prompt"
+
+# 搜索深度: 先用 basic，结果单薄 (结果数过少 / 最高相关性分数过低 / KPI 未找到) 时升级为 advanced
+SEARCH_INITIAL_DEPTH = "basic"
+SEARCH_ESCALATION_DEPTH = "advanced"
+SEARCH_MIN_RESULTS = 2
+SEARCH_MIN_SCORE = 0.5             # Tavily score (0-1)
+
+# 搜索结果上下文: 每个提示词的 token 预算、近似重复阈值与段落切分长度
+CONTEXT_TOKEN_BUDGET = 1200
+CONTEXT_DEDUP_THRESHOLD = 0.8      # 词 3-gram Jaccard 相似度 >= 0.8 视为重复段落
+CONTEXT_PASSAGE_MAX_TOKENS = 150
+CONTEXT_TOKENIZER_ENCODING = "o200k_base"   # tiktoken 编码 (不可用时退回正则近似分词)
+
 # --- Phase 4: Tribunal ---
 # 高速增长豁免线 (PEG > 2.0 但增速超过此值可豁免)
 HIGH_GROWTH_EXEMPTION = 0.40  # 40%
+
+# ========== Data Cache ==========
+# FMP 响应磁盘缓存目录
+CACHE_DIR = os.getenv("MGP_CACHE_DIR", ".cache")
+FMP_CACHE_DIR = os.path.join(CACHE_DIR, "fmp")
+
+# 各端点的新鲜度 (秒)：财报按季度更新，可长期缓存；报价/TTM 比率随股价变化，短期缓存
+FMP_CACHE_TTL = {
+    "income-statement": 7 * 24 * 3600,
+    "cash-flow-statement": 7 * 24 * 3600,
+    "key-metrics": 7 * 24 * 3600,
+    "financial-growth": 7 * 24 * 3600,
+    "profile": 30 * 24 * 3600,
+    "ratios-ttm": 3600,
+    "quote": 5 * 60,
+    "batch-quote": 5 * 60,
+    "historical-price-eod/light": 24 * 3600,
+}
+FMP_CACHE_DEFAULT_TTL = 3600       # 未列出端点的默认有效期
+
+# 本地财报列式存储 (Parquet，每只股票一个文件)
+STATEMENT_STORE_DIR = os.path.join(CACHE_DIR, "statements")
+# 首次入库回填的期数 (之后只增量拉取新报告期)
+STATEMENT_STORE_BACKFILL = {"quarter": 12, "annual": 5}
+
+# LLM 响应缓存 (SQLite，键为 model / system prompt / prompt / temperature / schema 的哈希)
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm.sqlite")
+LLM_CACHE_TTL = None               # 有效期 (秒)，None 表示永不过期 (相同请求永远复用)
+
+# Tavily 搜索结果缓存 (键为规范化查询 + search_depth + max_results，跨股票、跨运行复用)
+SEARCH_CACHE_DIR = os.path.join(CACHE_DIR, "search")
+# 各类查询的新鲜度 (秒)：内部人交易 / 股价新闻变化快，短期缓存；研发 / 护城河等结构性信息长期缓存
+SEARCH_CACHE_TTL = {
+    "insider": 24 * 3600,
+    "dislocation": 24 * 3600,
+    "events": 3 * 24 * 3600,
+    "kpi": 7 * 24 * 3600,
+    "variant": 7 * 24 * 3600,
+    "management": 30 * 24 * 3600,
+    "moat": 30 * 24 * 3600,
+    "blue_sky": 30 * 24 * 3600,
+}
+SEARCH_CACHE_DEFAULT_TTL = 24 * 3600   # 未指定类别的查询
+# 已取回文档的本地全文索引 (SQLite FTS5)：Phase 3 先查本地，覆盖不足或过期 (同上有效期) 时才请求 Tavily
+DOC_INDEX_PATH = os.path.join(CACHE_DIR, "documents.sqlite")
+
+# 报告译文缓存 (按章节内容哈希)
+TRANSLATION_CACHE_DIR = os.path.join(CACHE_DIR, "translations")
+
+# 分析状态 (各阶段输入指纹与输出，用于增量重跑)
+STATE_DIR = os.path.join(CACHE_DIR, "state")
+# Intelligence 结果的有效期 (天)：输入未变化时也定期重新搜索，捕获新闻 / 内部人交易等时效信息
+INTELLIGENCE_STALE_DAYS = 30
+
+# ========== FMP HTTP ==========
+FMP_POOL_SIZE = 10                 # 连接池大小 (keep-alive 复用的最大连接数)
+FMP_TIMEOUT = 30                   # 单次请求超时 (秒)
+FMP_MAX_RETRIES = 4                # 429 / 5xx / 网络错误的最大重试次数
+FMP_BACKOFF_FACTOR = 0.5           # 指数退避基数: 0.5s, 1s, 2s, 4s... (有 Retry-After 时以其为准)
+FMP_BATCH_QUOTE_SIZE = 100         # batch-quote 单次请求的股票数上限
+FMP_PREFETCH_WORKERS = 8           # 多股票预热的并发数 (不超过连接池大小)
+FMP_ASYNC_CONCURRENCY = 5          # AsyncFMPClient 同时在途的请求上限
+
+# ========== Research Concurrency ==========
+INTELLIGENCE_MAX_WORKERS = 12      # Phase 3 并发执行的调研任务数
+SEARCH_MAX_CONCURRENCY = 4         # 同时在途的 Tavily 请求上限
+SEARCH_RATE_PER_SECOND = 5.0       # Tavily 平均请求速率上限 (令牌桶)
+SEARCH_RATE_BURST = 10             # 令牌桶容量 (允许的突发请求数)
+LLM_MAX_CONCURRENCY = 4            # 同时在途的 LLM 请求上限 (OpenRouter 限流)
+TRANSLATION_MAX_WORKERS = 6        # 报告按章节并发翻译的线程数
+# 多股票分阶段流水线: 各阶段同时处理的股票数 (Phase 1 受 FMP 限制可大范围并发，LLM 阶段受 LLM / 搜索上限约束)
+PIPELINE_WORKERS = {"iron_gate": 16, "identifier": 4, "intelligence": 3, "tribunal": 4}
+PIPELINE_QUEUE_SIZE = 32           # 阶段之间的有界队列长度 (下游积压时上游阻塞)
+LLM_MAX_RETRIES = 2                # LLM 限流 / 网络 / 5xx 错误的最大重试次数
+LLM_BACKOFF_FACTOR = 1.0           # 指数退避基数: 1s, 2s...
+SEARCH_MAX_RETRIES = 2             # Tavily 超时 / 网络 / 5xx 错误的最大重试次数
+SEARCH_BACKOFF_FACTOR = 1.0
+
+# ========== LLM Routing ==========
+# 模型档位 (OpenRouter 模型名)
+LLM_MODEL_TIERS = {
+    "reasoning": "google/gemini-3-pro-preview",   # 需要综合判断的调用 (Tribunal)
+    "standard": "google/gemini-2.5-flash",        # 摘要与分类
+    "fast": "google/gemini-2.5-flash-lite",       # 抽取与格式整理
+}
+LLM_DEFAULT_TIER = "reasoning"     # 未配置调用点的请求使用的档位
+# 调用点 -> 档位 (可用 route_eval.py 回放已记录的请求，比较各档位的耗时、费用与一致性后调整)
+LLM_ROUTES = {
+    "kpi_extraction": "fast",      # Phase 3: KPI 数值抽取
+    "event_list": "fast",          # Phase 3: 近期事件列表
+    "soft_factor": "standard",     # Phase 3: 管理层 / 护城河 / 内部人 / 价格错位 / 蓝天 / 预期差摘要
+    "research_pack": "standard",   # Phase 3: research pack 模式的单次结构化调用
+    "identifier": "standard",      # Phase 2: 商业模式与 KPI 识别
+    "tribunal": "reasoning",       # Phase 4: 最终裁决
+    "translation": "fast",         # 报告翻译
+}
+
+# --- 批量模式 (--batch): 这些调用点的结构化请求合并为一批提交 (OpenAI Batch API 格式) ---
+LLM_BATCH_ROUTES = ("identifier", "tribunal")
+# "local": 经 OpenRouter 在进程内并发执行 (默认，无需额外配置)；"openai": OpenAI Batch API (需配置下面三项)
+LLM_BATCH_SUBMITTER = "local"
+LLM_BATCH_BASE_URL = os.getenv("LLM_BATCH_BASE_URL", "https://api.openai.com/v1")
+LLM_BATCH_API_KEY = os.getenv("LLM_BATCH_API_KEY")   # OpenAI 密钥 (OPENAI_API_KEY 发往 OpenRouter，不能复用)
+# 档位 -> 批量端点提供的模型名 (LLM_MODEL_TIERS 中的 OpenRouter 模型在 OpenAI Batch API 上不存在)；
+# 批量调用点用到的档位未映射时 --batch 启动即报错，例: {"standard": "gpt-4.1-mini", "reasoning": "gpt-4.1"}
+LLM_BATCH_MODELS = {}
+LLM_BATCH_DIR = os.path.join(CACHE_DIR, "batches")   # 提交的 JSONL 批量文件
+LLM_BATCH_POLL_SECONDS = 60        # 轮询间隔 (秒)
+LLM_BATCH_TIMEOUT = 24 * 3600      # 超过完成窗口 (24h) 仍未完成则放弃
+LLM_BATCH_DISCOUNT = 0.5           # OpenAI Batch API 相对同步请求的价格折扣 (估算费用用；local submitter 按原价)
+
+# ========== Results Output ==========
+# 每只股票完成后追加一行 (JSONL，可 tail -f 实时读取)；运行结束时按输入顺序压缩为 RESULTS_PATH (--no-compact 跳过)
+RESULTS_JSONL_PATH = "results.jsonl"
+RESULTS_PATH = "results.json"
+
+# ========== Telemetry ==========
+# 每次运行的 LLM / 搜索调用明细与汇总 (JSON)
+TELEMETRY_PATH = "telemetry.json"
+# LLM 价格 (美元 / 百万 token): (input, output)，用于估算费用；未列出的模型费用记为 0
+LLM_PRICING = {
+    "google/gemini-3-pro-preview": (2.00, 12.00),
+    "google/gemini-2.5-flash": (0.30, 2.50),
+    "google/gemini-2.5-flash-lite": (0.10, 0.40),
+}
+# Tavily 单次搜索费用 (美元): basic 1 credit，advanced 2 credits
+SEARCH_COST_PER_CALL = {"basic": 0.008, "advanced": 0.016}
+
+# --- Backtest: Iron Gate 历史回测 ---
+BACKTEST_BACKFILL = {"quarter": 48, "annual": 14}   # 回测所需的财报历史期数 (约 12 年)
+BACKTEST_FILING_LAG_DAYS = 45      # 缺少 filingDate 时，假定报告期结束后多少天可见
+BACKTEST_FORWARD_DAYS = 91         # 远期收益的观察窗口 (自然日)
+
+# ========== Threshold Sweep ==========
+# sweep.py 默认扫描的阈值网格 (键为 phases.screener.Thresholds 字段名)，可用 --grid 覆盖
+SWEEP_GRID = {
+    "growth_cagr": [0.10, 0.15, 0.20, 0.25],
+    "growth_quarter": [0.15, 0.20, 0.25, 0.30],
+    "decel_drop_ratio": [0.5, 0.6, 0.7, 0.8],
+    "peg_bubble": [1.5, 2.0, 2.5],
+    "gross_margin_slope_tolerance": [-0.01, -0.005, 0.0],
+}
@@ -71,6 +71,27 @@ class IntelligenceData(BaseModel):
     blue_sky: Optional[BlueSkyData] = None
     catalysts: Optional[CatalystData] = None
 
+    # 各调研主题实际送入提示词的搜索上下文 token 数
+    context_tokens: Dict[str, int] = Field(default_factory=dict)
+
+
+class KpiValue(BaseModel):
+    kpi: str
+    value: str
+
+
+class ResearchPack(BaseModel):
+    """Phase 3 research pack 模式的结构化输出 (一次 LLM 调用填充 IntelligenceData 全部字段)"""
+    kpi_values: List[KpiValue] = Field(default_factory=list)
+    management_integrity: str
+    product_moat: str
+    insider_activity: str
+    dislocation_context: str
+    rnd_effectiveness: str
+    tam_expansion: str
+    upcoming_events: List[str] = Field(default_factory=list)
+    variant_perception: str
+
 
 class TribunalDecision(BaseModel):
     decision: Decision
@@ -0,0 +1,90 @@
+"""
+分阶段并发流水线 (Staged Pipeline)
+=================================
+每个阶段有独立的工作线程池与有界输入队列:
+
+    feeder -> [iron_gate x16] -> [identifier x4] -> [intelligence x3] -> [tribunal x4] -> sink
+
+- 阶段函数返回 False 表示该条目到此结束 (如未通过 Iron Gate)，不进入后续阶段
+- 阶段函数抛出的异常只影响该条目，条目带着异常直接进入 sink
+- 队列有界: 下游阶段处理不过来时上游自动阻塞，在途条目数不随股票数增长
+- sink 在调用 run() 的线程中按完成顺序执行 (结果写入、状态保存无需加锁)；
+  条目带有输入序号，调用方可据此恢复输入顺序
+"""
+
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], bool]       # 返回 False 表示条目在此阶段结束
+    workers: int
+
+
+class StagedPipeline:
+    """
+    用法:
+        pipeline = StagedPipeline([Stage("fetch", fetch, 16), Stage("llm", judge, 4)])
+        pipeline.run(items, sink=lambda index, item, error: ...)
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int):
+        self.stages = stages
+        self.queue_size = queue_size
+
+    def run(self, items: Iterable[Any], sink: Callable[[int, Any, Optional[BaseException]], None]) -> None:
+        """
+        处理全部条目；每个条目恰好交给 sink 一次
+
+        Args:
+            sink: (输入序号, 条目, 异常或 None)，在当前线程中调用
+        """
+        items = list(items)
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        finished: queue.Queue = queue.Queue()
+
+        def worker(position: int) -> None:
+            stage = self.stages[position]
+            while True:
+                entry = queues[position].get()
+                if entry is _STOP:
+                    return
+                index, item = entry
+                try:
+                    proceed = stage.fn(item)
+                except BaseException as e:
+                    finished.put((index, item, e))
+                    continue
+                if proceed and position + 1 < len(self.stages):
+                    queues[position + 1].put(entry)
+                else:
+                    finished.put((index, item, None))
+
+        def coordinate() -> None:
+            """依次投放条目，再按阶段顺序关闭: 上游全部结束后才通知下游停止"""
+            pools = [[threading.Thread(target=worker, args=(position,), daemon=True,
+                                       name=f"pipeline-{stage.name}-{n}")
+                      for n in range(max(1, stage.workers))]
+                     for position, stage in enumerate(self.stages)]
+            for pool in pools:
+                for thread in pool:
+                    thread.start()
+            for index, item in enumerate(items):
+                queues[0].put((index, item))
+            for position, pool in enumerate(pools):
+                for _ in pool:
+                    queues[position].put(_STOP)
+                for thread in pool:
+                    thread.join()
+
+        coordinator = threading.Thread(target=coordinate, daemon=True, name="pipeline-coordinator")
+        coordinator.start()
+        for _ in range(len(items)):
+            sink(*finished.get())
+        coordinator.join()
@@ -0,0 +1,155 @@
+"""
+分析状态与输入指纹 (Incremental Re-analysis)
+===========================================
+每只股票保存一份状态: 各阶段的输入指纹、输出与执行时间。
+下次运行时，输入指纹未变 (且未超过有效期) 的阶段直接复用上次输出，不再请求 LLM / 搜索:
+
+- Iron Gate: 利润表内容 (新财报发布即变化) + 铁律阈值
+- Identifier: 公司简介 (profile description)
+- Intelligence: Identifier 输出，且结果超过 INTELLIGENCE_STALE_DAYS 天即重跑
+- Tribunal: Iron Gate / Identifier / Intelligence 输出
+
+检查点 (Checkpoint / Resume):
+每个阶段完成后立即写回状态文件，并记下本次运行 (run_id) 已执行的阶段；股票全部完成时保存最终的 CompanyData。
+中断后以相同参数 --resume 续跑: 已完成的股票直接读取结果，未完成股票中本次运行已执行的阶段
+不论指纹 / 有效期 / --full 都直接复用，从最后完成的阶段之后继续。
+"""
+
+import hashlib
+import json
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel
+
+import config
+from tools.cache import DiskCache
+from tools.telemetry import tag
+
+
+def fingerprint(*parts: Any) -> str:
+    """任意可 JSON 序列化输入的稳定哈希 (字典按键排序)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class TickerState:
+    """
+    单只股票的阶段状态
+
+    用法:
+        state = store.ticker("DDOG")
+        data.identifier = state.run("identifier", fp, IdentifierData, lambda: ident.identify(...))
+        store.save(state)
+    """
+
+    def __init__(self, ticker: str, record: Optional[Dict] = None, full: bool = False,
+                 run_id: Optional[str] = None, on_record: Optional[Callable[["TickerState"], None]] = None):
+        """
+        Args:
+            run_id: 本次运行的标识；与状态中记录的运行一致时按检查点续跑
+            on_record: 每个阶段执行完成后调用 (用于立即持久化)
+        """
+        self.ticker = ticker
+        self.phases: Dict[str, Dict] = (record or {}).get("phases", {})
+        self.inputs: Dict[str, Any] = (record or {}).get("inputs", {})
+        # full=True 时忽略已有状态 (所有阶段重跑)，但仍记录本次结果
+        self.full = full
+        self.executed: Set[str] = set()
+        self.reused: Set[str] = set()
+        self.run_id = run_id
+        self.on_record = on_record
+        checkpoint = (record or {}).get("checkpoint") or {}
+        resuming = run_id is not None and checkpoint.get("run_id") == run_id
+        # 中断的运行中已执行的阶段 (续跑时直接复用) 与已完成股票的最终结果
+        self.completed: Set[str] = set(checkpoint.get("phases", [])) if resuming else set()
+        self.result: Optional[Dict] = checkpoint.get("result") if resuming else None
+        self.resumed: Set[str] = set()
+
+    def reuse(self, phase: str, fp: str, model: Type[BaseModel],
+              max_age_days: Optional[float] = None) -> Optional[BaseModel]:
+        """
+        输入指纹一致 (且未过期) 时返回上次的输出，否则返回 None
+
+        Args:
+            phase: 阶段名
+            fp: 本次输入指纹
+            model: 输出的 pydantic 模型
+            max_age_days: 输出有效期 (天)，None 表示只看指纹
+        """
+        entry = self.phases.get(phase)
+        resuming = phase in self.completed and entry is not None
+        if not resuming:
+            if self.full or not entry or entry.get("fingerprint") != fp:
+                return None
+            if max_age_days is not None and time.time() - entry.get("updated_at", 0) > max_age_days * 86400:
+                return None
+        try:
+            output = model.model_validate(entry["output"])
+        except Exception:
+            return None
+        (self.resumed if resuming else self.reused).add(phase)
+        return output
+
+    def record(self, phase: str, fp: str, output: BaseModel) -> None:
+        self.phases[phase] = {"fingerprint": fp, "output": output.model_dump(mode="json"), "updated_at": time.time()}
+        self.executed.add(phase)
+        self.completed.add(phase)
+        if self.on_record:
+            self.on_record(self)
+
+    def finish(self, result: Dict) -> None:
+        """记录该股票本次运行的最终结果 (续跑时不再分析)"""
+        self.result = result
+
+    def run(self, phase: str, fp: str, model: Type[BaseModel], compute: Callable[[], BaseModel],
+            max_age_days: Optional[float] = None) -> BaseModel:
+        """输入未变化时复用上次输出，否则执行 compute 并记录结果"""
+        output = self.reuse(phase, fp, model, max_age_days)
+        if output is None:
+            # compute 内的 LLM / 搜索调用记入该股票与阶段
+            with tag(ticker=self.ticker, phase=phase):
+                output = compute()
+            self.record(phase, fp, output)
+        return output
+
+    def to_dict(self) -> Dict:
+        record = {"ticker": self.ticker, "inputs": self.inputs, "phases": self.phases}
+        if self.run_id is not None:
+            record["checkpoint"] = {"run_id": self.run_id, "phases": sorted(self.completed), "result": self.result}
+        return record
+
+
+class PhaseStateStore:
+    """按股票持久化阶段状态 (JSON，每只股票一个文件；每个阶段完成后立即写入)"""
+
+    def __init__(self, root: Optional[str] = None, full: bool = False):
+        self.cache = DiskCache(root or config.STATE_DIR)
+        self.full = full
+        self.run_id: Optional[str] = None
+
+    def begin_run(self, key: str, resume: bool = False) -> Tuple[str, bool]:
+        """
+        开始一次运行
+
+        Args:
+            key: 运行参数的指纹 (股票列表与影响结果的选项)
+            resume: 上次运行的参数指纹相同时沿用其 run_id，按检查点续跑
+
+        Returns:
+            (run_id, 是否续跑)
+        """
+        last = self.cache.get("run:latest") or {}
+        if resume and last.get("key") == key:
+            self.run_id = last["run_id"]
+            return self.run_id, True
+        self.run_id = fingerprint(key, time.time())
+        self.cache.set("run:latest", {"key": key, "run_id": self.run_id, "started_at": time.time()})
+        return self.run_id, False
+
+    def ticker(self, ticker: str) -> TickerState:
+        return TickerState(ticker, self.cache.get(f"state:{ticker}"), full=self.full, run_id=self.run_id,
+                           on_record=self.save)
+
+    def save(self, state: TickerState) -> None:
+        self.cache.set(f"state:{state.ticker}", state.to_dict())
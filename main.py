@@ -1,23 +1,39 @@
 import argparse
+import asyncio
 import json
 from datetime import datetime
 from typing import List
 
-from phases.iron_gate import IronGate
+from phases.iron_gate import IronGate, stage_stats
 from phases.identifier import Identifier
 from phases.intelligence import Intelligence
 from phases.tribunal import Tribunal
+from phases.screener import IronGateScreener, UniversePanel
 
-from tools.fmp import FMPClient
+from tools.batch import LLMDeferredError, make_submitter, run_deferred
+from tools.fmp import FMPClient, FMPUnavailableError
 from tools.llm import LLMClient
+from tools.llm_cache import LLMReplayMissError
 from tools.search import SearchClient
-from core.data_models import CompanyData, AnalysisReport
+from tools.results import ResultsWriter, compact
+from tools.search_executor import search_trace
+from tools.statement_store import StatementStore
+from tools.telemetry import tag, telemetry
+from tools.translation import ReportTranslator
+from core.data_models import (CompanyData, AnalysisReport, IronGateMetrics, IdentifierData, IntelligenceData,
+                              TribunalDecision)
+from core.pipeline import Stage, StagedPipeline
+from core.state import PhaseStateStore, TickerState, fingerprint
+import config
 
 
 def translate_report(llm: LLMClient, report_content: str) -> str:
     """
     使用 AI 将英文报告翻译为中文，保持原有的 Markdown 结构
 
+    按章节并发翻译：模板文字查双语对照表，只有含自由文本的章节调用 LLM，
+    且译文按章节内容缓存 (内容未变的章节不再请求)。
+
     Args:
         llm: LLM 客户端
         report_content: 英文报告内容
@@ -25,36 +41,48 @@ def translate_report(llm: LLMClient, report_content: str) -> str:
     Returns:
         中文报告内容
     """
-    prompt = f"""
-请将以下投资分析报告翻译成中文。要求：
-1. 保持原有的 Markdown 格式结构（标题、列表、分隔线等）
-2. 专业术语翻译准确（如 CAGR=复合年均增长率，PEG=市盈率相对盈利增长比率）
-3. 数字、股票代码、日期保持原样
-4. 翻译要流畅专业，符合金融分析报告的语言风格
+    return ReportTranslator(llm).translate(report_content)
 
-原文：
-{report_content}
 
-请直接输出翻译后的中文报告，不要添加任何解释说明：
-"""
+class TickerJob:
+    """一只股票的分析上下文 (在各阶段之间传递)"""
 
-    system_prompt = "你是一位专业的金融翻译，擅长将英文投资研报翻译成地道的中文。"
+    def __init__(self, ticker: str, state: TickerState = None):
+        self.ticker = ticker
+        self.data = CompanyData(ticker=ticker)
+        # 未提供状态时每个阶段都执行 (不复用任何历史结果)
+        self.state = state or TickerState(ticker, full=True)
+        self.snapshot = None
 
-    translated = llm.analyze_text(prompt, system_prompt)
-    return translated.strip()
+    def report_reuse(self, phase: str) -> None:
+        if phase in self.state.resumed:
+            print(f"[{self.ticker}] {phase}: completed before interruption, resuming")
+        elif phase in self.state.reused:
+            print(f"[{self.ticker}] {phase}: inputs unchanged, reusing previous result")
 
 
-def analyze_ticker(ticker: str, fmp: FMPClient, llm: LLMClient, search: SearchClient,
-                   force_deep_dive: bool = False) -> CompanyData:
-    print(f"\n--- Analyzing {ticker} ---")
-    data = CompanyData(ticker=ticker)
+def run_iron_gate(job: TickerJob, fmp: FMPClient, store: StatementStore = None, async_fetch: bool = False,
+                  force_deep_dive: bool = False) -> bool:
+    """Phase 1 (利润表未变化 = 没有新财报，直接复用上次结果)；返回是否进入后续阶段"""
+    ticker, data, state = job.ticker, job.data, job.state
+    # 同一 ticker 的所有 FMP 读取共享一个 snapshot，重复端点只请求一次
+    job.snapshot = snapshot = fmp.snapshot(ticker)
 
-    # Phase 1: Iron Gate
     print(f"[{ticker}] Phase 1: Iron Gate...")
-    ig = IronGate(fmp)
-    data.iron_gate = ig.analyze(ticker)
-
-    quote = fmp.get_quote(ticker)
+    ig = IronGate(fmp, store=store)
+    if async_fetch:
+        # 并发拉取 Phase 1 数据 (两张利润表先并发获取，同时用于输入指纹与分析)，结果同样进入 snapshot 共享的合并缓存
+        income = asyncio.run(ig.load_income_async(ticker))
+        gate_input = ig.input_fingerprint(snapshot, income=income)
+        compute_gate = lambda: asyncio.run(ig.analyze_async(ticker, income=income))
+    else:
+        gate_input = ig.input_fingerprint(snapshot)
+        compute_gate = lambda: ig.analyze(ticker, snapshot=snapshot)
+    state.inputs['latest_filing'] = gate_input['latest_filing']
+    data.iron_gate = state.run('iron_gate', gate_input['fingerprint'], IronGateMetrics, compute_gate)
+    job.report_reuse('iron_gate')
+
+    quote = snapshot.quote
     if quote:
         data.company_name = quote.get('name')
         data.current_price = quote.get('price')
@@ -63,31 +91,89 @@ def analyze_ticker(ticker: str, fmp: FMPClient, llm: LLMClient, search: SearchCl
     if not data.iron_gate.passed:
         print(f"[{ticker}] Failed Iron Gate: {data.iron_gate.fail_reason}")
         if not force_deep_dive:
-            return data
+            return False
         print(f"[{ticker}] Proceeding despite Iron Gate failure (Force Mode).")
+    return True
+
 
-    # Phase 2: Identifier
+def run_identifier(job: TickerJob, llm: LLMClient) -> None:
+    """Phase 2 (只依赖公司简介)"""
+    ticker, data, state = job.ticker, job.data, job.state
     print(f"[{ticker}] Phase 2: Identifier...")
     ident = Identifier(llm)
     # We need a description. FMP profile has description.
-    profile = fmp.get_profile(ticker)
+    profile = job.snapshot.profile
     description = profile['description'] if profile else "Technology company"
+    state.inputs['description_hash'] = fingerprint(description)
 
-    data.identifier = ident.identify(ticker, description)
+    data.identifier = state.run('identifier', state.inputs['description_hash'], IdentifierData,
+                                lambda: ident.identify(ticker, description))
+    job.report_reuse('identifier')
     print(f"[{ticker}] Identified as {data.identifier.business_model} with KPIs: {data.identifier.specific_kpis}")
 
-    # Phase 3: Intelligence
+
+def run_intelligence(job: TickerJob, llm: LLMClient, search: SearchClient, intelligence_mode: str = None) -> None:
+    """Phase 3 (Identifier 输出变化或超过有效期时重跑)"""
+    ticker, data, state = job.ticker, job.data, job.state
     print(f"[{ticker}] Phase 3: Saturated Intelligence...")
-    intel = Intelligence(llm, search)
-    data.intelligence = intel.gather(ticker, data.identifier)
+    intel = Intelligence(llm, search, mode=intelligence_mode)
+    data.intelligence = state.run('intelligence', fingerprint(data.identifier.model_dump(mode='json'), intel.mode),
+                                  IntelligenceData, lambda: intel.gather(ticker, data.identifier),
+                                  max_age_days=config.INTELLIGENCE_STALE_DAYS)
+    job.report_reuse('intelligence')
 
-    # Phase 4: Tribunal
+
+def run_tribunal(job: TickerJob, llm: LLMClient) -> None:
+    """Phase 4 (任一上游输出变化时重跑)"""
+    ticker, data, state = job.ticker, job.data, job.state
     print(f"[{ticker}] Phase 4: The Tribunal...")
     tribunal = Tribunal(llm)
-    data.tribunal = tribunal.judge(data)
+    upstream = fingerprint(data.iron_gate.model_dump(mode='json'), data.identifier.model_dump(mode='json'),
+                           data.intelligence.model_dump(mode='json'))
+    data.tribunal = state.run('tribunal', upstream, TribunalDecision, lambda: tribunal.judge(data))
+    job.report_reuse('tribunal')
     print(f"[{ticker}] Verdict: {data.tribunal.decision} ({data.tribunal.confidence})")
 
-    return data
+
+def analyze_ticker(ticker: str, fmp: FMPClient, llm: LLMClient, search: SearchClient,
+                   force_deep_dive: bool = False, async_fetch: bool = False,
+                   store: StatementStore = None, state: TickerState = None,
+                   intelligence_mode: str = None) -> CompanyData:
+    """顺序执行四个阶段 (多股票运行由 main 中的分阶段流水线并发执行同样的阶段函数)"""
+    print(f"\n--- Analyzing {ticker} ---")
+    job = TickerJob(ticker, state)
+    if run_iron_gate(job, fmp, store=store, async_fetch=async_fetch, force_deep_dive=force_deep_dive):
+        run_identifier(job, llm)
+        run_intelligence(job, llm, search, intelligence_mode)
+        run_tribunal(job, llm)
+    return job.data
+
+
+def screen_universe(tickers: List[str], fmp: FMPClient, store: StatementStore) -> List[CompanyData]:
+    """
+    向量化 Phase 1: 一次性对整个股票池执行铁律筛选 (不进入后续 LLM 阶段)
+
+    Args:
+        tickers: 股票列表
+        fmp: FMP 客户端 (报价与 TTM 比率，预热后直接命中缓存)
+        store: 本地财报存储
+
+    Returns:
+        按 tickers 顺序排列的 CompanyData (仅包含 iron_gate 与报价信息)
+    """
+    quotes = {t: fmp.get_quote(t) for t in tickers}
+    ratios = {t: fmp.get_ratios_ttm(t) for t in tickers}
+    panel = UniversePanel.from_store(store, tickers, ratios, quotes)
+    gate_results = IronGateScreener().screen(panel)
+
+    results = []
+    for ticker in tickers:
+        quote = quotes.get(ticker) or {}
+        results.append(CompanyData(ticker=ticker, company_name=quote.get('name'), current_price=quote.get('price'),
+                                   market_cap=quote.get('marketCap'), iron_gate=gate_results[ticker]))
+    passed = sum(1 for d in results if d.iron_gate.passed)
+    print(f"Screened {len(tickers)} tickers: {passed} passed the Iron Gate.")
+    return results
 
 
 def generate_report_content(data: CompanyData) -> str:
@@ -194,7 +280,8 @@ def save_report(data: CompanyData, llm: LLMClient = None, translate: bool = Fals
     # 如果需要翻译，生成中文版
     if translate and llm:
         print(f"[{data.ticker}] Translating report to Chinese...")
-        translated_content = translate_report(llm, report_content)
+        with tag(ticker=data.ticker, phase="translation"):
+            translated_content = translate_report(llm, report_content)
 
         filename_cn = f"REPORT_{data.ticker}_{timestamp}_CN.md"
         with open(filename_cn, "w", encoding="utf-8") as f:
@@ -207,6 +294,17 @@ def main():
     parser.add_argument("--tickers", type=str, default="DUOL", help="Comma-separated list of tickers")
     parser.add_argument("--force", action="store_true", help="Force deep dive even if Iron Gate fails")
     parser.add_argument("--cn", action="store_true", default=True,  help="Generate Chinese translated report")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached FMP and search responses and refetch")
+    parser.add_argument("--async-fetch", action="store_true", help="Fetch Iron Gate data concurrently")
+    parser.add_argument("--store", action="store_true", help="Read statements from the local Parquet store (refreshed incrementally)")
+    parser.add_argument("--offline", action="store_true", help="No FMP network access: use the statement store and cached responses only")
+    parser.add_argument("--screen", action="store_true", help="Run only the vectorized Iron Gate over all tickers (uses the statement store)")
+    parser.add_argument("--full", action="store_true", help="Re-run every phase even if its inputs are unchanged since the last run")
+    parser.add_argument("--research-pack", action="store_true", help="Phase 3: fill all intelligence fields with one structured LLM call")
+    parser.add_argument("--llm-replay", action="store_true", help="Answer LLM calls only from the response cache; fail on a cache miss")
+    parser.add_argument("--batch", action="store_true", help="Submit Identifier and Tribunal requests as LLM batches (for overnight runs)")
+    parser.add_argument("--no-compact", action="store_true", help="Only stream results to the JSONL file; skip writing results.json")
+    parser.add_argument("--resume", action="store_true", help="Continue the last interrupted run with the same arguments: skip finished tickers and phases")
     args = parser.parse_args()
 
     if not args.tickers:
@@ -215,26 +313,154 @@ def main():
 
     tickers = [t.strip().upper() for t in args.tickers.split(",")]
 
-    fmp = FMPClient()
-    llm = LLMClient()
-    search = SearchClient()
-
-    results = []
-
-    for ticker in tickers:
-        try:
-            data = analyze_ticker(ticker, fmp, llm, search, force_deep_dive=args.force)
-            results.append(data.model_dump())
-            if data.tribunal:
-                save_report(data, llm=llm, translate=args.cn)
-        except Exception as e:
-            print(f"Error analyzing {ticker}: {e}")
-            import traceback
-            traceback.print_exc()
-
-    with open("results.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-    print("All analyses complete. Saved to results.json.")
+    fmp = FMPClient(refresh=args.refresh, offline=args.offline)
+    llm = LLMClient(replay=args.llm_replay, defer_routes=config.LLM_BATCH_ROUTES if args.batch else None)
+    # 批量端点不提供所需模型时在分析开始前报错，而不是每一轮都整批失败
+    submitter = make_submitter(models={llm.model_for(route) for route in llm.defer_routes}) if args.batch else None
+    search = SearchClient(refresh=args.refresh)
+
+    # 每只股票完成后立即追加一行到 results.jsonl (内存不保留结果)，结束时再按输入顺序压缩为 results.json
+    writer = ResultsWriter(config.RESULTS_JSONL_PATH)
+    # 各阶段输入指纹与输出: 输入未变化的阶段直接复用上次结果
+    phase_state = PhaseStateStore(full=args.full)
+    done = set()
+    if not args.screen:
+        # 检查点: 每个阶段完成后立即写入状态；--resume 时跳过中断的运行中已完成的股票
+        run_key = fingerprint(tickers, args.force, args.research_pack, args.full)
+        run_id, resumed = phase_state.begin_run(run_key, resume=args.resume)
+        if resumed:
+            for ticker in tickers:
+                result = phase_state.ticker(ticker).result
+                if result is not None:
+                    writer.write(result)
+                    done.add(ticker)
+            print(f"Resuming run {run_id}: {len(done)}/{len(tickers)} tickers already complete")
+        elif args.resume:
+            print("No interrupted run with the same arguments, starting a new run")
+    pending = [t for t in tickers if t not in done]
+
+    store = StatementStore() if (args.store or args.offline or args.screen) else None
+    if store and not args.offline and pending:
+        # 只拉取比本地存储更新的报告期
+        print(f"Refreshing statement store for {len(pending)} tickers...")
+        fmp.prefetch(pending, lambda snapshot: store.refresh(fmp, snapshot.ticker))
+
+    if len(pending) > 1 and not args.offline:
+        # 多股票运行: 先批量预热 Phase 1 数据，逐个分析时直接命中缓存
+        print(f"Prefetching Phase 1 data for {len(pending)} tickers...")
+        IronGate(fmp, store=store).prefetch(pending)
+
+    if args.screen:
+        for data in screen_universe(tickers, fmp, store):
+            writer.write(data.model_dump())
+    else:
+        # 批量模式下 Identifier / Tribunal 请求被推迟的股票，待批量完成后重跑 (本次已完成的阶段直接复用)
+        states = {}
+        intelligence_mode = "research_pack" if args.research_pack else None
+
+        def finish_tribunal(job: TickerJob) -> bool:
+            run_tribunal(job, llm)
+            # 裁决未重新生成时沿用上次的报告，不再重复翻译 (续跑时中断前生成的裁决可能尚未写出报告)
+            if 'tribunal' in job.state.executed | job.state.resumed:
+                save_report(job.data, llm=llm, translate=args.cn)
+            return True
+
+        # Phase 1 受 FMP 限制，可以大范围并发；只有通过的股票进入并发上限更小的 LLM / 搜索阶段
+        workers = config.PIPELINE_WORKERS
+        pipeline = StagedPipeline([
+            Stage("iron_gate", lambda job: run_iron_gate(job, fmp, store=store, async_fetch=args.async_fetch,
+                                                         force_deep_dive=args.force), workers['iron_gate']),
+            Stage("identifier", lambda job: run_identifier(job, llm) or True, workers['identifier']),
+            Stage("intelligence", lambda job: run_intelligence(job, llm, search, intelligence_mode) or True,
+                  workers['intelligence']),
+            Stage("tribunal", finish_tribunal, workers['tribunal']),
+        ], queue_size=config.PIPELINE_QUEUE_SIZE)
+
+        def sink(index: int, job: TickerJob, error: Exception) -> None:
+            """在主线程中按完成顺序收尾: 保存状态、记录结果或错误 (单只股票的错误不影响其他股票)"""
+            ticker = job.ticker
+            try:
+                if isinstance(error, LLMDeferredError):
+                    # 已完成的阶段先持久化，批量结果写入 LLM 缓存后再继续
+                    phase_state.save(job.state)
+                    deferred.append(ticker)
+                    return
+                if isinstance(error, FMPUnavailableError):
+                    # 限流 / 服务端故障: 记录为错误而不是"数据不足"，便于之后重跑
+                    print(f"[{ticker}] FMP unavailable, skipped: {error}")
+                    writer.write(CompanyData(ticker=ticker, error=f"FMP unavailable: {error}").model_dump())
+                elif isinstance(error, LLMReplayMissError):
+                    print(f"[{ticker}] LLM replay miss, skipped: {error}")
+                    writer.write(CompanyData(ticker=ticker, error=f"LLM replay miss: {error}").model_dump())
+                elif error is not None:
+                    print(f"Error analyzing {ticker}: {error}")
+                    import traceback
+                    traceback.print_exception(type(error), error, error.__traceback__)
+                else:
+                    result = job.data.model_dump()
+                    # 先写结果再标记完成: 两者之间中断时续跑会重新分析，JSONL 中以最后一行为准
+                    writer.write(result)
+                    job.state.finish(result)
+                    phase_state.save(job.state)
+                # 该股票已结束，不再保留其状态
+                states.pop(ticker, None)
+            finally:
+                # 释放该 ticker 的合并结果，内存不随股票数增长
+                fmp.release(ticker)
+
+        def new_job(ticker: str) -> TickerJob:
+            if ticker in states:
+                state = states[ticker]
+                state.full = False
+            else:
+                state = states[ticker] = phase_state.ticker(ticker)
+            return TickerJob(ticker, state)
+
+        order = {ticker: i for i, ticker in enumerate(tickers)}
+        while pending:
+            deferred = []
+            pipeline.run([new_job(ticker) for ticker in pending], sink)
+            # 流水线按完成顺序交回结果；重跑顺序与输入顺序一致，保证结果确定
+            deferred.sort(key=order.get)
+
+            pending = deferred
+            if deferred:
+                print(f"\nSubmitting LLM batch for {len(deferred)} tickers...")
+                try:
+                    counts = run_deferred(llm, submitter)
+                    print(f"Batch finished: {counts['completed']}/{counts['submitted']} completed, "
+                          f"{counts['failed']} failed (failed requests run synchronously)")
+                except Exception as e:
+                    # 批量提交失败: 剩余请求改为同步执行
+                    print(f"Batch failed ({e}), continuing synchronously")
+                    llm.defer_routes.clear()
+
+    writer.close()
+    if args.no_compact:
+        print(f"All analyses complete. Streamed {writer.written} results to {config.RESULTS_JSONL_PATH}.")
+    else:
+        count = compact(config.RESULTS_JSONL_PATH, config.RESULTS_PATH, order=tickers)
+        print(f"All analyses complete. Saved {count} results to {config.RESULTS_PATH} "
+              f"(streamed to {config.RESULTS_JSONL_PATH}).")
+    stats = fmp.cache_stats()
+    print(f"FMP cache: {stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced")
+    search_stats = search.cache_stats()
+    print(f"Search cache: {search_stats['hits']} hits, {search_stats['misses']} misses")
+    index_stats = search.index.stats()
+    print(f"Document index: {index_stats['hits']} topics answered locally, {index_stats['misses']} searched")
+    depth = search_trace.summary()
+    if depth['searches']:
+        escalations = ", ".join(f"{reason} {count}" for reason, count in depth['escalations'].items()) or "none"
+        print(f"Search depth: {dict(depth['searches'])} (escalations: {escalations}), seconds {depth['seconds']}")
+    llm_stats = llm.cache.stats()
+    print(f"LLM cache: {llm_stats['hits']} hits, {llm_stats['misses']} misses")
+    usage = llm.usage_stats()
+    print(f"LLM usage: {usage['calls']} calls, {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens")
+    for name, counts in stage_stats.summary().items():
+        print(f"Iron Gate lazy fetch [{name}]: {counts['requested']} requested, {counts['saved']} saved")
+    # 按阶段 / 用途汇总的耗时、token 与估算费用 (明细见 telemetry.json)
+    telemetry.print_summary()
+    print(f"Call telemetry saved to {telemetry.save(extra={'search_trace': search_trace.to_list()})}")
 
 
 if __name__ == "__main__":
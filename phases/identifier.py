@@ -31,7 +31,7 @@ class Identifier:
 
         system_prompt = "You are a senior equity research analyst specializing in growth stocks."
 
-        result = self.llm.extract_structured_data(prompt, IdentifierData, system_prompt)
+        result = self.llm.extract_structured_data(prompt, IdentifierData, system_prompt, route="identifier")
 
         if not result:
             # Fallback
@@ -1,25 +1,141 @@
 from tools.llm import LLMClient
 from tools.search import SearchClient
-from core.data_models import IntelligenceData, IdentifierData, BlueSkyData, CatalystData
-from typing import Dict, Any, List
+from tools.search_executor import SearchExecutor
+from tools.context import ContextBuilder
+from tools.telemetry import bind, tag, telemetry
+from core.data_models import IntelligenceData, IdentifierData, BlueSkyData, CatalystData, ResearchPack
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import time
+import config
+
+# 各调研主题的搜索语句 (逐项提示与 research pack 两种模式共用)
+SEARCH_QUERIES = {
+    'kpi': "{ticker} {kpi} latest quarter 2024 2025 financial results",
+    'management': "{ticker} management guidance track record beat miss history",
+    'moat': "{ticker} competitive advantage moat analysis new products",
+    'insider': "{ticker} insider trading recent selling buying",
+    'dislocation': "{ticker} stock price drop reason recent news",
+    'blue_sky': "{ticker} R&D investment areas new product expansion TAM analysis",
+    'events': "{ticker} upcoming earnings date investor day product launch 2025",
+    'variant': "{ticker} wall street consensus vs reality KPI tracking",
+}
+
+RESEARCH_PACK_SYSTEM_PROMPT = ("You are a senior equity research analyst. Extract financial data precisely "
+                               "and summarize soft factors concisely, using only the provided search results.")
 
 
 class Intelligence:
-    def __init__(self, llm_client: LLMClient, search_client: SearchClient):
+    def __init__(self, llm_client: LLMClient, search_client: SearchClient, mode: Optional[str] = None):
+        """
+        Args:
+            mode: "per_prompt" (每个字段单独调用 LLM) 或 "research_pack" (一次结构化调用填充全部字段)，
+                  默认取 config.INTELLIGENCE_MODE
+        """
         self.llm = llm_client
         self.search = search_client
+        # 先 basic 后按需升级为 advanced 的搜索
+        self.executor = SearchExecutor(search_client)
+        self.mode = mode or config.INTELLIGENCE_MODE
+        self.context_builder = ContextBuilder()
+
+    def _local_documents(self, ticker: str, topic: str, query: str, max_results: int) -> Optional[List[Dict]]:
+        """本地文档索引中该股票 / 主题的新鲜文档；数量不足 SEARCH_MIN_RESULTS 时返回 None"""
+        ttl = config.SEARCH_CACHE_TTL.get(topic.split(":")[0], config.SEARCH_CACHE_DEFAULT_TTL)
+        fresh_after = max(time.time() - ttl, self.search.refresh_since or 0.0)
+        start = time.perf_counter()
+        documents = self.search.index.lookup(ticker, topic, query, limit=max_results, fresh_after=fresh_after)
+        hit = len(documents) >= config.SEARCH_MIN_RESULTS
+        self.search.index.record_lookup(hit)
+        if not hit:
+            return None
+        telemetry.record("search", "local", time.perf_counter() - start, cached=True)
+        return documents
+
+    def _search_context(self, ticker: str, topic: str, query: str, context_tokens: Dict[str, int],
+                        escalate_reason: Optional[str] = None) -> str:
+        """
+        搜索并整理为去重、按相关性排序、受 token 预算约束的上下文 (实际用量记入 context_tokens)
+
+        先查本地文档索引，覆盖不足时才调用 Tavily，取回的文档写回索引。
+
+        Args:
+            escalate_reason: 指定时跳过本地索引，直接以升级后的深度重新搜索 (如 "not_found")
+        """
+        # topic 形如 "moat" 或 "kpi:NDR"，类别决定搜索缓存的有效期
+        query_class = topic.split(":")[0]
+        results = None if escalate_reason else self._local_documents(ticker, topic, query, max_results=3)
+        if results is None:
+            if escalate_reason:
+                results = self.executor.escalate(query, max_results=3, query_class=query_class,
+                                                 reason=escalate_reason)
+            else:
+                results = self.executor.search(query, max_results=3, query_class=query_class)
+            self.search.index.add(ticker, topic, query, results)
+        context = self.context_builder.build(query, results)
+        context_tokens[topic] = context.tokens
+        return context.text
 
     def gather(self, ticker: str, identifier_data: IdentifierData) -> IntelligenceData:
+        if self.mode == "research_pack":
+            data = self._gather_research_pack(ticker, identifier_data)
+            if data is not None:
+                return data
+            print(f"[{ticker}] Research pack extraction failed, falling back to per-prompt mode")
+        return self._gather_per_prompt(ticker, identifier_data)
+
+    def _gather_per_prompt(self, ticker: str, identifier_data: IdentifierData) -> IntelligenceData:
+        """
+        逐项提示模式: 并发执行各项调研任务
+
+        各 KPI 提取、软因素 (管理层 / 护城河 / 内部人 / 价格异动)、蓝天与催化剂分析互不依赖，
+        提交到同一线程池并发执行；实际并发度由 SearchClient / LLMClient 各自的上限控制。
+        """
         data = IntelligenceData()
+        context_tokens: Dict[str, int] = {}
+
+        with ThreadPoolExecutor(max_workers=config.INTELLIGENCE_MAX_WORKERS) as pool:
+            # 1. Verify Specific KPIs
+            kpi_futures = {kpi: pool.submit(bind(self._kpi_value, purpose=f"kpi:{kpi}"), ticker, kpi, context_tokens)
+                           for kpi in identifier_data.specific_kpis}
+            # 2-5. Soft Factors & Dislocation
+            management = pool.submit(bind(self._management_integrity, purpose="management"), ticker, context_tokens)
+            moat = pool.submit(bind(self._product_moat, purpose="moat"), ticker, context_tokens)
+            insider = pool.submit(bind(self._insider_activity, purpose="insider"), ticker, context_tokens)
+            dislocation = pool.submit(bind(self._dislocation_context, purpose="dislocation"), ticker, context_tokens)
+            # 6. Blue Sky Analysis (V3.2) - R&D & TAM
+            blue_sky = pool.submit(bind(self._analyze_blue_sky, purpose="blue_sky"), ticker, context_tokens)
+            # 7. Catalyst Analysis (V3.2) - Events & Variant Perception
+            upcoming_events = pool.submit(bind(self._upcoming_events, purpose="events"), ticker, context_tokens)
+            variant_perception = pool.submit(bind(self._variant_perception, purpose="variant"), ticker, context_tokens)
 
-        # 1. Verify Specific KPIs
-        kpi_values = {}
-        for kpi in identifier_data.specific_kpis:
-            query = f"{ticker} {kpi} latest quarter 2024 2025 financial results"
-            search_results = self.search.search(query, max_results=3)
-            context = "\n".join([r['content'] for r in search_results if r and 'content' in r])
+            # 按提交顺序组装结果 (kpi_values 保持 Identifier 给出的 KPI 顺序)
+            data.kpi_values = {kpi: future.result() for kpi, future in kpi_futures.items()}
+            data.management_integrity = management.result()
+            data.product_moat = moat.result()
+            data.insider_activity = insider.result()
+            data.dislocation_context = dislocation.result()
+            data.blue_sky = blue_sky.result()
+            data.catalysts = CatalystData(upcoming_events=upcoming_events.result(),
+                                          variant_perception=variant_perception.result())
 
-            prompt = f"""
+        data.context_tokens = dict(sorted(context_tokens.items()))
+
+        return data
+
+    def _kpi_value(self, ticker: str, kpi: str, context_tokens: Dict[str, int]) -> str:
+        query = SEARCH_QUERIES['kpi'].format(ticker=ticker, kpi=kpi)
+        context = self._search_context(ticker, f"kpi:{kpi}", query, context_tokens)
+        val = self._extract_kpi(ticker, kpi, context)
+        # 当前深度的结果中找不到该 KPI: 升级搜索深度后再提取一次
+        if val.lower().startswith("not found") and self.executor.can_escalate(query):
+            context = self._search_context(ticker, f"kpi:{kpi}", query, context_tokens,
+                                           escalate_reason="not_found")
+            val = self._extract_kpi(ticker, kpi, context)
+        return val
+
+    def _extract_kpi(self, ticker: str, kpi: str, context: str) -> str:
+        prompt = f"""
             Based on the search results below, extract the latest value for the KPI: {kpi} for {ticker}.
             If found, provide the value and a brief context (e.g., "120% (Q3 2024)").
             If not found, return "Not Found".
@@ -27,15 +143,12 @@ class Intelligence:
             Search Results:
             {context}
             """
-            val = self.llm.analyze_text(prompt, system_prompt="Extract financial data precisely.")
-            kpi_values[kpi] = val.strip()
-
-        data.kpi_values = kpi_values
+        val = self.llm.analyze_text(prompt, system_prompt="Extract financial data precisely.", route="kpi_extraction")
+        return val.strip()
 
-        # 2. Soft Factors - Management Integrity
-        query_mgmt = f"{ticker} management guidance track record beat miss history"
-        res_mgmt = self.search.search(query_mgmt, max_results=3)
-        context_mgmt = "\n".join([r['content'] for r in res_mgmt])
+    def _management_integrity(self, ticker: str, context_tokens: Dict[str, int]) -> str:
+        query = SEARCH_QUERIES['management'].format(ticker=ticker)
+        context_mgmt = self._search_context(ticker, 'management', query, context_tokens)
 
         prompt_mgmt = f"""
         Analyze the management integrity of {ticker} based on:
@@ -44,12 +157,11 @@ class Intelligence:
         Do they have a history of over-promising and under-delivering? Or are they conservative ("sandbaggers")?
         Summarize in 2-3 sentences.
         """
-        data.management_integrity = self.llm.analyze_text(prompt_mgmt).strip()
+        return self.llm.analyze_text(prompt_mgmt, route="soft_factor").strip()
 
-        # 3. Soft Factors - Moat/Competition
-        query_moat = f"{ticker} competitive advantage moat analysis new products"
-        res_moat = self.search.search(query_moat, max_results=3)
-        context_moat = "\n".join([r['content'] for r in res_moat])
+    def _product_moat(self, ticker: str, context_tokens: Dict[str, int]) -> str:
+        query = SEARCH_QUERIES['moat'].format(ticker=ticker)
+        context_moat = self._search_context(ticker, 'moat', query, context_tokens)
 
         prompt_moat = f"""
         Analyze the competitive moat of {ticker} based on:
@@ -58,12 +170,11 @@ class Intelligence:
         Is their moat widening or narrowing? Any new products driving growth?
         Summarize in 2-3 sentences.
         """
-        data.product_moat = self.llm.analyze_text(prompt_moat).strip()
+        return self.llm.analyze_text(prompt_moat, route="soft_factor").strip()
 
-        # 4. Insider Activity
-        query_insider = f"{ticker} insider trading recent selling buying"
-        res_insider = self.search.search(query_insider, max_results=3)
-        context_insider = "\n".join([r['content'] for r in res_insider])
+    def _insider_activity(self, ticker: str, context_tokens: Dict[str, int]) -> str:
+        query = SEARCH_QUERIES['insider'].format(ticker=ticker)
+        context_insider = self._search_context(ticker, 'insider', query, context_tokens)
 
         prompt_insider = f"""
         Analyze insider activity for {ticker} based on:
@@ -72,12 +183,11 @@ class Intelligence:
         Are insiders buying or selling significantly? Is it routine selling or alarming?
         Summarize in 2-3 sentences.
         """
-        data.insider_activity = self.llm.analyze_text(prompt_insider).strip()
+        return self.llm.analyze_text(prompt_insider, route="soft_factor").strip()
 
-        # 5. Dislocation / Price Action Context
-        query_drop = f"{ticker} stock price drop reason recent news"
-        res_drop = self.search.search(query_drop, max_results=3)
-        context_drop = "\n".join([r['content'] for r in res_drop])
+    def _dislocation_context(self, ticker: str, context_tokens: Dict[str, int]) -> str:
+        query = SEARCH_QUERIES['dislocation'].format(ticker=ticker)
+        context_drop = self._search_context(ticker, 'dislocation', query, context_tokens)
 
         prompt_drop = f"""
         Analyze the recent price action of {ticker} based on:
@@ -85,23 +195,14 @@ class Intelligence:
 
         If the stock is down, is it due to macro factors/sector rotation (True Discount) or broken fundamentals/competitor threat (Fake Discount)?
         """
-        data.dislocation_context = self.llm.analyze_text(prompt_drop).strip()
+        return self.llm.analyze_text(prompt_drop, route="soft_factor").strip()
 
-        # 6. Blue Sky Analysis (V3.2) - R&D & TAM
-        data.blue_sky = self._analyze_blue_sky(ticker)
-
-        # 7. Catalyst Analysis (V3.2) - Events & Variant Perception
-        data.catalysts = self._analyze_catalysts(ticker)
-
-        return data
-
-    def _analyze_blue_sky(self, ticker: str) -> BlueSkyData:
+    def _analyze_blue_sky(self, ticker: str, context_tokens: Dict[str, int]) -> BlueSkyData:
         blue_sky = BlueSkyData()
         
         # Search for R&D and TAM info
-        query = f"{ticker} R&D investment areas new product expansion TAM analysis"
-        results = self.search.search(query, max_results=3)
-        context = "\n".join([r['content'] for r in results])
+        query = SEARCH_QUERIES['blue_sky'].format(ticker=ticker)
+        context = self._search_context(ticker, 'blue_sky', query, context_tokens)
         
         # Analyze R&D Effectiveness (Second Curve)
         prompt_rnd = f"""
@@ -111,7 +212,7 @@ class Intelligence:
         Are they investing in "Offensive R&D" (new markets/products like AWS for Amazon) or just maintenance?
         Do they have a clear "Second Growth Curve"?
         """
-        blue_sky.rnd_effectiveness = self.llm.analyze_text(prompt_rnd).strip()
+        blue_sky.rnd_effectiveness = self.llm.analyze_text(prompt_rnd, route="soft_factor").strip()
         
         # Analyze TAM Expansion
         prompt_tam = f"""
@@ -121,17 +222,14 @@ class Intelligence:
         Does the management have a history of successfully crossing into new industries (TAM Expansion)?
         Is the TAM static or dynamic?
         """
-        blue_sky.tam_expansion = self.llm.analyze_text(prompt_tam).strip()
+        blue_sky.tam_expansion = self.llm.analyze_text(prompt_tam, route="soft_factor").strip()
         
         return blue_sky
 
-    def _analyze_catalysts(self, ticker: str) -> CatalystData:
-        catalyst = CatalystData()
-        
+    def _upcoming_events(self, ticker: str, context_tokens: Dict[str, int]) -> List[str]:
         # Search for upcoming events
-        query_events = f"{ticker} upcoming earnings date investor day product launch 2025"
-        results = self.search.search(query_events, max_results=3)
-        context = "\n".join([r['content'] for r in results])
+        query = SEARCH_QUERIES['events'].format(ticker=ticker)
+        context = self._search_context(ticker, 'events', query, context_tokens)
         
         prompt_events = f"""
         List upcoming major events for {ticker} in the next 3-9 months based on:
@@ -140,14 +238,14 @@ class Intelligence:
         Focus on: Earnings, Investor Days, Product Launches.
         Return a list of strings, e.g. ["Earnings: Aug 25", "Investor Day: Oct 10"].
         """
-        events_text = self.llm.analyze_text(prompt_events, system_prompt="List specific events.")
+        events_text = self.llm.analyze_text(prompt_events, system_prompt="List specific events.", route="event_list")
         # Simple split by newline for list, cleaning up
-        catalyst.upcoming_events = [line.strip('- *') for line in events_text.split('\n') if line.strip()]
-        
+        return [line.strip('- *') for line in events_text.split('\n') if line.strip()]
+
+    def _variant_perception(self, ticker: str, context_tokens: Dict[str, int]) -> str:
         # Analyze Variant Perception
-        query_var = f"{ticker} wall street consensus vs reality KPI tracking"
-        results_var = self.search.search(query_var, max_results=3)
-        context_var = "\n".join([r['content'] for r in results_var])
+        query = SEARCH_QUERIES['variant'].format(ticker=ticker)
+        context_var = self._search_context(ticker, 'variant', query, context_tokens)
         
         prompt_var = f"""
         Identify any "Variant Perception" for {ticker}.
@@ -155,6 +253,65 @@ class Intelligence:
         
         Is there a gap between Wall Street consensus and alternative data/reality?
         """
-        catalyst.variant_perception = self.llm.analyze_text(prompt_var).strip()
-        
-        return catalyst
+        return self.llm.analyze_text(prompt_var, route="soft_factor").strip()
+
+    def _gather_research_pack(self, ticker: str, identifier_data: IdentifierData) -> Optional[IntelligenceData]:
+        """
+        research pack 模式: 并发完成全部搜索后，一次 extract_structured_data 调用填充所有字段
+
+        与逐项提示相比只有一次 LLM 往返，指令部分也只发送一次。
+
+        Returns:
+            IntelligenceData；结构化提取失败时返回 None
+        """
+        kpis = identifier_data.specific_kpis
+        queries = {f"kpi:{kpi}": SEARCH_QUERIES['kpi'].format(ticker=ticker, kpi=kpi) for kpi in kpis}
+        for topic in ('management', 'moat', 'insider', 'dislocation', 'blue_sky', 'events', 'variant'):
+            queries[topic] = SEARCH_QUERIES[topic].format(ticker=ticker)
+
+        context_tokens: Dict[str, int] = {}
+        with ThreadPoolExecutor(max_workers=config.INTELLIGENCE_MAX_WORKERS) as pool:
+            futures = {topic: pool.submit(bind(self._search_context, purpose=topic), ticker, topic, query,
+                                          context_tokens)
+                       for topic, query in queries.items()}
+            contexts = {topic: future.result() for topic, future in futures.items()}
+
+        sections = "\n\n".join(f"### {topic}\n{context}" for topic, context in contexts.items())
+        prompt = f"""
+        Build a research pack for {ticker} based only on the search results below.
+
+        KPIs to extract: {", ".join(kpis)}
+        For each KPI give the latest value and a brief context (e.g., "120% (Q3 2024)"), or "Not Found".
+
+        Fields:
+        - management_integrity: Do they have a history of over-promising and under-delivering? Or are they conservative ("sandbaggers")? 2-3 sentences.
+        - product_moat: Is their moat widening or narrowing? Any new products driving growth? 2-3 sentences.
+        - insider_activity: Are insiders buying or selling significantly? Is it routine selling or alarming? 2-3 sentences.
+        - dislocation_context: If the stock is down, is it due to macro factors/sector rotation (True Discount) or broken fundamentals/competitor threat (Fake Discount)?
+        - rnd_effectiveness: Are they investing in "Offensive R&D" (new markets/products) or just maintenance? Do they have a clear "Second Growth Curve"?
+        - tam_expansion: Does management have a history of crossing into new industries (TAM Expansion)? Is the TAM static or dynamic?
+        - upcoming_events: Major events in the next 3-9 months (Earnings, Investor Days, Product Launches), e.g. "Earnings: Aug 25".
+        - variant_perception: Is there a gap between Wall Street consensus and alternative data/reality?
+
+        Search Results:
+        {sections}
+        """
+        with tag(purpose="research_pack"):
+            pack = self.llm.extract_structured_data(prompt, ResearchPack, RESEARCH_PACK_SYSTEM_PROMPT,
+                                                   route="research_pack")
+        if not pack:
+            return None
+
+        values = {item.kpi: item.value.strip() for item in pack.kpi_values}
+        return IntelligenceData(
+            kpi_values={kpi: values.get(kpi, "Not Found") for kpi in kpis},
+            management_integrity=pack.management_integrity.strip(),
+            product_moat=pack.product_moat.strip(),
+            insider_activity=pack.insider_activity.strip(),
+            dislocation_context=pack.dislocation_context.strip(),
+            blue_sky=BlueSkyData(rnd_effectiveness=pack.rnd_effectiveness.strip(),
+                                 tam_expansion=pack.tam_expansion.strip()),
+            catalysts=CatalystData(upcoming_events=[e.strip() for e in pack.upcoming_events if e.strip()],
+                                   variant_perception=pack.variant_perception.strip()),
+            context_tokens=dict(sorted(context_tokens.items())),
+        )
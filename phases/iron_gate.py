@@ -9,13 +9,77 @@ Phase 1: The Iron Gate (铁律筛选)
 3. 盈利路径二分法 - 盈利公司看 PEG，未盈利公司看毛利斜率和运营杠杆
 """
 
+import asyncio
+import inspect
+import math
+import threading
+from collections import Counter
 import numpy as np
-from typing import List
-from tools.fmp import FMPClient
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from tools.fmp import AsyncFMPClient, FMPClient, FinancialSnapshot
+from tools.statement_store import StatementStore
 from core.data_models import IronGateMetrics
+from core.state import fingerprint
 import config
 
 
+def _quarterly_limit() -> int:
+    """季度利润表需要拉取的季度数 (同时满足同比、减速预警与毛利斜率)"""
+    return max(config.QUARTERS_FOR_DECEL_CHECK, config.QUARTERS_FOR_YOY, config.QUARTERS_FOR_MARGIN_SLOPE)
+
+
+def _resolve(value: Any) -> Any:
+    """数据本身直接返回；无参加载函数则调用后返回"""
+    return value() if callable(value) else value
+
+
+async def _as_awaitable(value: Any) -> Any:
+    return await value if inspect.isawaitable(value) else value
+
+
+class _LazyFetch:
+    """只在第一次调用时才执行的数据加载，并记录是否真正发出过请求"""
+
+    def __init__(self, loader: Callable[[], Any]):
+        self._loader = loader
+        self.loaded = False
+        self._value = None
+
+    def __call__(self) -> Any:
+        if not self.loaded:
+            self._value = self._loader()
+            self.loaded = True
+        return self._value
+
+
+class StageFetchStats:
+    """
+    惰性请求统计: 记录每类数据在多少次分析中被请求、被省去
+
+    只统计经 FMPClient 发出的请求；--store 模式下现金流量表从本地存储读取，不计入。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.analyzed = Counter()
+        self.requested = Counter()
+
+    def record(self, loaded: Dict[str, bool]) -> None:
+        with self._lock:
+            for name, was_loaded in loaded.items():
+                self.analyzed[name] += 1
+                self.requested[name] += int(was_loaded)
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {name: {"requested": count, "saved": self.analyzed[name] - count}
+                    for name, count in self.requested.items()}
+
+
+# 进程内共享的统计 (main 在运行结束时输出)
+stage_stats = StageFetchStats()
+
+
 class IronGate:
     """
     铁律筛选器：MGP 策略的第一道关卡
@@ -26,8 +90,10 @@ class IronGate:
     - 根据阈值判断是否通过筛选
     """
 
-    def __init__(self, fmp_client: FMPClient):
+    def __init__(self, fmp_client: FMPClient, store: Optional[StatementStore] = None):
         self.fmp = fmp_client
+        # 提供本地财报存储时，财报从存储读取 (无需网络)，仅 TTM 比率与报价走 FMP
+        self.store = store
 
     def _calculate_cagr(self, start_value: float, end_value: float, years: int) -> float:
         """
@@ -71,7 +137,80 @@ class IronGate:
         slope, _ = np.polyfit(x, y, 1)
         return slope
 
-    def analyze(self, ticker: str) -> IronGateMetrics:
+    def _load_income(self, snapshot: FinancialSnapshot):
+        """
+        获取增长检验所需的利润表
+
+        Returns:
+            (年度利润表, 季度利润表)，均按时间从新到旧排列
+        """
+        if self.store:
+            return (self.store.income_statement(snapshot.ticker, period='annual', limit=config.CAGR_YEARS + 1),
+                    self.store.income_statement(snapshot.ticker, period='quarter', limit=_quarterly_limit()))
+
+        # 年度利润表: 用于计算 CAGR
+        income_annual = snapshot.income_statement(period='annual', limit=config.CAGR_YEARS + 1)
+        # 季度利润表: 用于计算同比增速、减速预警、毛利斜率等
+        income_quarterly = snapshot.income_statement(period='quarter', limit=_quarterly_limit())
+        return income_annual, income_quarterly
+
+    def _load_cash_flow(self, snapshot: FinancialSnapshot) -> List[Dict]:
+        """季度现金流量表: 用于计算 SBC (Dilution Shield)"""
+        if self.store:
+            return self.store.cash_flow_statement(snapshot.ticker, period='quarter', limit=4)
+        return snapshot.cash_flow_statement(period='quarter', limit=4)
+
+    def prefetch(self, tickers: List[str]) -> None:
+        """
+        多股票运行前批量预热 Phase 1 数据
+
+        报价走 batch-quote 分块批量请求；利润表没有按股票列表的批量 JSON 端点，
+        改为通过连接池并发预热到磁盘缓存。现金流量表与 TTM 比率只有通过增长检验的股票才需要，
+        由 analyze 按需惰性请求，不在此预热。
+        """
+        self.fmp.get_quotes(tickers)
+        if not self.store:
+            self.fmp.prefetch(tickers, self._load_income)
+
+    def _fmp_loads(self, cash_flow: bool, ratios_ttm: bool) -> Dict[str, bool]:
+        """stage_stats 的记录项: 使用本地财报存储时现金流量表不经过 FMP，不计入请求统计"""
+        if self.store:
+            return {'ratios_ttm': ratios_ttm}
+        return {'cash_flow': cash_flow, 'ratios_ttm': ratios_ttm}
+
+    def input_fingerprint(self, snapshot: FinancialSnapshot, income: Optional[Tuple[List[Dict], List[Dict]]] = None
+                          ) -> Dict[str, Any]:
+        """
+        Iron Gate 输入指纹: 利润表内容 + 铁律阈值 + 股价分档
+
+        新财报 (10-Q / 10-K) 发布或阈值调整时指纹变化；两次财报之间保持不变，上次结果可直接复用。
+        现金流量表与利润表随同一份财报更新，无需单独请求。
+
+        PEG 随股价变化 (peRatioTTM = 股价 / TTM EPS，TTM EPS 只随财报更新)，因此股价按
+        IRON_GATE_PRICE_BUCKET 对数分档计入指纹，跨档时重新计算。同一档内的价格波动仍复用上次的
+        估值结论，PEG 贴近淘汰线的股票可能滞后一档 (约 5%)。报价本身 run_iron_gate 随后也会读取，不额外请求。
+
+        Args:
+            income: 已获取的 (年度利润表, 季度利润表)，如 load_income_async 的结果；不传则同步获取
+
+        Returns:
+            {'fingerprint': 指纹, 'latest_filing': 最新报告期的披露日 (或报告期结束日)}
+        """
+        income_annual, income_quarterly = income or self._load_income(snapshot)
+        thresholds = {name: getattr(config, name) for name in (
+            'CAGR_YEARS', 'QUARTERS_FOR_YOY', 'QUARTERS_FOR_DECEL_CHECK', 'QUARTERS_FOR_MARGIN_SLOPE',
+            'QUARTERS_FOR_NI_SUM', 'GROWTH_THRESHOLD_CAGR', 'GROWTH_THRESHOLD_QUARTER',
+            'DECEL_PREV_GROWTH_THRESHOLD', 'DECEL_DROP_RATIO', 'MIN_NET_MARGIN_FOR_PEG',
+            'PEG_THRESHOLD_BUBBLE', 'GROSS_MARGIN_SLOPE_TOLERANCE', 'SBC_REVENUE_RATIO_MAX')}
+        latest = income_quarterly[0] if income_quarterly else {}
+        price = (snapshot.quote or {}).get('price') or 0
+        price_bucket = round(math.log(price) / math.log1p(config.IRON_GATE_PRICE_BUCKET)) if price > 0 else None
+        return {
+            'fingerprint': fingerprint(income_annual, income_quarterly, thresholds, price_bucket),
+            'latest_filing': latest.get('filingDate') or latest.get('fillingDate') or latest.get('date'),
+        }
+
+    def analyze(self, ticker: str, snapshot: Optional[FinancialSnapshot] = None) -> IronGateMetrics:
         """
         对单只股票执行铁律筛选分析
 
@@ -82,33 +221,109 @@ class IronGate:
         4. 检测增速减速预警
         5. 根据盈利状态选择不同的估值检查路径
 
+        数据按阶段惰性获取: 先只请求利润表，现金流量表与 TTM 比率在对应检查执行到时才请求。
+        大多数股票在增长检验即被淘汰，这两类请求因此被省去 (见 stage_stats)。
+        报价不计入统计: 多股票运行时已由 prefetch 批量获取，main 也会为每只股票读取报价。
+
         Args:
             ticker: 股票代码 (如 "AAPL", "SNOW")
+            snapshot: 本次运行共享的财务数据视图 (不传则新建)
 
         Returns:
             IronGateMetrics: 包含所有计算指标和通过/失败状态
         """
-        # ========== 从配置中读取参数 ==========
-        cagr_years = config.CAGR_YEARS  # CAGR 计算年限 (默认 3 年)
-        quarters_for_decel = config.QUARTERS_FOR_DECEL_CHECK  # 减速预警需要的季度数 (默认 9)
-        quarters_for_yoy = config.QUARTERS_FOR_YOY  # 同比增速需要的季度数 (默认 5)
-        quarters_for_margin = config.QUARTERS_FOR_MARGIN_SLOPE  # 毛利斜率计算季度数 (默认 6)
-        quarters_for_ni = config.QUARTERS_FOR_NI_SUM  # TTM 净利润求和季度数 (默认 4)
+        snapshot = snapshot or self.fmp.snapshot(ticker)
+        lazy = {
+            'cash_flow': _LazyFetch(lambda: self._load_cash_flow(snapshot)),
+            'ratios_ttm': _LazyFetch(lambda: snapshot.ratios_ttm),
+        }
 
-        # ========== 获取财务数据 ==========
-        # 年度利润表: 用于计算 CAGR
-        income_annual = self.fmp.get_income_statement(ticker, period='annual', limit=cagr_years + 1)
-        # 季度利润表: 用于计算同比增速、减速预警、毛利斜率等
-        income_quarterly = self.fmp.get_income_statement(ticker, period='quarter', limit=max(quarters_for_decel, quarters_for_yoy, quarters_for_margin))
-        # 季度现金流量表: 用于计算 SBC (Dilution Shield)
-        cash_flow_quarterly = self.fmp.get_cash_flow_statement(ticker, period='quarter', limit=4)
-        # TTM 估值比率: 用于获取 PE、PEG 等
-        ratios_ttm = self.fmp.get_ratios_ttm(ticker)
-        # 实时报价: 用于获取当前股价
-        quote = self.fmp.get_quote(ticker)
+        metrics = IronGateMetrics()
+        income_annual, income_quarterly = self._load_income(snapshot)
+        try:
+            if self._check_growth(metrics, income_annual, income_quarterly):
+                self._check_quality(metrics, income_quarterly, lazy['cash_flow'], lazy['ratios_ttm'],
+                                    lambda: snapshot.quote)
+        finally:
+            stage_stats.record(self._fmp_loads(cash_flow=lazy['cash_flow'].loaded,
+                                               ratios_ttm=lazy['ratios_ttm'].loaded))
+        return metrics
+
+    async def load_income_async(self, ticker: str, afmp: Optional[AsyncFMPClient] = None
+                                ) -> Tuple[List[Dict], List[Dict]]:
+        """并发获取两张利润表 (使用本地财报存储时直接读取)"""
+        if self.store:
+            return self._load_income(self.fmp.snapshot(ticker))
+        afmp = afmp or AsyncFMPClient(self.fmp)
+        income_annual, income_quarterly = await asyncio.gather(
+            afmp.get_income_statement(ticker, period='annual', limit=config.CAGR_YEARS + 1),
+            afmp.get_income_statement(ticker, period='quarter', limit=_quarterly_limit()),
+        )
+        return income_annual, income_quarterly
+
+    async def analyze_async(self, ticker: str, afmp: Optional[AsyncFMPClient] = None,
+                            income: Optional[Tuple[List[Dict], List[Dict]]] = None) -> IronGateMetrics:
+        """
+        analyze 的异步版本: 每个阶段内的请求并发执行
 
+        先并发获取两张利润表；通过增长检验后，再并发获取现金流量表、TTM 比率与报价。
+        每阶段延迟约等于最慢的单个请求，且未通过增长检验的股票不会发出第二阶段请求。
+
+        Args:
+            ticker: 股票代码
+            afmp: 异步 FMP 客户端 (不传则基于 self.fmp 新建，并发上限取 config)
+            income: 已获取的利润表 (load_income_async 的结果)，不传则在此并发获取
+        """
+        afmp = afmp or AsyncFMPClient(self.fmp)
+        snapshot = self.fmp.snapshot(ticker)
         metrics = IronGateMetrics()
 
+        income_annual, income_quarterly = income or await self.load_income_async(ticker, afmp)
+
+        if not self._check_growth(metrics, income_annual, income_quarterly):
+            stage_stats.record(self._fmp_loads(cash_flow=False, ratios_ttm=False))
+            return metrics
+
+        if self.store:
+            cash_flow_quarterly = self._load_cash_flow(snapshot)
+        else:
+            cash_flow_quarterly = afmp.get_cash_flow_statement(ticker, period='quarter', limit=4)
+        cash_flow_quarterly, ratios_ttm, quote = await asyncio.gather(
+            _as_awaitable(cash_flow_quarterly), afmp.get_ratios_ttm(ticker), afmp.get_quote(ticker))
+        stage_stats.record(self._fmp_loads(cash_flow=True, ratios_ttm=True))
+        return self._check_quality(metrics, income_quarterly, cash_flow_quarterly, ratios_ttm, quote)
+
+    def evaluate(self, income_annual: List[Dict], income_quarterly: List[Dict], cash_flow_quarterly: List[Dict],
+                 ratios_ttm: Optional[Dict], quote: Optional[Dict]) -> IronGateMetrics:
+        """
+        基于已获取的财务数据计算指标并判定是否通过 (不发起任何网络请求)
+
+        Args:
+            income_annual: 年度利润表 (从新到旧)
+            income_quarterly: 季度利润表 (从新到旧)
+            cash_flow_quarterly: 季度现金流量表 (从新到旧)
+            ratios_ttm: TTM 估值比率
+            quote: 实时报价
+
+        Returns:
+            IronGateMetrics: 包含所有计算指标和通过/失败状态
+        """
+        metrics = IronGateMetrics()
+        if self._check_growth(metrics, income_annual, income_quarterly):
+            self._check_quality(metrics, income_quarterly, cash_flow_quarterly, ratios_ttm, quote)
+        return metrics
+
+    def _check_growth(self, metrics: IronGateMetrics, income_annual: List[Dict],
+                      income_quarterly: List[Dict]) -> bool:
+        """
+        第一阶段: 只依赖利润表的增长检验 (CAGR、当季同比、减速预警所需增速)
+
+        Returns:
+            是否通过增长门槛；未通过时 metrics.fail_reason 已填写
+        """
+        quarters_for_decel = config.QUARTERS_FOR_DECEL_CHECK  # 减速预警需要的季度数 (默认 9)
+        quarters_for_yoy = config.QUARTERS_FOR_YOY  # 同比增速需要的季度数 (默认 5)
+
         # ========== 数据完整性检查 ==========
         if not income_annual or len(income_annual) < 2:
             # 数据不足时，不直接判负，而是将 CAGR 标记为 None，后续仅依赖季度增速判断
@@ -135,7 +350,7 @@ class IronGate:
         if not income_quarterly or len(income_quarterly) < quarters_for_yoy:
             metrics.passed = False
             metrics.fail_reason = f"Insufficient quarterly data (need {quarters_for_yoy})"
-            return metrics
+            return False
 
         try:
             # Q0 vs Q-4: 当前季度 vs 去年同期
@@ -162,7 +377,7 @@ class IronGate:
         except Exception as e:
             metrics.passed = False
             metrics.fail_reason = f"Data Error: {str(e)}"
-            return metrics
+            return False
 
         # ========== 阈值检查: 增长率 ==========
         # 白皮书: "如果 CAGR < 20% 且 当季增速 < 20%，直接淘汰"
@@ -186,14 +401,28 @@ class IronGate:
 
         if not passed_growth_gate:
             metrics.passed = False
-            return metrics
+            return False
+        return True
+
+    def _check_quality(self, metrics: IronGateMetrics, income_quarterly: List[Dict], cash_flow_quarterly,
+                       ratios_ttm, quote) -> IronGateMetrics:
+        """
+        第二阶段: 稀释盾、减速预警与盈利路径二分法
+
+        cash_flow_quarterly / ratios_ttm / quote 可以是数据本身，也可以是无参加载函数；
+        加载函数只在对应检查真正执行到时才调用 (惰性请求)。
+        """
+        quarters_for_yoy = config.QUARTERS_FOR_YOY  # 同比增速需要的季度数 (默认 5)
+        quarters_for_margin = config.QUARTERS_FOR_MARGIN_SLOPE  # 毛利斜率计算季度数 (默认 6)
+        quarters_for_ni = config.QUARTERS_FOR_NI_SUM  # TTM 净利润求和季度数 (默认 4)
 
         # ========== 2.5 Dilution Shield (股权稀释盾 - V3.2) ==========
         # 防止"印股票换增长"
         
-        # Check A: SBC / Revenue > 20% -> 淘汰
+        # Check A: SBC / Revenue > SBC_REVENUE_RATIO_MAX (20%) -> 淘汰
         sbc_sum = 0
         rev_sum = 0
+        cash_flow_quarterly = _resolve(cash_flow_quarterly)
         if cash_flow_quarterly and len(cash_flow_quarterly) >= 4:
              # Calculate TTM SBC
              sbc_sum = sum(q.get('stockBasedCompensation', 0) for q in cash_flow_quarterly[:4])
@@ -205,9 +434,9 @@ class IronGate:
         if rev_sum > 0:
             sbc_ratio = sbc_sum / rev_sum
             metrics.sbc_revenue_ratio = sbc_ratio
-            if sbc_ratio > 0.20:
+            if sbc_ratio > config.SBC_REVENUE_RATIO_MAX:
                 metrics.passed = False
-                metrics.fail_reason = f"Excessive SBC: {sbc_ratio:.1%} of Revenue (>20%)"
+                metrics.fail_reason = f"Excessive SBC: {sbc_ratio:.1%} of Revenue (>{config.SBC_REVENUE_RATIO_MAX:.0%})"
                 return metrics
         
         # Check B: Share Count Growth
@@ -252,6 +481,7 @@ class IronGate:
         
         is_profitable = False
         ttm_net_margin = 0.0
+        ratios_ttm = _resolve(ratios_ttm)
         
         if ratios_ttm:
             ttm_net_margin = ratios_ttm.get('netProfitMarginTTM', 0)
@@ -269,7 +499,8 @@ class IronGate:
             pe = ratios_ttm.get('peRatioTTM') if ratios_ttm else None
             if pe is None:
                 # 备用计算: PE = 股价 / TTM EPS
-                eps = sum(q['eps'] for q in income_quarterly[:quarters_for_ni])
+                eps = sum(q.get('eps') or 0 for q in income_quarterly[:quarters_for_ni])
+                quote = _resolve(quote)
                 price = quote.get('price') if quote else 0
                 if eps > 0 and price > 0:
                     pe = price / eps
@@ -299,8 +530,9 @@ class IronGate:
             # 这证明了规模效应的存在 (卖得越多，单位成本越低)
             margins = []
             for q in reversed(income_quarterly[:quarters_for_margin]):  # 从旧到新排列
-                if q['revenue'] > 0:
-                    gm = q['grossProfit'] / q['revenue']  # 毛利率 = 毛利 / 营收
+                revenue = q.get('revenue') or 0
+                if revenue > 0:
+                    gm = (q.get('grossProfit') or 0) / revenue  # 毛利率 = 毛利 / 营收
                     margins.append(gm)
 
             slope = self._calculate_slope(margins)
@@ -315,8 +547,9 @@ class IronGate:
             # --- 检查 2: 运营杠杆 (Operating Leverage) ---
             # 营收增速必须快于运营费用 (OpEx) 增速
             # 这证明公司在扩张过程中效率在提升
-            curr_opex = income_quarterly[0]['operatingExpenses']
-            old_opex = income_quarterly[quarters_for_yoy - 1]['operatingExpenses']
+            # 本地仓库 (--store / --offline) 的记录会省略缺失字段，按 0 处理
+            curr_opex = income_quarterly[0].get('operatingExpenses') or 0
+            old_opex = income_quarterly[quarters_for_yoy - 1].get('operatingExpenses') or 0
             opex_growth = (curr_opex - old_opex) / old_opex if old_opex > 0 else 0
 
             metrics.opex_growth = opex_growth
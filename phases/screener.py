@@ -0,0 +1,394 @@
+"""
+Phase 1 (批量版): 全市场向量化铁律筛选
+=====================================
+IronGate.analyze 逐只股票计算，适合深度分析流程；本模块把数千只股票的财报对齐成
+NumPy 矩阵 (每行一只股票，每列一个报告期，从新到旧，缺失为 NaN)，一次向量化计算全部指标。
+
+判定规则与 IronGate.evaluate 完全一致 (包括检查顺序与 fail_reason 文案)，
+阈值通过 Thresholds 传入，便于在同一份原始指标上反复评估。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from core.data_models import IronGateMetrics
+from phases.iron_gate import _quarterly_limit
+from tools.statement_store import StatementStore
+
+# 判定结果编码 (按 IronGate.evaluate 的检查顺序)
+PASS = 0
+INSUFFICIENT_DATA = 1
+DATA_ERROR = 2
+LOW_GROWTH_NEW_IPO = 3
+LOW_GROWTH = 4
+EXCESSIVE_SBC = 5
+DECELERATION = 6
+PEG_TOO_HIGH = 7
+GROSS_MARGIN_DECLINING = 8
+NO_OPERATING_LEVERAGE = 9
+
+STATEMENT_FIELDS = ['revenue', 'grossProfit', 'operatingExpenses', 'eps', 'weightedAverageShsOutDil',
+                    'stockBasedCompensation']
+
+
+@dataclass(frozen=True)
+class Thresholds:
+    """铁律筛选阈值 (默认取自 config)"""
+    growth_cagr: float
+    growth_quarter: float
+    decel_prev_growth: float
+    decel_drop_ratio: float
+    min_net_margin_for_peg: float
+    peg_bubble: float
+    gross_margin_slope_tolerance: float
+    sbc_ratio_max: float
+
+    @classmethod
+    def from_config(cls) -> "Thresholds":
+        return cls(
+            growth_cagr=config.GROWTH_THRESHOLD_CAGR,
+            growth_quarter=config.GROWTH_THRESHOLD_QUARTER,
+            decel_prev_growth=config.DECEL_PREV_GROWTH_THRESHOLD,
+            decel_drop_ratio=config.DECEL_DROP_RATIO,
+            min_net_margin_for_peg=config.MIN_NET_MARGIN_FOR_PEG,
+            peg_bubble=config.PEG_THRESHOLD_BUBBLE,
+            gross_margin_slope_tolerance=config.GROSS_MARGIN_SLOPE_TOLERANCE,
+            sbc_ratio_max=config.SBC_REVENUE_RATIO_MAX,
+        )
+
+
+@dataclass
+class UniversePanel:
+    """
+    对齐后的全市场输入矩阵
+
+    annual / quarterly / cash_flow 均为 {字段: (N, 期数)} 矩阵，从新到旧排列，缺失为 NaN；
+    n_* 为每只股票实际拥有的期数 (对应 IronGate 中各列表的 len)。
+    """
+    tickers: List[str]
+    annual: Dict[str, np.ndarray]
+    quarterly: Dict[str, np.ndarray]
+    cash_flow: Dict[str, np.ndarray]
+    n_annual: np.ndarray
+    n_quarterly: np.ndarray
+    n_cash_flow: np.ndarray
+    net_margin: np.ndarray       # ratios_ttm['netProfitMarginTTM']，无数据为 0
+    pe_ratio: np.ndarray         # ratios_ttm['peRatioTTM']，无数据为 NaN
+    peg_ratio: np.ndarray        # ratios_ttm['pegRatioTTM']，无数据为 NaN
+    price: np.ndarray            # quote['price']，无数据为 0
+
+    @classmethod
+    def from_records(cls, records: Dict[str, tuple]) -> "UniversePanel":
+        """
+        从 FMP 格式的数据构建
+
+        Args:
+            records: {ticker: (income_annual, income_quarterly, cash_flow_quarterly, ratios_ttm, quote)}，
+                     即 IronGate.evaluate 的入参
+        """
+        rows = []
+        ratios, quotes = {}, {}
+        for ticker, (income_annual, income_quarterly, cash_flow_quarterly, ratios_ttm, quote) in records.items():
+            for kind, statements in (('annual', income_annual), ('quarter', income_quarterly),
+                                     ('cash_flow', cash_flow_quarterly)):
+                for rank, statement in enumerate(statements or []):
+                    row = {'symbol': ticker, 'kind': kind, 'rank': rank}
+                    row.update({f: statement.get(f) for f in STATEMENT_FIELDS})
+                    rows.append(row)
+            ratios[ticker] = ratios_ttm
+            quotes[ticker] = quote
+        long_df = pd.DataFrame(rows, columns=['symbol', 'kind', 'rank'] + STATEMENT_FIELDS)
+        return cls._from_long(list(records), long_df, ratios, quotes)
+
+    @classmethod
+    def from_store(cls, store: StatementStore, tickers: List[str], ratios: Dict[str, Optional[Dict]],
+                   quotes: Dict[str, Optional[Dict]]) -> "UniversePanel":
+        """
+        从本地财报存储构建 (与 IronGate 使用 store 时读取的数据一致)
+
+        Args:
+            store: 本地财报存储
+            tickers: 股票列表 (决定矩阵行顺序)
+            ratios: {ticker: ratios_ttm}
+            quotes: {ticker: quote}
+        """
+        frames = [store.load(t) for t in tickers]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return cls._from_long(tickers, pd.DataFrame(columns=['symbol', 'kind', 'rank'] + STATEMENT_FIELDS),
+                                  ratios, quotes)
+        df = pd.concat(frames, ignore_index=True)
+        return cls.from_statement_frame(tickers, df, ratios, quotes)
+
+    @classmethod
+    def from_statement_frame(cls, tickers: List[str], df: pd.DataFrame, ratios: Dict[str, Optional[Dict]],
+                             quotes: Dict[str, Optional[Dict]]) -> "UniversePanel":
+        """
+        从 store 格式的 DataFrame (每行一个 symbol × period_type × date) 构建
+
+        回测按时点过滤同一份 DataFrame 后直接调用，无需重复读取存储。
+        """
+        income_fields = STATEMENT_FIELDS[:-1]
+        income = df[df[income_fields].notna().any(axis=1)].assign(kind=df['period_type'])
+        cash_flow = df[(df['period_type'] == 'quarter') & df['stockBasedCompensation'].notna()].assign(kind='cash_flow')
+        # 利润表行不携带 SBC (现金流单独成表)，与 store.income_statement 的输出一致
+        income = income.assign(stockBasedCompensation=np.nan)
+
+        long_df = pd.concat([income, cash_flow], ignore_index=True)
+        long_df = long_df.sort_values(['symbol', 'kind', 'date'], ascending=[True, True, False])
+        long_df['rank'] = long_df.groupby(['symbol', 'kind']).cumcount()
+        return cls._from_long(tickers, long_df, ratios, quotes)
+
+    @classmethod
+    def _from_long(cls, tickers: List[str], long_df: pd.DataFrame, ratios: Dict[str, Optional[Dict]],
+                   quotes: Dict[str, Optional[Dict]]) -> "UniversePanel":
+        widths = {'annual': config.CAGR_YEARS + 1, 'quarter': _quarterly_limit(), 'cash_flow': 4}
+        index = {t: i for i, t in enumerate(tickers)}
+        n = len(tickers)
+
+        matrices, counts = {}, {}
+        for kind, width in widths.items():
+            sub = long_df[(long_df['kind'] == kind) & (long_df['rank'] < width)]
+            sub = sub[sub['symbol'].isin(index)]
+            rows = sub['symbol'].map(index).to_numpy(dtype=int)
+            cols = sub['rank'].to_numpy(dtype=int)
+            matrices[kind] = {}
+            for f in STATEMENT_FIELDS:
+                m = np.full((n, width), np.nan)
+                m[rows, cols] = pd.to_numeric(sub[f], errors='coerce').to_numpy(dtype=float)
+                matrices[kind][f] = m
+            counts[kind] = np.bincount(rows, minlength=n)
+
+        def ratio_value(ticker: str, key: str, default: float) -> float:
+            r = ratios.get(ticker)
+            if not r:
+                return default
+            value = r.get(key, default)
+            return default if value is None else float(value)
+
+        net_margin = np.array([ratio_value(t, 'netProfitMarginTTM', 0.0) for t in tickers])
+        pe_ratio = np.array([ratio_value(t, 'peRatioTTM', np.nan) for t in tickers])
+        peg_ratio = np.array([ratio_value(t, 'pegRatioTTM', np.nan) for t in tickers])
+        price = np.array([float((quotes.get(t) or {}).get('price') or 0) for t in tickers])
+
+        return cls(tickers=list(tickers), annual=matrices['annual'], quarterly=matrices['quarter'],
+                   cash_flow=matrices['cash_flow'], n_annual=counts['annual'], n_quarterly=counts['quarter'],
+                   n_cash_flow=counts['cash_flow'], net_margin=net_margin, pe_ratio=pe_ratio,
+                   peg_ratio=peg_ratio, price=price)
+
+
+@dataclass
+class RawMetrics:
+    """与阈值无关的原始指标 (每个字段为长度 N 的数组，NaN 表示 None)"""
+    tickers: List[str]
+    insufficient: np.ndarray
+    data_error: np.ndarray
+    cagr: np.ndarray
+    growth_current_q: np.ndarray
+    growth_prev_y_q: np.ndarray
+    sbc_ratio: np.ndarray
+    share_growth: np.ndarray
+    net_margin: np.ndarray
+    peg: np.ndarray
+    margin_slope: np.ndarray
+    opex_growth: np.ndarray
+
+
+class IronGateScreener:
+    """
+    向量化铁律筛选器
+
+    用法:
+        panel = UniversePanel.from_store(store, tickers, ratios, quotes)
+        results = IronGateScreener().screen(panel)   # {ticker: IronGateMetrics}
+    """
+
+    def __init__(self, thresholds: Optional[Thresholds] = None):
+        self.thresholds = thresholds or Thresholds.from_config()
+
+    def compute_raw(self, panel: UniversePanel) -> RawMetrics:
+        quarters_for_decel = config.QUARTERS_FOR_DECEL_CHECK
+        quarters_for_yoy = config.QUARTERS_FOR_YOY
+        quarters_for_margin = config.QUARTERS_FOR_MARGIN_SLOPE
+        quarters_for_ni = config.QUARTERS_FOR_NI_SUM
+        rows = np.arange(len(panel.tickers))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # ========== 1. CAGR ==========
+            annual_rev = panel.annual['revenue']
+            has_cagr = panel.n_annual >= 2
+            latest_rev = annual_rev[:, 0]
+            old_rev = annual_rev[rows, np.maximum(panel.n_annual - 1, 0)]
+            years = np.maximum(panel.n_annual - 1, 1)
+            cagr = np.where(old_rev <= 0, 0.0, (latest_rev / old_rev) ** (1 / years) - 1)
+            cagr = np.where(has_cagr, cagr, np.nan)
+
+            # ========== 2. 当季同比增速 & 3. 减速预警 ==========
+            q_rev = panel.quarterly['revenue']
+            insufficient = panel.n_quarterly < quarters_for_yoy
+            current_rev = q_rev[:, 0]
+            prev_year_q_rev = q_rev[:, quarters_for_yoy - 1]
+            data_error = ~insufficient & (prev_year_q_rev == 0)
+            current_growth = (current_rev - prev_year_q_rev) / prev_year_q_rev
+
+            prev_prev_rev = np.where(panel.n_quarterly > quarters_for_decel - 1, q_rev[:, quarters_for_decel - 1], 0)
+            prev_prev_rev = np.nan_to_num(prev_prev_rev)
+            prev_growth = np.where(prev_prev_rev > 0, (prev_year_q_rev - prev_prev_rev) / prev_prev_rev,
+                                   current_growth)
+
+            # ========== 2.5 Dilution Shield ==========
+            sbc_sum = np.nansum(panel.cash_flow['stockBasedCompensation'][:, :4], axis=1)
+            rev_sum = np.where(panel.n_cash_flow >= 4, np.nansum(q_rev[:, :4], axis=1), 0)
+            sbc_ratio = np.where(rev_sum > 0, sbc_sum / rev_sum, np.nan)
+
+            shares = np.nan_to_num(panel.quarterly['weightedAverageShsOutDil'])
+            curr_shares = shares[:, 0]
+            old_shares = shares[:, quarters_for_yoy - 1]
+            share_growth = np.where(old_shares > 0, (curr_shares - old_shares) / old_shares, np.nan)
+
+            # ========== 4A. PEG (已盈利路径) ==========
+            eps_sum = np.nansum(panel.quarterly['eps'][:, :quarters_for_ni], axis=1)
+            fallback_pe = np.where((eps_sum > 0) & (panel.price > 0), panel.price / eps_sum, np.nan)
+            pe = np.where(np.isnan(panel.pe_ratio), fallback_pe, panel.pe_ratio)
+            growth_rate = current_growth * 100
+            pe_truthy = ~np.isnan(pe) & (pe != 0)
+            need_peg = np.isnan(panel.peg_ratio) | (panel.peg_ratio == 0)
+            peg = np.where(need_peg & pe_truthy & (growth_rate > 0), pe / growth_rate, panel.peg_ratio)
+
+            # ========== 4B. 毛利斜率 (闭式最小二乘) & 运营杠杆 (未盈利路径) ==========
+            # 取最近 quarters_for_margin 个季度，翻转为从旧到新；营收 <= 0 的季度剔除后重新编号 x
+            window_rev = q_rev[:, :quarters_for_margin][:, ::-1]
+            window_gp = np.nan_to_num(panel.quarterly['grossProfit'][:, :quarters_for_margin][:, ::-1])
+            valid = ~np.isnan(window_rev) & (window_rev > 0)
+            margins = np.where(valid, window_gp / window_rev, 0.0)
+            x = np.cumsum(valid, axis=1) - 1
+            n_points = valid.sum(axis=1)
+            x_mean = np.where(valid, x, 0).sum(axis=1) / n_points
+            y_mean = margins.sum(axis=1) / n_points
+            dx = np.where(valid, x - x_mean[:, None], 0.0)
+            dy = np.where(valid, margins - y_mean[:, None], 0.0)
+            slope = np.where(n_points >= 2, (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1), 0.0)
+
+            opex = np.nan_to_num(panel.quarterly['operatingExpenses'])
+            curr_opex = opex[:, 0]
+            old_opex = opex[:, quarters_for_yoy - 1]
+            opex_growth = np.where(old_opex > 0, (curr_opex - old_opex) / old_opex, 0.0)
+
+        return RawMetrics(
+            tickers=panel.tickers,
+            insufficient=insufficient,
+            data_error=data_error,
+            cagr=cagr,
+            growth_current_q=current_growth,
+            growth_prev_y_q=prev_growth,
+            sbc_ratio=sbc_ratio,
+            share_growth=share_growth,
+            net_margin=panel.net_margin,
+            peg=peg,
+            margin_slope=slope,
+            opex_growth=opex_growth,
+        )
+
+    def classify(self, raw: RawMetrics, thresholds: Optional[Thresholds] = None) -> np.ndarray:
+        """
+        按 IronGate.evaluate 的检查顺序判定，返回每只股票的结果编码 (PASS 或首个失败项)
+        """
+        th = thresholds or self.thresholds
+        codes = np.full(len(raw.tickers), PASS, dtype=np.int8)
+        undecided = np.ones(len(raw.tickers), dtype=bool)
+
+        def fail(condition: np.ndarray, code: int) -> None:
+            hit = undecided & condition
+            codes[hit] = code
+            undecided[hit] = False
+
+        cur = raw.growth_current_q
+        prev = raw.growth_prev_y_q
+        has_cagr = ~np.isnan(raw.cagr)
+
+        fail(raw.insufficient, INSUFFICIENT_DATA)
+        fail(raw.data_error, DATA_ERROR)
+
+        growth_ok = np.where(has_cagr, (raw.cagr >= th.growth_cagr) | (cur >= th.growth_quarter),
+                             cur >= th.growth_quarter)
+        fail(~growth_ok & ~has_cagr, LOW_GROWTH_NEW_IPO)
+        fail(~growth_ok & has_cagr, LOW_GROWTH)
+
+        fail(raw.sbc_ratio > th.sbc_ratio_max, EXCESSIVE_SBC)
+        fail((prev != 0) & (prev > th.decel_prev_growth) & (cur < prev * th.decel_drop_ratio), DECELERATION)
+
+        profitable = raw.net_margin > th.min_net_margin_for_peg
+        peg_truthy = ~np.isnan(raw.peg) & (raw.peg != 0)
+        fail(profitable & peg_truthy & (raw.peg > th.peg_bubble), PEG_TOO_HIGH)
+        fail(~profitable & (raw.margin_slope < th.gross_margin_slope_tolerance), GROSS_MARGIN_DECLINING)
+        fail(~profitable & ~(cur > raw.opex_growth), NO_OPERATING_LEVERAGE)
+        return codes
+
+    def to_metrics(self, raw: RawMetrics, codes: np.ndarray, i: int,
+                   thresholds: Optional[Thresholds] = None) -> IronGateMetrics:
+        """把第 i 只股票的向量化结果还原为 IronGateMetrics (字段与 fail_reason 与 IronGate.evaluate 一致)"""
+        th = thresholds or self.thresholds
+        code = int(codes[i])
+        metrics = IronGateMetrics()
+
+        def value(arr: np.ndarray) -> Optional[float]:
+            v = arr[i]
+            return None if np.isnan(v) else float(v)
+
+        metrics.revenue_cagr_ny = value(raw.cagr)
+        if code == INSUFFICIENT_DATA:
+            metrics.fail_reason = f"Insufficient quarterly data (need {config.QUARTERS_FOR_YOY})"
+            return metrics
+        if code == DATA_ERROR:
+            metrics.fail_reason = "Data Error: division by zero"
+            return metrics
+
+        cur = float(raw.growth_current_q[i])
+        metrics.revenue_growth_current_q = cur
+        metrics.revenue_growth_prev_y_q = float(raw.growth_prev_y_q[i])
+        if code == LOW_GROWTH_NEW_IPO:
+            metrics.fail_reason = f"Low Growth (New IPO): Q_Growth {cur:.1%} < {th.growth_quarter:.1%}"
+            return metrics
+        if code == LOW_GROWTH:
+            metrics.fail_reason = f"Low Growth: CAGR {metrics.revenue_cagr_ny:.1%}, Q_Growth {cur:.1%}"
+            return metrics
+
+        metrics.sbc_revenue_ratio = value(raw.sbc_ratio)
+        if code == EXCESSIVE_SBC:
+            metrics.fail_reason = f"Excessive SBC: {metrics.sbc_revenue_ratio:.1%} of Revenue (>{th.sbc_ratio_max:.0%})"
+            return metrics
+        metrics.share_count_growth = value(raw.share_growth)
+        metrics.dilution_shield_passed = True
+
+        if code == DECELERATION:
+            metrics.fail_reason = f"Deceleration Alarm: {metrics.revenue_growth_prev_y_q:.1%} -> {cur:.1%}"
+            return metrics
+
+        if raw.net_margin[i] > th.min_net_margin_for_peg:
+            metrics.peg_ratio = value(raw.peg)
+            if code == PEG_TOO_HIGH:
+                metrics.fail_reason = f"PEG too high: {metrics.peg_ratio:.2f} (threshold: {th.peg_bubble})"
+                return metrics
+        else:
+            metrics.gross_margin_slope = float(raw.margin_slope[i])
+            if code == GROSS_MARGIN_DECLINING:
+                metrics.fail_reason = f"Gross Margin Declining (Slope: {metrics.gross_margin_slope:.4f})"
+                return metrics
+            metrics.opex_growth = float(raw.opex_growth[i])
+            metrics.operating_leverage = bool(cur > metrics.opex_growth)
+            if code == NO_OPERATING_LEVERAGE:
+                metrics.fail_reason = f"No Operating Leverage: Rev {cur:.1%} < OpEx {metrics.opex_growth:.1%}"
+                return metrics
+
+        metrics.passed = True
+        return metrics
+
+    def screen(self, panel: UniversePanel) -> Dict[str, IronGateMetrics]:
+        """一次向量化筛选整个股票池，返回 {ticker: IronGateMetrics}"""
+        raw = self.compute_raw(panel)
+        codes = self.classify(raw)
+        return {t: self.to_metrics(raw, codes, i) for i, t in enumerate(panel.tickers)}
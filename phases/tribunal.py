@@ -90,7 +90,8 @@ class Tribunal:
         """
 
         result = self.llm.extract_structured_data(prompt, TribunalDecision,
-                                                  system_prompt="You are a VC-minded public market investor (MGP V3.2).")
+                                                  system_prompt="You are a VC-minded public market investor (MGP V3.2).",
+                                                  route="tribunal")
 
         if not result:
             # Fallback
@@ -0,0 +1,125 @@
+"""
+Phase 3 模式对比: 逐项提示 (per_prompt) vs 单次结构化调用 (research_pack)
+=====================================================================
+对同一批股票分别运行两种模式，比较:
+- LLM 调用次数与 token 用量 (每种模式使用独立的空缓存，确保都是真实请求)
+- Phase 3 耗时 (每种模式使用独立的空搜索缓存与文档索引，两种模式都发出真实搜索；
+  每只股票交替两种模式的先后顺序，避免后运行的模式受益于预热)
+- 字段一致性 (词集合 Jaccard 相似度，1.0 表示用词完全一致)
+"""
+
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List
+
+from core.data_models import IntelligenceData
+from phases.identifier import Identifier
+from phases.intelligence import Intelligence
+from tools.fmp import FMPClient
+from tools.llm import LLMClient
+from tools.llm_cache import LLMCache
+from tools.doc_index import DocumentIndex
+from tools.search import SearchClient
+
+MODES = ("per_prompt", "research_pack")
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"[a-z0-9%$.]+", (text or "").lower()))
+
+
+def similarity(a: str, b: str) -> float:
+    """两段文本的词集合 Jaccard 相似度"""
+    wa, wb = _words(a), _words(b)
+    if not wa and not wb:
+        return 1.0
+    return len(wa & wb) / len(wa | wb)
+
+
+def field_agreement(a: IntelligenceData, b: IntelligenceData) -> Dict[str, float]:
+    """逐字段比较两种模式的输出"""
+    scores = {
+        'management_integrity': similarity(a.management_integrity, b.management_integrity),
+        'product_moat': similarity(a.product_moat, b.product_moat),
+        'insider_activity': similarity(a.insider_activity, b.insider_activity),
+        'dislocation_context': similarity(a.dislocation_context, b.dislocation_context),
+        'rnd_effectiveness': similarity(a.blue_sky.rnd_effectiveness, b.blue_sky.rnd_effectiveness),
+        'tam_expansion': similarity(a.blue_sky.tam_expansion, b.blue_sky.tam_expansion),
+        'upcoming_events': similarity(" ".join(a.catalysts.upcoming_events), " ".join(b.catalysts.upcoming_events)),
+        'variant_perception': similarity(a.catalysts.variant_perception, b.catalysts.variant_perception),
+    }
+    for kpi, value in a.kpi_values.items():
+        scores[f"kpi:{kpi}"] = similarity(str(value), str(b.kpi_values.get(kpi, "")))
+    return scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Phase 3 per-prompt and research-pack modes")
+    parser.add_argument("--tickers", type=str, required=True, help="Comma-separated list of tickers")
+    parser.add_argument("--out", type=str, default="research_pack_eval.json", help="Detailed results path")
+    args = parser.parse_args()
+
+    tickers = [t.strip().upper() for t in args.tickers.split(",")]
+    fmp = FMPClient()
+    # Identifier 结果两种模式共用 (走正常缓存)
+    identifier = Identifier(LLMClient())
+
+    cache_dir = tempfile.mkdtemp(prefix="research_pack_eval_")
+    clients = {mode: LLMClient(cache=LLMCache(os.path.join(cache_dir, f"{mode}.sqlite"))) for mode in MODES}
+    # 搜索缓存与文档索引同样按模式隔离，否则后运行的模式全部命中前者的搜索结果
+    searches = {mode: SearchClient(cache_dir=os.path.join(cache_dir, f"{mode}_search"), refresh=True,
+                                   index=DocumentIndex(os.path.join(cache_dir, f"{mode}_documents.sqlite")))
+                for mode in MODES}
+
+    records: List[Dict] = []
+    seconds = {mode: 0.0 for mode in MODES}
+    for i, ticker in enumerate(tickers):
+        profile = fmp.get_profile(ticker)
+        description = profile['description'] if profile else "Technology company"
+        identifier_data = identifier.identify(ticker, description)
+
+        outputs = {}
+        record = {'ticker': ticker}
+        # 交替先后顺序，抵消 provider 侧的预热效应
+        for mode in (MODES if i % 2 == 0 else MODES[::-1]):
+            start = time.perf_counter()
+            outputs[mode] = Intelligence(clients[mode], searches[mode], mode=mode).gather(ticker, identifier_data)
+            elapsed = time.perf_counter() - start
+            seconds[mode] += elapsed
+            record[f"{mode}_seconds"] = round(elapsed, 2)
+
+        agreement = field_agreement(outputs['per_prompt'], outputs['research_pack'])
+        record['agreement'] = agreement
+        record['mean_agreement'] = sum(agreement.values()) / len(agreement)
+        records.append(record)
+        print(f"[{ticker}] per_prompt {record['per_prompt_seconds']}s, research_pack {record['research_pack_seconds']}s, "
+              f"agreement {record['mean_agreement']:.2f}")
+
+    print(f"\n{'mode':<15}{'calls':>8}{'prompt tok':>12}{'compl tok':>11}{'seconds':>10}")
+    summary = {}
+    for mode in MODES:
+        usage = clients[mode].usage_stats()
+        summary[mode] = dict(usage, seconds=round(seconds[mode], 2))
+        print(f"{mode:<15}{usage['calls']:>8}{usage['prompt_tokens']:>12}{usage['completion_tokens']:>11}"
+              f"{seconds[mode]:>10.1f}")
+
+    fields = sorted({field for r in records for field in r['agreement'] if not field.startswith("kpi:")})
+    print("\nField agreement (mean Jaccard):")
+    for field in fields:
+        scores = [r['agreement'][field] for r in records]
+        print(f"  {field:<22}{sum(scores) / len(scores):.2f}")
+    kpi_scores = [v for r in records for k, v in r['agreement'].items() if k.startswith("kpi:")]
+    if kpi_scores:
+        print(f"  {'kpi_values':<22}{sum(kpi_scores) / len(kpi_scores):.2f}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({'summary': summary, 'tickers': records}, f, indent=2, ensure_ascii=False)
+    print(f"\nDetails saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
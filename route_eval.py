@@ -0,0 +1,150 @@
+"""
+模型档位评估: 在各档位上回放已记录的 LLM 请求
+============================================
+从 LLM 响应缓存中读取已记录的请求 (调用点 route + 提示词)，在每个档位的模型上重新发送，比较:
+- 耗时与估算费用 (每个档位使用独立的空缓存，确保都是真实请求)
+- 与参考输出的一致性: 文本为词集合 Jaccard 相似度，结构化结果逐字段比较
+
+参考输出由参考档位 (--reference-tier，默认 reasoning) 对同一请求重新生成，而不是使用缓存中的原始响应:
+调用点改为较低档位后缓存里记录的就是低档位自己的输出，直接拿来当参考等于自己和自己比较。
+
+用于决定 config.LLM_ROUTES 中每个调用点应使用的档位。
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+import config
+import core.data_models as data_models
+from research_pack_eval import similarity
+from tools.llm import LLMClient
+from tools.llm_cache import LLMCache
+from tools.telemetry import llm_cost
+
+
+def agreement(kind: str, reference: str, output: str) -> float:
+    """输出与参考输出的一致性 (0-1)"""
+    if kind == "text":
+        return similarity(reference, output)
+    ref, out = json.loads(reference), json.loads(output)
+    scores = []
+    for field, value in ref.items():
+        other = out.get(field)
+        if isinstance(value, list):
+            scores.append(similarity(" ".join(map(str, value)), " ".join(map(str, other or []))))
+        elif isinstance(value, str):
+            scores.append(similarity(value, other if isinstance(other, str) else ""))
+        else:
+            scores.append(float(value == other))
+    return sum(scores) / len(scores) if scores else 1.0
+
+
+def replay(client: LLMClient, entry: Dict[str, Any]) -> str:
+    """按记录的请求重新调用；结构化结果返回 JSON，失败返回空字符串"""
+    request = entry['request']
+    if entry['kind'] == "text":
+        return client.analyze_text(request['prompt'], request['system_prompt'], route=entry['route'])
+    schema = getattr(data_models, request['schema'])
+    result = client.extract_structured_data(request['prompt'], schema, request['system_prompt'], route=entry['route'])
+    return result.model_dump_json() if result else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded LLM prompts against each model tier")
+    parser.add_argument("--routes", type=str, help="Comma-separated call sites to evaluate (default: all recorded)")
+    parser.add_argument("--tiers", type=str, default=",".join(config.LLM_MODEL_TIERS),
+                        help="Comma-separated tiers to compare")
+    parser.add_argument("--reference-tier", type=str, default="reasoning",
+                        help="Tier whose fresh replay of each prompt is the reference output")
+    parser.add_argument("--limit", type=int, default=20, help="Max recorded prompts per call site")
+    parser.add_argument("--cache", type=str, default=config.LLM_CACHE_PATH, help="LLM cache to read recorded prompts from")
+    parser.add_argument("--out", type=str, default="route_eval.json", help="Detailed results path")
+    args = parser.parse_args()
+
+    tiers = [t.strip() for t in args.tiers.split(",")]
+    routes = [r.strip() for r in args.routes.split(",")] if args.routes else None
+    if args.reference_tier not in config.LLM_MODEL_TIERS:
+        parser.error(f"Unknown reference tier: {args.reference_tier}")
+
+    # 同一请求可能被不同档位记录过多次，只回放一次 (记录时用的模型与评估无关)
+    entries: Dict[str, List[Dict]] = defaultdict(list)
+    seen = set()
+    for entry in LLMCache(args.cache).recorded(routes=routes):
+        request_key = json.dumps([entry['route'], entry['kind'], entry['request']], sort_keys=True)
+        if request_key in seen or len(entries[entry['route']]) >= args.limit:
+            continue
+        seen.add(request_key)
+        entries[entry['route']].append(entry)
+    if not entries:
+        print("No recorded prompts found (run the pipeline first so prompts are recorded in the LLM cache).")
+        return
+
+    cache_dir = tempfile.mkdtemp(prefix="route_eval_")
+    records: List[Dict] = []
+    reference_model = config.LLM_MODEL_TIERS[args.reference_tier]
+    for route, route_entries in sorted(entries.items()):
+        # 参考档位先回放，其输出作为本调用点的参考；参考档位在 tiers 中时直接复用这些调用
+        order = [args.reference_tier] + [tier for tier in tiers if tier != args.reference_tier]
+        references: Dict[str, str] = {}
+        for tier in order:
+            # 每个调用点 / 档位一个空缓存，保证都是真实请求
+            client = LLMClient(cache=LLMCache(os.path.join(cache_dir, f"{route or 'default'}_{tier}.sqlite")),
+                               routes={route: tier})
+            model = client.model_for(route)
+            for entry in route_entries:
+                before = client.usage_stats()
+                start = time.perf_counter()
+                output = replay(client, entry)
+                elapsed = time.perf_counter() - start
+                after = client.usage_stats()
+                if tier == args.reference_tier:
+                    references[entry['key']] = output
+                reference = references.get(entry['key'])
+                if tier == args.reference_tier and tier not in tiers:
+                    continue
+                prompt_tokens = after['prompt_tokens'] - before['prompt_tokens']
+                completion_tokens = after['completion_tokens'] - before['completion_tokens']
+                records.append({
+                    'route': route, 'tier': tier, 'model': model, 'key': entry['key'],
+                    'reference_model': reference_model, 'seconds': round(elapsed, 3),
+                    'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                    'cost': llm_cost(model, prompt_tokens, completion_tokens),
+                    # 参考档位本身未能生成输出时，该请求不参与一致性统计
+                    'agreement': (agreement(entry['kind'], reference, output) if output else 0.0)
+                    if reference else None,
+                    'failed': not output,
+                })
+            print(f"[{route or 'default'}] {tier}: replayed {len(route_entries)} prompts"
+                  + (" (reference)" if tier == args.reference_tier else ""))
+
+    print(f"\n{'route':<16}{'tier':<11}{'calls':>6}{'mean s':>8}{'max s':>7}{'cost $':>9}{'agree':>7}{'failed':>8}")
+    summary = []
+    groups: Dict[tuple, List[Dict]] = defaultdict(list)
+    for record in records:
+        groups[(record['route'], record['tier'])].append(record)
+    for (route, tier), group in groups.items():
+        scored = [r for r in group if r['agreement'] is not None]
+        row = {
+            'route': route, 'tier': tier, 'model': group[0]['model'], 'calls': len(group),
+            'mean_seconds': sum(r['seconds'] for r in group) / len(group),
+            'max_seconds': max(r['seconds'] for r in group),
+            'cost': sum(r['cost'] for r in group),
+            'mean_agreement': (sum(r['agreement'] for r in scored) / len(scored)) if scored else 0.0,
+            'failed': sum(r['failed'] for r in group),
+        }
+        summary.append(row)
+        print(f"{(route or 'default')[:15]:<16}{tier:<11}{row['calls']:>6}{row['mean_seconds']:>8.2f}"
+              f"{row['max_seconds']:>7.1f}{row['cost']:>9.4f}{row['mean_agreement']:>7.2f}{row['failed']:>8}")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({'summary': summary, 'calls': records}, f, indent=2, ensure_ascii=False)
+    print(f"\nDetails saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
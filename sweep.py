@@ -0,0 +1,158 @@
+"""
+Iron Gate 阈值扫描 (Threshold Sweep)
+===================================
+回答: "如果把 GROWTH_THRESHOLD_CAGR / DECEL_DROP_RATIO / PEG_THRESHOLD_BUBBLE ... 调成别的值，
+会多筛进 / 筛掉哪些股票？"
+
+- 原始指标 (CAGR、增速、SBC 占比、PEG、毛利斜率等) 与阈值无关，每只股票只计算一次
+- 网格中的每组阈值只重新执行 IronGateScreener.classify (纯向量比较，不访问网络)
+- 以 config 中的当前阈值为基准，输出每组阈值的通过数与相对基准新增 / 剔除的股票
+"""
+
+import argparse
+import dataclasses
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from phases.screener import PASS, IronGateScreener, RawMetrics, Thresholds, UniversePanel
+from tools.fmp import FMPClient
+from tools.statement_store import StatementStore
+
+
+def parse_grid(specs: List[str]) -> Dict[str, List[float]]:
+    """
+    解析命令行网格定义
+
+    Args:
+        specs: ["peg_bubble=1.5,2.0,2.5", "growth_cagr=0.1,0.15"]
+
+    Returns:
+        {Thresholds 字段名: 取值列表}
+    """
+    fields = {f.name for f in dataclasses.fields(Thresholds)}
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition("=")
+        name = name.strip()
+        if name not in fields:
+            raise ValueError(f"Unknown threshold '{name}' (expected one of: {', '.join(sorted(fields))})")
+        grid[name] = [float(v) for v in values.split(",") if v.strip()]
+    return grid
+
+
+def expand_grid(grid: Dict[str, List[float]], base: Optional[Thresholds] = None) -> List[Thresholds]:
+    """网格的笛卡尔积；未出现在网格中的阈值保持 base (默认 config) 的取值"""
+    base = base or Thresholds.from_config()
+    names = list(grid)
+    return [dataclasses.replace(base, **dict(zip(names, values)))
+            for values in itertools.product(*(grid[n] for n in names))]
+
+
+def load_raw_metrics(tickers: List[str], fmp: FMPClient, store: StatementStore) -> RawMetrics:
+    """读取财报存储与报价 / TTM 比率 (命中磁盘缓存)，计算与阈值无关的原始指标"""
+    quotes = {t: fmp.get_quote(t) for t in tickers}
+    ratios = {t: fmp.get_ratios_ttm(t) for t in tickers}
+    panel = UniversePanel.from_store(store, tickers, ratios, quotes)
+    return IronGateScreener().compute_raw(panel)
+
+
+class ThresholdSweep:
+    """
+    在同一份原始指标上评估多组阈值
+
+    用法:
+        sweep = ThresholdSweep(raw)
+        summary, membership = sweep.run(expand_grid(grid))
+        added, removed = sweep.changes(membership[i])
+    """
+
+    def __init__(self, raw: RawMetrics, baseline: Optional[Thresholds] = None):
+        self.raw = raw
+        self.screener = IronGateScreener(baseline)
+        self.tickers = np.array(raw.tickers)
+        self.baseline = self.evaluate(self.screener.thresholds)
+
+    def evaluate(self, thresholds: Thresholds) -> np.ndarray:
+        """单组阈值下每只股票是否通过 (bool 数组，顺序同 raw.tickers)"""
+        return self.screener.classify(self.raw, thresholds) == PASS
+
+    def changes(self, passed: np.ndarray) -> Tuple[List[str], List[str]]:
+        """相对基准阈值: (新增通过的股票, 不再通过的股票)"""
+        added = self.tickers[passed & ~self.baseline]
+        removed = self.tickers[~passed & self.baseline]
+        return added.tolist(), removed.tolist()
+
+    def run(self, grid: List[Thresholds]) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Returns:
+            (summary, membership)
+            summary: 每组阈值一行 (各阈值取值 + passed / added / removed 数量)
+            membership: (组数, 股票数) 的 bool 矩阵，membership[i, j] 表示第 i 组阈值下第 j 只股票通过
+        """
+        membership = np.zeros((len(grid), len(self.tickers)), dtype=bool)
+        rows = []
+        for i, thresholds in enumerate(grid):
+            passed = self.evaluate(thresholds)
+            membership[i] = passed
+            row = dataclasses.asdict(thresholds)
+            row.update({
+                'passed': int(passed.sum()),
+                'added': int((passed & ~self.baseline).sum()),
+                'removed': int((~passed & self.baseline).sum()),
+            })
+            rows.append(row)
+        return pd.DataFrame(rows), membership
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MGP Iron Gate threshold sweep")
+    parser.add_argument("--tickers", type=str, help="Comma-separated list of tickers")
+    parser.add_argument("--tickers-file", type=str, help="File with one ticker per line")
+    parser.add_argument("--grid", nargs="*", default=[],
+                        help="Threshold grid, e.g. peg_bubble=1.5,2,2.5 growth_cagr=0.1,0.15 (default: config.SWEEP_GRID)")
+    parser.add_argument("--offline", action="store_true", help="Use only the statement store and cached responses")
+    parser.add_argument("--top", type=int, default=20, help="Number of combinations to print")
+    parser.add_argument("--out", type=str, default="sweep_summary.csv", help="Summary CSV path")
+    args = parser.parse_args()
+
+    tickers = []
+    if args.tickers:
+        tickers += [t.strip().upper() for t in args.tickers.split(",") if t.strip()]
+    if args.tickers_file:
+        with open(args.tickers_file, "r", encoding="utf-8") as f:
+            tickers += [line.strip().upper() for line in f if line.strip()]
+    if not tickers:
+        parser.error("--tickers or --tickers-file is required")
+
+    grid = expand_grid(parse_grid(args.grid) if args.grid else config.SWEEP_GRID)
+
+    fmp = FMPClient(offline=args.offline)
+    store = StatementStore()
+    if not args.offline:
+        print(f"Refreshing statement store for {len(tickers)} tickers...")
+        fmp.prefetch(tickers, lambda snapshot: store.refresh(fmp, snapshot.ticker))
+        fmp.get_quotes(tickers)
+        fmp.prefetch(tickers, lambda snapshot: snapshot.ratios_ttm)
+
+    raw = load_raw_metrics(tickers, fmp, store)
+    sweep = ThresholdSweep(raw)
+    summary, membership = sweep.run(grid)
+
+    print(f"Baseline (config): {int(sweep.baseline.sum())}/{len(tickers)} passed. "
+          f"Evaluated {len(grid)} threshold combinations.")
+    print(summary.sort_values('passed', ascending=False).head(args.top).to_string(index=False))
+
+    # 成员变化: 每组阈值相对基准新增 / 剔除的股票
+    changes = [sweep.changes(passed) for passed in membership]
+    summary['added_tickers'] = [" ".join(added) for added, _ in changes]
+    summary['removed_tickers'] = [" ".join(removed) for _, removed in changes]
+    summary.to_csv(args.out, index=False)
+    print(f"Sweep saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""批量模式: run_deferred 通过 LocalBatchSubmitter 提交、按 custom_id 写回 LLM 缓存"""
+
+import json
+
+import pytest
+
+import config
+from core.data_models import IdentifierData
+from tools.batch import (LLMDeferredError, LocalBatchSubmitter, OpenAIBatchSubmitter, make_submitter,
+                         run_deferred, write_batch_file)
+from tools.llm import LLMClient
+from tools.llm_cache import LLMCache
+from tools.telemetry import llm_cost, telemetry
+
+SYSTEM_PROMPT = "You are a classifier."
+
+
+def identifier_response(body):
+    """按提示词中的股票代码构造响应；提示词含 BAD 时返回不符合 schema 的内容"""
+    prompt = body["messages"][1]["content"]
+    if "BAD" in prompt:
+        content = json.dumps({"unexpected": True})
+    else:
+        content = IdentifierData(business_model="SaaS", specific_kpis=["NDR"], bear_case_hook=prompt).model_dump_json()
+    return {"choices": [{"message": {"content": content}}], "usage": {"prompt_tokens": 10, "completion_tokens": 5}}
+
+
+class ReversedLocalSubmitter(LocalBatchSubmitter):
+    """结果行顺序与提交顺序相反 (批量 API 不保证顺序)，验证按 custom_id 对应"""
+
+    def results(self, batch_id):
+        return list(reversed(super().results(batch_id)))
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test-key")
+    return LLMClient(cache=LLMCache(str(tmp_path / "llm.sqlite")), defer_routes={"identifier"})
+
+
+def defer(llm, prompt):
+    with pytest.raises(LLMDeferredError):
+        llm.extract_structured_data(prompt, IdentifierData, SYSTEM_PROMPT, route="identifier")
+
+
+def test_run_deferred_writes_results_back_by_custom_id(llm, tmp_path):
+    prompts = ["Identify DDOG", "Identify CRWD", "Identify BAD"]
+    for prompt in prompts:
+        defer(llm, prompt)
+
+    submitter = ReversedLocalSubmitter(handler=identifier_response)
+    counts = run_deferred(llm, submitter, path=str(tmp_path / "batch.jsonl"))
+
+    assert counts == {"submitted": 3, "completed": 2, "failed": 1}
+    # 成功的请求命中缓存，且结果对应各自的提示词
+    for prompt in prompts[:2]:
+        result = llm.extract_structured_data(prompt, IdentifierData, SYSTEM_PROMPT, route="identifier")
+        assert result.bear_case_hook == prompt
+    # 校验失败的请求不再推迟，改为同步请求
+    model = llm.model_for("identifier")
+    bad_key = LLMCache.make_key(model, SYSTEM_PROMPT, prompts[2], None, IdentifierData.model_json_schema())
+    assert llm.batch_failed == {bad_key}
+    assert llm.take_deferred() == []
+
+
+def batch_costs(run):
+    """run 期间记录的批量调用费用"""
+    start = len(telemetry.records)
+    run()
+    return [record.cost for record in telemetry.records[start:] if record.provider == "llm_batch"]
+
+
+def test_local_submitter_records_full_price(llm, tmp_path):
+    defer(llm, "Identify DDOG")
+    submitter = LocalBatchSubmitter(handler=identifier_response)
+
+    costs = batch_costs(lambda: run_deferred(llm, submitter, path=str(tmp_path / "batch.jsonl")))
+
+    # 本地 submitter 发送的是普通同步请求，不享受批量折扣
+    assert costs == [pytest.approx(llm_cost(llm.model_for("identifier"), 10, 5))]
+    assert costs[0] > 0
+
+
+def test_submitter_discount_applies_to_recorded_cost(llm, tmp_path):
+    defer(llm, "Identify DDOG")
+    submitter = LocalBatchSubmitter(handler=identifier_response)
+    submitter.discount = config.LLM_BATCH_DISCOUNT
+
+    costs = batch_costs(lambda: run_deferred(llm, submitter, path=str(tmp_path / "batch.jsonl")))
+
+    full = llm_cost(llm.model_for("identifier"), 10, 5)
+    assert costs == [pytest.approx(full * config.LLM_BATCH_DISCOUNT)]
+
+
+def test_run_deferred_without_requests_submits_nothing(llm):
+    class FailingSubmitter:
+        def submit(self, path):
+            raise AssertionError("nothing to submit")
+
+    assert run_deferred(llm, FailingSubmitter()) == {"submitted": 0, "completed": 0, "failed": 0}
+
+
+def test_openai_submitter_maps_tier_models(llm, tmp_path):
+    submitter = OpenAIBatchSubmitter(client=object(), models={"standard": "batch-standard"})
+    assert submitter.discount == config.LLM_BATCH_DISCOUNT
+    defer(llm, "Identify DDOG")
+    requests = llm.take_deferred()
+
+    path = write_batch_file(requests, str(tmp_path / "batch.jsonl"), submitter.batch_model)
+
+    with open(path, encoding="utf-8") as f:
+        line = json.loads(f.readline())
+    assert line["custom_id"] == requests[0].custom_id
+    assert line["body"]["model"] == "batch-standard"
+
+
+def test_openai_submitter_fails_fast_on_unmapped_models():
+    submitter = OpenAIBatchSubmitter(client=object(), models={"standard": "batch-standard"})
+    with pytest.raises(ValueError, match="No batch model configured"):
+        submitter.check_models({config.LLM_MODEL_TIERS["reasoning"]})
+
+
+def test_default_submitter_accepts_tier_models(monkeypatch):
+    monkeypatch.setattr(config, "OPENAI_API_KEY", "test-key")
+    submitter = make_submitter(models=set(config.LLM_MODEL_TIERS.values()))
+    assert isinstance(submitter, LocalBatchSubmitter)
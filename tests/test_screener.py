@@ -0,0 +1,160 @@
+"""向量化铁律筛选与 IronGate.evaluate 的逐行一致性"""
+
+import random
+
+import pytest
+
+from phases.iron_gate import IronGate
+from phases.screener import IronGateScreener, UniversePanel
+
+FLOAT_FIELDS = ['revenue_cagr_ny', 'revenue_growth_current_q', 'revenue_growth_prev_y_q', 'peg_ratio',
+                'gross_margin_slope', 'opex_growth', 'sbc_revenue_ratio', 'share_count_growth']
+
+
+def quarters(revenues, gross_margins=0.6, opex_ratios=0.5, eps=0.5, shares=100e6):
+    """季度利润表 (从新到旧)；毛利率 / 费用率可按季度给出列表"""
+    def at(value, i):
+        return value[i] if isinstance(value, list) else value
+    return [{"revenue": rev, "grossProfit": rev * at(gross_margins, i), "operatingExpenses": rev * at(opex_ratios, i),
+             "eps": eps, "weightedAverageShsOutDil": shares, "date": f"q{i}"}
+            for i, rev in enumerate(revenues)]
+
+
+def growing(latest, growth, n=9):
+    """按固定同比增速倒推的季度营收 (从新到旧)"""
+    return [latest / (1 + growth) ** (i / 4) for i in range(n)]
+
+
+def annual(latest, cagr, n=4):
+    return [{"revenue": latest / (1 + cagr) ** i} for i in range(n)]
+
+
+def cash_flow(sbc, n=4):
+    return [{"stockBasedCompensation": sbc} for _ in range(n)]
+
+
+UNPROFITABLE = {"netProfitMarginTTM": -0.1, "peRatioTTM": None, "pegRatioTTM": None}
+PROFITABLE = {"netProfitMarginTTM": 0.2, "peRatioTTM": 40.0, "pegRatioTTM": None}
+QUOTE = {"price": 100.0}
+
+# 每条 fail_reason、两条通过路径以及缺失数据的情况
+CASES = {
+    "insufficient_quarters": ([], quarters(growing(100, 0.5, n=3)), [], UNPROFITABLE, QUOTE),
+    "data_error": (annual(400, 0.3), quarters([100, 90, 80, 70, 0, 60, 50, 40, 30]), [], UNPROFITABLE, QUOTE),
+    "low_growth_new_ipo": ([], quarters(growing(100, 0.05)), cash_flow(1), UNPROFITABLE, QUOTE),
+    "low_growth": (annual(400, 0.05), quarters(growing(100, 0.05)), cash_flow(1), UNPROFITABLE, QUOTE),
+    "excessive_sbc": (annual(400, 0.3), quarters(growing(100, 0.3)), cash_flow(30), UNPROFITABLE, QUOTE),
+    "deceleration": (annual(400, 0.5), quarters(growing(100, 0.25, n=5) + [40, 35, 30, 25]), cash_flow(1),
+                     UNPROFITABLE, QUOTE),
+    "peg_too_high": (annual(400, 0.3), quarters(growing(100, 0.3)), cash_flow(1),
+                     {"netProfitMarginTTM": 0.2, "peRatioTTM": 90.0, "pegRatioTTM": 3.0}, QUOTE),
+    "peg_from_price_eps": (annual(400, 0.3), quarters(growing(100, 0.3), eps=0.1), cash_flow(1),
+                           {"netProfitMarginTTM": 0.2, "peRatioTTM": None, "pegRatioTTM": None}, QUOTE),
+    "gross_margin_declining": (annual(400, 0.3), quarters(growing(100, 0.3), gross_margins=[0.4, 0.5, 0.6, 0.7, 0.8,
+                                                                                              0.9, 0.9, 0.9, 0.9]),
+                               cash_flow(1), UNPROFITABLE, QUOTE),
+    "no_operating_leverage": (annual(400, 0.3), quarters(growing(100, 0.3), opex_ratios=[0.9, 0.6, 0.6, 0.6, 0.3,
+                                                                                          0.3, 0.3, 0.3, 0.3]),
+                              cash_flow(1), UNPROFITABLE, QUOTE),
+    "pass_profitable": (annual(400, 0.3), quarters(growing(100, 0.3)), cash_flow(1), PROFITABLE, QUOTE),
+    "pass_unprofitable": (annual(400, 0.3), quarters(growing(100, 0.3), gross_margins=[0.7, 0.68, 0.66, 0.64, 0.62,
+                                                                                         0.6, 0.6, 0.6, 0.6]),
+                          cash_flow(1), UNPROFITABLE, QUOTE),
+    "missing_ratios_and_quote": (annual(400, 0.3), quarters(growing(100, 0.3)), [], None, None),
+    "missing_cash_flow_and_annual": ([], quarters(growing(100, 0.3)), [], PROFITABLE, None),
+    "single_annual_short_history": (annual(400, 0.3, n=1), quarters(growing(100, 0.3, n=6)), cash_flow(1, n=2),
+                                    UNPROFITABLE, QUOTE),
+}
+
+
+def partial(rows, index, *fields):
+    """模拟本地仓库省略 NaN 字段的记录"""
+    rows[index] = {k: v for k, v in rows[index].items() if k not in fields}
+    return rows
+
+
+# 本地仓库 (--store / --offline) 的部分缺失行: 缺失字段按 0 处理，不应抛出 KeyError
+PARTIAL_CASES = {
+    "missing_eps": (annual(400, 0.3), partial(quarters(growing(100, 0.3)), 0, "eps"), cash_flow(1),
+                    {"netProfitMarginTTM": 0.2, "peRatioTTM": None, "pegRatioTTM": None}, QUOTE),
+    "missing_gross_profit": (annual(400, 0.3), partial(quarters(growing(100, 0.3)), 2, "grossProfit"), cash_flow(1),
+                             UNPROFITABLE, QUOTE),
+    "missing_current_opex": (annual(400, 0.3), partial(quarters(growing(100, 0.3)), 0, "operatingExpenses"),
+                             cash_flow(1), UNPROFITABLE, QUOTE),
+    "missing_old_opex": (annual(400, 0.3), partial(quarters(growing(100, 0.3)), 4, "operatingExpenses"),
+                         cash_flow(1), UNPROFITABLE, QUOTE),
+}
+
+
+def random_company(rng):
+    """随机公司: 期数、增速、毛利率、SBC 与估值数据的组合 (含缺失数据与零营收)"""
+    n_quarters = rng.choice([3, 5, 6, 7, 8, 9, 9, 9])
+    n_annual = rng.choice([0, 1, 2, 3, 4, 4])
+    base = rng.uniform(50, 500)
+    growth = rng.choice([0.05, 0.15, 0.25, 0.5, 0.8, 1.2])
+    older_growth = rng.choice([growth, growth * 0.3, growth * 1.5])
+    income_quarterly = []
+    for i in range(n_quarters):
+        rate = growth if i < 4 else older_growth
+        # FMP 的金额字段为整数 (零营收时 Data Error 的文案与整数除法一致)
+        revenue = int(base * 1e6 / (1 + rate) ** (i / 4) * rng.uniform(0.95, 1.05))
+        if rng.random() < 0.03:
+            revenue = 0
+        margin = rng.uniform(0.3, 0.8) + rng.choice([-1, 1, 0]) * 0.01 * i
+        income_quarterly.append({"revenue": revenue, "grossProfit": revenue * margin,
+                                 "operatingExpenses": revenue * rng.uniform(0.2, 0.9), "eps": rng.uniform(-1, 2),
+                                 "weightedAverageShsOutDil": 1e6 * rng.uniform(90, 110)})
+    income_annual = [{"revenue": int(base * 4e6 / (1 + rng.choice([0.1, 0.2, 0.4])) ** i)} for i in range(n_annual)]
+    sbc_ratio = rng.choice([0.02, 0.1, 0.25])
+    cash = [{"stockBasedCompensation": income_quarterly[min(i, n_quarters - 1)]["revenue"] * sbc_ratio}
+            for i in range(rng.choice([0, 3, 4, 4]))]
+    ratios = None if rng.random() < 0.1 else {
+        "netProfitMarginTTM": rng.choice([-0.1, 0.01, 0.05, 0.2]), "peRatioTTM": rng.choice([None, 20, 60, 150]),
+        "pegRatioTTM": rng.choice([None, 0, 0.5, 1.8, 3.0])}
+    quote = None if rng.random() < 0.1 else {"price": rng.uniform(5, 300)}
+    return income_annual, income_quarterly, cash, ratios, quote
+
+
+def assert_parity(records):
+    screened = IronGateScreener().screen(UniversePanel.from_records(records))
+    gate = IronGate(None)
+    for ticker, record in records.items():
+        expected = gate.evaluate(*record)
+        actual = screened[ticker]
+        assert (actual.passed, actual.fail_reason) == (expected.passed, expected.fail_reason), ticker
+        assert actual.dilution_shield_passed == expected.dilution_shield_passed, ticker
+        assert actual.operating_leverage == expected.operating_leverage, ticker
+        for field in FLOAT_FIELDS:
+            value = getattr(expected, field)
+            if value is None:
+                assert getattr(actual, field) is None, (ticker, field)
+            else:
+                assert getattr(actual, field) == pytest.approx(value, rel=1e-9, abs=1e-12), (ticker, field)
+
+
+def test_cases_cover_every_fail_reason():
+    gate = IronGate(None)
+    reasons = {(gate.evaluate(*record).fail_reason or "PASS").split(":")[0].split(" (")[0]
+               for record in CASES.values()}
+    assert reasons == {"Insufficient quarterly data", "Data Error", "Low Growth", "Excessive SBC",
+                       "Deceleration Alarm", "PEG too high", "Gross Margin Declining", "No Operating Leverage",
+                       "PASS"}
+    assert gate.evaluate(*CASES["low_growth_new_ipo"]).fail_reason.startswith("Low Growth (New IPO)")
+
+
+def test_screener_matches_iron_gate_on_each_rule():
+    assert_parity(CASES)
+
+
+def test_partial_rows_treat_missing_fields_as_zero():
+    gate = IronGate(None)
+    assert gate.evaluate(*PARTIAL_CASES["missing_eps"]).peg_ratio == pytest.approx(100 / 1.5 / 30)
+    assert gate.evaluate(*PARTIAL_CASES["missing_gross_profit"]).fail_reason.startswith("Gross Margin Declining")
+    assert gate.evaluate(*PARTIAL_CASES["missing_current_opex"]).opex_growth == -1
+    assert gate.evaluate(*PARTIAL_CASES["missing_old_opex"]).opex_growth == 0
+    assert_parity(PARTIAL_CASES)
+
+
+def test_screener_matches_iron_gate_on_random_universe():
+    rng = random.Random(7)
+    assert_parity({f"T{i}": random_company(rng) for i in range(500)})
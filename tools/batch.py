@@ -0,0 +1,277 @@
+"""
+LLM 批量提交 (Deferred Batch Mode)
+=================================
+夜间全市场运行不需要交互式延迟。批量模式下 LLMClient 对指定调用点 (默认 Identifier / Tribunal)
+的缓存未命中不立即请求，而是登记为 BatchRequest 并抛出 LLMDeferredError；main 在一轮分析结束后:
+
+1. 把登记的请求写成 provider 的批量格式 (OpenAI Batch API JSONL)
+2. 通过可替换的 submitter 提交并轮询直至完成
+3. 按 custom_id (即缓存键) 取回结果，按 schema 校验后写入 LLM 缓存
+
+随后重跑被推迟的股票: 已完成的阶段直接复用，Identifier / Tribunal 命中缓存。
+
+submitter (submit / status / results，可选 check_models / batch_model / discount 价格折扣):
+- LocalBatchSubmitter (默认): 在进程内并发执行请求，通过 OpenRouter 同步发送 (provider 不支持 Batch API 时；也用于测试)
+- OpenAIBatchSubmitter: OpenAI Batch API (files + batches)。档位模型是 OpenRouter 模型名，
+  需在 config.LLM_BATCH_MODELS 中映射为批量端点提供的模型，未映射时创建 submitter 即报错
+"""
+
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Type
+
+from openai import OpenAI
+from pydantic import BaseModel, ValidationError
+
+import config
+from tools.telemetry import llm_cost, tag, telemetry
+
+if TYPE_CHECKING:
+    from tools.llm import LLMClient
+
+# OpenAI Batch 的终止状态
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class LLMDeferredError(Exception):
+    """请求已登记到批量队列，结果在批量完成后写入缓存"""
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str                  # 与 LLMCache 键相同，结果按此写回缓存
+    model: str
+    route: str
+    system_prompt: str
+    prompt: str
+    schema: Type[BaseModel]
+    tags: Dict[str, str] = field(default_factory=dict)   # 登记时的 telemetry 标签 (ticker / phase)
+
+    def to_line(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        OpenAI Batch API 的一行请求 (/v1/chat/completions，结构化输出)
+
+        Args:
+            model: 批量端点上的模型名 (默认与同步请求相同)
+        """
+        return {
+            "custom_id": self.custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model or self.model,
+                "messages": [
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": self.prompt},
+                ],
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": self.schema.__name__, "schema": self.schema.model_json_schema()},
+                },
+            },
+        }
+
+
+def write_batch_file(requests: List[BatchRequest], path: str,
+                     batch_model: Optional[Callable[[str], str]] = None) -> str:
+    """
+    Args:
+        batch_model: 同步模型名 -> 批量端点模型名 (默认不变)
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            model = batch_model(request.model) if batch_model else None
+            f.write(json.dumps(request.to_line(model), ensure_ascii=False) + "\n")
+    return path
+
+
+class OpenAIBatchSubmitter:
+    """
+    OpenAI Batch API (config.LLM_BATCH_BASE_URL)
+
+    Args:
+        models: 档位 -> 批量端点上的模型名 (默认 config.LLM_BATCH_MODELS)
+    """
+
+    def __init__(self, client: Optional[OpenAI] = None, models: Optional[Dict[str, str]] = None):
+        # 批量价格相对同步请求的折扣 (估算费用用)
+        self.discount = config.LLM_BATCH_DISCOUNT
+        models = config.LLM_BATCH_MODELS if models is None else models
+        # 同步请求的模型名 (OpenRouter) -> 批量端点模型名
+        self.models = {config.LLM_MODEL_TIERS[tier]: name for tier, name in models.items()}
+        if client is None:
+            # OPENAI_API_KEY 是发往 OpenRouter 的密钥，不能用于 OpenAI Batch API
+            if not config.LLM_BATCH_API_KEY:
+                raise ValueError("LLM_BATCH_API_KEY is not set (required by the openai batch submitter)")
+            client = OpenAI(base_url=config.LLM_BATCH_BASE_URL, api_key=config.LLM_BATCH_API_KEY)
+        self.client = client
+
+    def check_models(self, models: Iterable[str]) -> None:
+        """批量调用点用到的模型都必须有映射，否则整批必然失败"""
+        missing = sorted(set(models) - set(self.models))
+        if missing:
+            raise ValueError(f"No batch model configured for {', '.join(missing)}: "
+                             f"set config.LLM_BATCH_MODELS or use the local batch submitter")
+
+    def batch_model(self, model: str) -> str:
+        return self.models[model]
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(input_file_id=uploaded.id, endpoint="/v1/chat/completions",
+                                           completion_window="24h")
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        """输出行与错误行 (两者格式相同: custom_id / response / error)"""
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                lines.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return lines
+
+
+class LocalBatchSubmitter:
+    """
+    本地替身: 提交时在进程内并发执行请求 (并发上限 config.LLM_MAX_CONCURRENCY)，立即完成
+
+    Args:
+        handler: 接收请求 body，返回 chat completion 响应 (dict)；
+                 默认通过 OpenAI 兼容客户端同步发送 (如 OpenRouter 不支持 Batch API 时)
+    """
+
+    def __init__(self, handler: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+                 client: Optional[OpenAI] = None):
+        if handler is None:
+            client = client or OpenAI(base_url="https://openrouter.ai/api/v1", api_key=config.OPENAI_API_KEY)
+            handler = lambda body: client.chat.completions.create(**body).model_dump()
+        self.handler = handler
+        # 实际是普通同步请求，按原价计费
+        self.discount = 1.0
+        self._outputs: Dict[str, List[Dict[str, Any]]] = {}
+
+    def check_models(self, models: Iterable[str]) -> None:
+        """与同步请求使用同一 provider，任何档位模型都可用"""
+
+    def batch_model(self, model: str) -> str:
+        return model
+
+    def _execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            body = self.handler(request["body"])
+            return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+        except Exception as e:
+            return {"custom_id": request["custom_id"], "response": None, "error": {"message": str(e)}}
+
+    def submit(self, path: str) -> str:
+        batch_id = f"local_{uuid.uuid4().hex[:12]}"
+        with open(path, encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f if line.strip()]
+        with ThreadPoolExecutor(max_workers=config.LLM_MAX_CONCURRENCY) as pool:
+            self._outputs[batch_id] = list(pool.map(self._execute, requests))
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return "completed"
+
+    def results(self, batch_id: str) -> List[Dict[str, Any]]:
+        return self._outputs.pop(batch_id, [])
+
+
+def make_submitter(name: Optional[str] = None, models: Optional[Iterable[str]] = None):
+    """
+    按名称创建 submitter ("local" / "openai"，默认 config.LLM_BATCH_SUBMITTER)
+
+    Args:
+        models: 将以批量方式请求的模型 (同步模型名)；批量端点不提供其中任一模型时立即报错
+    """
+    name = name or config.LLM_BATCH_SUBMITTER
+    if name == "openai":
+        submitter = OpenAIBatchSubmitter()
+    elif name == "local":
+        submitter = LocalBatchSubmitter()
+    else:
+        raise ValueError(f"Unknown batch submitter: {name}")
+    if models is not None:
+        submitter.check_models(models)
+    return submitter
+
+
+def _content(line: Dict[str, Any]) -> Optional[str]:
+    response = line.get("response") or {}
+    if response.get("status_code") != 200:
+        return None
+    choices = (response.get("body") or {}).get("choices") or []
+    return choices[0]["message"].get("content") if choices else None
+
+
+def run_deferred(llm: "LLMClient", submitter, path: Optional[str] = None) -> Dict[str, int]:
+    """
+    提交 llm 中登记的全部请求，等待完成并把结果写入 LLM 缓存
+
+    失败或无法通过 schema 校验的请求记入 llm.batch_failed，之后改为同步请求 (不会被再次推迟)。
+
+    Returns:
+        {"submitted": n, "completed": n, "failed": n}
+    """
+    requests = llm.take_deferred()
+    if not requests:
+        return {"submitted": 0, "completed": 0, "failed": 0}
+    if path is None:
+        name = f"batch_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.jsonl"
+        path = os.path.join(config.LLM_BATCH_DIR, name)
+    batch_model = getattr(submitter, "batch_model", None)
+    discount = getattr(submitter, "discount", 1.0)
+    write_batch_file(requests, path, batch_model)
+
+    start = time.perf_counter()
+    batch_id = submitter.submit(path)
+    deadline = time.time() + config.LLM_BATCH_TIMEOUT
+    status = submitter.status(batch_id)
+    while status not in TERMINAL_STATUSES:
+        if time.time() > deadline:
+            raise TimeoutError(f"Batch {batch_id} still {status} after {config.LLM_BATCH_TIMEOUT}s")
+        time.sleep(config.LLM_BATCH_POLL_SECONDS)
+        status = submitter.status(batch_id)
+    lines = {line["custom_id"]: line for line in submitter.results(batch_id)} if status == "completed" else {}
+    elapsed = time.perf_counter() - start
+
+    completed = 0
+    for request in requests:
+        line = lines.get(request.custom_id) or {}
+        content = _content(line)
+        parsed = None
+        if content:
+            try:
+                parsed = request.schema.model_validate_json(content)
+            except ValidationError:
+                parsed = None
+        usage = (((line.get("response") or {}).get("body") or {}).get("usage")) or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        model = batch_model(request.model) if batch_model else request.model
+        with tag(**request.tags):
+            # 批量请求的耗时按整批墙钟时间均摊；费用按 submitter 的折扣估算
+            telemetry.record("llm_batch", model, elapsed / len(requests),
+                             prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                             cost=llm_cost(model, prompt_tokens, completion_tokens) * discount,
+                             error=None if parsed is not None else (status if status != "completed" else "invalid"))
+        if parsed is None:
+            llm.batch_failed.add(request.custom_id)
+            continue
+        llm.cache.set(request.custom_id, request.model, "structured", parsed.model_dump_json(), route=request.route,
+                      request={"system_prompt": request.system_prompt, "prompt": request.prompt,
+                               "schema": request.schema.__name__})
+        completed += 1
+    return {"submitted": len(requests), "completed": completed, "failed": len(requests) - completed}
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Optional
+
+
+class DiskCache:
+    """
+    基于文件的 JSON 响应缓存 (每个 key 一个文件)
+
+    写入时记录时间戳，读取时由调用方传入 TTL 判断是否新鲜，
+    这样同一份缓存可以按不同的新鲜度策略复用。
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def get(self, key: str, ttl: Optional[float] = None, not_before: Optional[float] = None) -> Optional[Any]:
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+            ttl: 有效期 (秒)，None 表示永不过期
+            not_before: 只接受该时间戳之后写入的条目 (用于强制刷新)
+
+        Returns:
+            缓存值；不存在、已过期或文件损坏时返回 None
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        stored_at = entry.get("stored_at", 0)
+        if ttl is not None and time.time() - stored_at > ttl:
+            return None
+        if not_before is not None and stored_at < not_before:
+            return None
+        return entry.get("value")
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        entry = {"key": key, "stored_at": time.time(), "value": value}
+        # 先写临时文件再替换，避免中断时留下半个 JSON
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
@@ -0,0 +1,178 @@
+"""
+搜索结果上下文构建 (Token-budgeted Context)
+==========================================
+把 Tavily 返回的原始 content 整理成送入提示词的上下文:
+
+1. 切分为段落，剔除导航 / 订阅 / 版权等样板行
+2. 按与查询的相关性 (BM25) 排序
+3. 去除近似重复段落 (词 3-gram Jaccard 相似度)
+4. 按 token 预算截断，并记录实际使用的 token 数
+
+分词优先使用 tiktoken (本地 BPE)，无法加载编码文件时退回正则近似分词。
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import config
+
+# 样板行: 命中且较短时整行丢弃
+BOILERPLATE = re.compile(
+    r"cookie|subscribe|sign up|sign in|log in|newsletter|all rights reserved|privacy policy|terms of (use|service)"
+    r"|advertisement|click here|read more|share this|follow us|enable javascript",
+    re.IGNORECASE)
+BOILERPLATE_MAX_WORDS = 30
+# 剩余预算不少于该值时，放不下的段落截断后放入；否则跳过去找更短的段落
+MIN_PARTIAL_TOKENS = 32
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9%$.\-]*", re.IGNORECASE)
+_APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """加载 tiktoken 编码 (进程内只尝试一次；离线且无本地缓存时返回 None)"""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(config.CONTEXT_TOKENIZER_ENCODING)
+            except Exception as e:
+                # 只提示一次: 之后的 token 计数为近似值
+                print(f"tiktoken unavailable ({e}), using approximate token counts")
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """保留前 max_tokens 个 token"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    matches = list(_APPROX_TOKEN.finditer(text))
+    return text if len(matches) <= max_tokens else text[:matches[max_tokens - 1].end()]
+
+
+def _words(text: str) -> List[str]:
+    return [w.lower() for w in _WORD.findall(text)]
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    tokens: int                 # 实际使用的 token 数
+    passages_used: int
+    passages_total: int
+    duplicates_removed: int
+
+
+class ContextBuilder:
+    """
+    用法:
+        context = ContextBuilder().build(query, results)
+        prompt = f"... {context.text} ..."
+    """
+
+    def __init__(self, budget: Optional[int] = None, dedup_threshold: Optional[float] = None):
+        """
+        Args:
+            budget: 单个提示词上下文的 token 上限 (默认 config.CONTEXT_TOKEN_BUDGET)
+            dedup_threshold: 近似重复判定阈值 (默认 config.CONTEXT_DEDUP_THRESHOLD)
+        """
+        self.budget = budget or config.CONTEXT_TOKEN_BUDGET
+        self.dedup_threshold = dedup_threshold or config.CONTEXT_DEDUP_THRESHOLD
+
+    def _passages(self, results: List[Dict]) -> List[str]:
+        """切分段落并剔除样板行；过长段落按句子切成不超过 CONTEXT_PASSAGE_MAX_TOKENS 的片段"""
+        passages = []
+        for result in results:
+            content = (result or {}).get('content') or ""
+            for line in content.split("\n"):
+                line = line.strip()
+                if not line:
+                    continue
+                if BOILERPLATE.search(line) and len(line.split()) <= BOILERPLATE_MAX_WORDS:
+                    continue
+                chunk = []
+                for sentence in _SENTENCE_END.split(line):
+                    chunk.append(sentence)
+                    if count_tokens(" ".join(chunk)) >= config.CONTEXT_PASSAGE_MAX_TOKENS:
+                        passages.append(" ".join(chunk))
+                        chunk = []
+                if chunk:
+                    passages.append(" ".join(chunk))
+        return passages
+
+    @staticmethod
+    def _rank(query: str, passages: List[str]) -> List[int]:
+        """BM25 相关性排序 (分数相同时保持原始顺序)，返回段落下标"""
+        docs = [_words(p) for p in passages]
+        terms = set(_words(query))
+        n = len(docs)
+        avg_len = sum(len(d) for d in docs) / n if n else 0
+        df = Counter(t for d in docs for t in set(d) if t in terms)
+        k1, b = 1.5, 0.75
+
+        scores = []
+        for doc in docs:
+            tf = Counter(doc)
+            score = 0.0
+            for term in terms:
+                if not tf[term]:
+                    continue
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf[term] + k1 * (1 - b + b * len(doc) / (avg_len or 1))
+                score += idf * tf[term] * (k1 + 1) / norm
+            scores.append(score)
+        return sorted(range(n), key=lambda i: -scores[i])
+
+    def build(self, query: str, results: List[Dict]) -> BuiltContext:
+        passages = self._passages(results)
+        kept, kept_shingles = [], []
+        duplicates = 0
+        used = 0
+
+        for i in self._rank(query, passages):
+            shingles = _shingles(_words(passages[i]))
+            if any(len(shingles & other) / len(shingles | other) >= self.dedup_threshold for other in kept_shingles):
+                duplicates += 1
+                continue
+            kept_shingles.append(shingles)
+
+            tokens = count_tokens(passages[i])
+            remaining = self.budget - used
+            if tokens > remaining:
+                if remaining >= MIN_PARTIAL_TOKENS or not kept:
+                    kept.append(truncate_tokens(passages[i], remaining))
+                    used += count_tokens(kept[-1])
+                continue
+            kept.append(passages[i])
+            used += tokens
+
+        text = "\n".join(kept)
+        return BuiltContext(text=text, tokens=used, passages_used=len(kept), passages_total=len(passages),
+                            duplicates_removed=duplicates)
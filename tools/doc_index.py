@@ -0,0 +1,117 @@
+"""
+本地文档索引 (SQLite FTS5)
+=========================
+保存每次搜索取回的文档 (ticker / 调研主题 / 查询 / URL / 标题 / 正文 / 取回时间)，建立全文索引。
+Intelligence 先查本地索引: 该股票该主题 (如 "moat"、"kpi:NDR") 下有足够的新鲜文档时，
+按 BM25 取出与查询最相关的几篇，不再请求 Tavily；覆盖不足或已过期时才联网搜索，并把结果写回索引。
+
+新鲜度沿用 config.SEARCH_CACHE_TTL (按主题所属的查询类别)。
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class DocumentIndex:
+    """
+    同一进程内多线程共享一个连接，写入串行化；WAL 模式下多个进程可同时读取。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id INTEGER PRIMARY KEY,
+                ticker TEXT NOT NULL,
+                topic TEXT NOT NULL,
+                query TEXT NOT NULL,
+                url TEXT NOT NULL,
+                title TEXT,
+                content TEXT NOT NULL,
+                score REAL,
+                fetched_at REAL NOT NULL,
+                UNIQUE (ticker, topic, url)
+            );
+            CREATE INDEX IF NOT EXISTS documents_topic ON documents (ticker, topic, fetched_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                title, content, content='documents', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+                INSERT INTO documents_fts (documents_fts, rowid, title, content)
+                VALUES ('delete', old.id, old.title, old.content);
+                INSERT INTO documents_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+            END;
+        """)
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, ticker: str, topic: str, query: str, results: List[Dict]) -> None:
+        """写入一次搜索的结果 (同一股票 / 主题下相同 URL 的文档更新为最新内容)"""
+        now = time.time()
+        rows = [(ticker, topic, query, r.get('url') or f"{query}#{i}", r.get('title'), r.get('content'),
+                 r.get('score'), now)
+                for i, r in enumerate(results) if r.get('content')]
+        if not rows:
+            return
+        with self._lock:
+            # 更新由触发器同步到全文索引
+            self._conn.executemany(
+                "INSERT INTO documents (ticker, topic, query, url, title, content, score, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (ticker, topic, url) DO UPDATE SET query = excluded.query, title = excluded.title, "
+                "content = excluded.content, score = excluded.score, fetched_at = excluded.fetched_at", rows)
+            self._conn.commit()
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        """查询词 OR 连接 (加引号，避免 FTS5 语法字符)"""
+        terms = dict.fromkeys(re.findall(r"\w+", query.lower()))
+        return " OR ".join(f'"{term}"' for term in terms)
+
+    def lookup(self, ticker: str, topic: str, query: str, limit: int,
+               fresh_after: Optional[float] = None) -> List[Dict]:
+        """
+        该股票 / 主题下与查询最相关的新鲜文档 (BM25 排序)，格式与 Tavily 结果相同
+
+        Args:
+            fresh_after: 只返回该时间戳之后取回的文档
+        """
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT d.url, d.title, d.content, d.score FROM documents_fts "
+                "JOIN documents d ON d.id = documents_fts.rowid "
+                "WHERE documents_fts MATCH ? AND d.ticker = ? AND d.topic = ? AND d.fetched_at >= ? "
+                "ORDER BY bm25(documents_fts) LIMIT ?",
+                (expression, ticker, topic, fresh_after or 0.0, limit)).fetchall()
+        return [{'url': url, 'title': title, 'content': content, 'score': score}
+                for url, title, content, score in rows]
+
+    def record_lookup(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -1,18 +1,89 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 import requests
-from typing import Dict, List, Optional, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Callable, Dict, List, Optional, Any
 import config
+from tools.cache import DiskCache
+
+# 可重试的暂时性错误 (限流 / 服务端异常)
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class FMPUnavailableError(Exception):
+    """
+    FMP 暂时不可用 (限流、5xx 或网络错误，且重试已耗尽)
+
+    与"无数据" (返回 None / 空列表) 区分开，调用方不应把它当作财务数据不足。
+    """
 
 
 class FMPClient:
-    def __init__(self):
+    def __init__(self, refresh: bool = False, cache_dir: Optional[str] = None,
+                 pool_size: Optional[int] = None, offline: bool = False):
         self.api_key = config.FMP_API_KEY
         # 切换到更稳定的 stable 路径
         self.base_url = "https://financialmodelingprep.com/stable"
 
-    def _get(self, endpoint: str, params: Optional[Dict] = None) -> Any:
-        if not self.api_key:
-            raise ValueError("FMP_API_KEY is not set")
+        # 复用同一个 Session: keep-alive 连接池 + gzip，避免每次请求重新握手
+        pool_size = pool_size or config.FMP_POOL_SIZE
+        retry = Retry(
+            total=config.FMP_MAX_RETRIES,
+            backoff_factor=config.FMP_BACKOFF_FACTOR,
+            status_forcelist=TRANSIENT_STATUS_CODES,
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
 
+        # 磁盘缓存: refresh=True 时只接受本次运行中写入的条目 (预热结果仍可复用)
+        self.cache = DiskCache(cache_dir or config.FMP_CACHE_DIR)
+        self.refresh_since = time.time() if refresh else None
+        # 离线模式: 只读磁盘缓存 (忽略有效期)，缓存缺失视为无数据
+        self.offline = offline
+        self._stats_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # 本次运行内的请求合并: 相同 (endpoint, params) 只请求一次，并发调用共享同一个 Future
+        self._lock = threading.Lock()
+        self._memo: Dict[str, Any] = {}
+        self._memo_keys_by_symbol: Dict[str, set] = {}
+        self._inflight: Dict[str, Future] = {}
+        self.coalesced = 0
+
+    @staticmethod
+    def _cache_key(endpoint: str, params: Dict) -> str:
+        # apikey 不参与缓存键，参数排序并统一转为字符串
+        normalized = {k: str(v) for k, v in params.items() if k != 'apikey'}
+        return f"{endpoint}?{json.dumps(normalized, sort_keys=True)}"
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            hits, misses = self.cache_hits, self.cache_misses
+        with self._lock:
+            coalesced = self.coalesced
+        return {"hits": hits, "misses": misses, "coalesced": coalesced}
+
+    def snapshot(self, ticker: str) -> "FinancialSnapshot":
+        return FinancialSnapshot(self, ticker)
+
+    def release(self, ticker: str) -> None:
+        """释放某只股票在本次运行内的合并结果 (分析完成后调用，避免内存随股票数增长)"""
+        with self._lock:
+            for key in self._memo_keys_by_symbol.pop(ticker, ()):
+                self._memo.pop(key, None)
+
+    def _get(self, endpoint: str, params: Optional[Dict] = None) -> Any:
         # 修复可变默认参数问题
         if params is None:
             params = {}
@@ -20,20 +91,126 @@ class FMPClient:
             # 拷贝一份，避免修改外部传入的字典
             params = params.copy()
 
+        cache_key = self._cache_key(endpoint, params)
+        with self._lock:
+            if cache_key in self._memo:
+                self.coalesced += 1
+                return self._memo[cache_key]
+            future = self._inflight.get(cache_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[cache_key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            # 同一请求已在进行中，等待其结果 (异常同样会传递过来)
+            return future.result()
+
+        try:
+            data = self._fetch(endpoint, params, cache_key)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(cache_key, None)
+            self._memo[cache_key] = data
+            symbol = params.get('symbol')
+            if symbol:
+                self._memo_keys_by_symbol.setdefault(symbol, set()).add(cache_key)
+        future.set_result(data)
+        return data
+
+    def _fetch(self, endpoint: str, params: Dict, cache_key: str) -> Any:
+        ttl = None if self.offline else config.FMP_CACHE_TTL.get(endpoint, config.FMP_CACHE_DEFAULT_TTL)
+        cached = self.cache.get(cache_key, ttl=ttl, not_before=self.refresh_since)
+        # 预热线程池并发调用，计数需加锁
+        with self._stats_lock:
+            if cached is not None:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if cached is not None:
+            return cached
+        if self.offline:
+            return None
+
+        if not self.api_key:
+            raise ValueError("FMP_API_KEY is not set")
+
         url = f"{self.base_url}/{endpoint}"
         params['apikey'] = self.api_key
 
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params, timeout=config.FMP_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise FMPUnavailableError(f"{endpoint}: {e}") from e
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            raise FMPUnavailableError(f"{endpoint}: HTTP {response.status_code} after {config.FMP_MAX_RETRIES} retries")
+
+        try:
             response.raise_for_status()
             data = response.json()
             if isinstance(data, list) and len(data) == 0:
                 return None
+            # FMP 的错误信息以 200 + {"Error Message": ...} 返回，不能写入缓存
+            if not (isinstance(data, dict) and 'Error Message' in data):
+                self.cache.set(cache_key, data)
             return data
         except Exception as e:
             print(f"Error fetching {endpoint}: {e}")
             return None
 
+    def get_quotes(self, tickers: List[str]) -> Dict[str, Dict]:
+        """
+        批量报价 (batch-quote)，按 FMP_BATCH_QUOTE_SIZE 分块请求
+
+        每只股票的报价同时写入单票 quote 缓存，之后的 get_quote 直接命中。
+        某个分块不可用 (连接错误、重试后仍 429 / 5xx) 时只记录并跳过该分块，
+        这些股票之后由 get_quote 逐只请求，错误按单只股票处理。
+        """
+        quotes = {}
+        size = config.FMP_BATCH_QUOTE_SIZE
+        for i in range(0, len(tickers), size):
+            chunk = tickers[i:i + size]
+            params = {'symbols': ','.join(chunk)}
+            try:
+                data = self._fetch("batch-quote", params, self._cache_key("batch-quote", params)) or []
+            except FMPUnavailableError as e:
+                print(f"Batch quote skipped for {len(chunk)} tickers ({chunk[0]}...): {e}")
+                continue
+            for q in data:
+                symbol = q.get('symbol')
+                if symbol:
+                    quotes[symbol] = q
+                    self.cache.set(self._cache_key("quote", {'symbol': symbol}), [q])
+        return quotes
+
+    def prefetch(self, tickers: List[str], loader: Callable[["FinancialSnapshot"], Any]) -> None:
+        """
+        多股票运行前并发预热数据
+
+        loader 对每只股票的 snapshot 发起所需请求，结果落入磁盘缓存后即释放内存，
+        正式分析时直接命中缓存。单只股票失败 (FMP 不可用、loader 内的任何异常) 只记录并跳过，
+        不影响其他股票；正式分析时会再次请求并按单只股票处理错误。
+        """
+        with ThreadPoolExecutor(max_workers=config.FMP_PREFETCH_WORKERS) as pool:
+            futures = {pool.submit(loader, self.snapshot(t)): t for t in tickers}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                try:
+                    future.result()
+                except FMPUnavailableError as e:
+                    print(f"[{ticker}] Prefetch skipped: {e}")
+                except Exception as e:
+                    print(f"[{ticker}] Prefetch failed ({type(e).__name__}): {e}")
+                finally:
+                    self.release(ticker)
+
     def get_quote(self, ticker: str) -> Optional[Dict]:
         # 统一使用 ?symbol= 格式
         data = self._get("quote", params={'symbol': ticker})
@@ -83,3 +260,86 @@ class FMPClient:
         if data:
             return data[0]
         return None
+
+    def get_historical_prices(self, ticker: str, start: str, end: str) -> List[Dict]:
+        """日线收盘价 [{'date': 'YYYY-MM-DD', 'price': ...}, ...]，按日期从新到旧"""
+        params = {'symbol': ticker, 'from': start, 'to': end}
+        return self._get("historical-price-eod/light", params=params) or []
+
+
+class FinancialSnapshot:
+    """
+    单只股票在本次运行内的财务数据视图
+
+    IronGate、analyze_ticker 和报告生成都从同一个 snapshot 读取，
+    底层经过 FMPClient 的请求合并，同一端点在一次运行内只请求一次。
+    """
+
+    def __init__(self, fmp: FMPClient, ticker: str):
+        self.fmp = fmp
+        self.ticker = ticker
+
+    @property
+    def quote(self) -> Optional[Dict]:
+        return self.fmp.get_quote(self.ticker)
+
+    @property
+    def profile(self) -> Optional[Dict]:
+        return self.fmp.get_profile(self.ticker)
+
+    @property
+    def ratios_ttm(self) -> Optional[Dict]:
+        return self.fmp.get_ratios_ttm(self.ticker)
+
+    def income_statement(self, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return self.fmp.get_income_statement(self.ticker, period=period, limit=limit)
+
+    def cash_flow_statement(self, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return self.fmp.get_cash_flow_statement(self.ticker, period=period, limit=limit)
+
+    def release(self) -> None:
+        self.fmp.release(self.ticker)
+
+
+class AsyncFMPClient:
+    """
+    FMPClient 的 asyncio 版本
+
+    提供与 FMPClient 相同的数据方法 (协程形式)，并通过信号量限制同时在途的请求数。
+    底层复用同步客户端的连接池、磁盘缓存与请求合并，请求在工作线程中执行。
+    """
+
+    def __init__(self, fmp: Optional[FMPClient] = None, max_concurrency: Optional[int] = None):
+        self.fmp = fmp or FMPClient()
+        self._semaphore = asyncio.Semaphore(max_concurrency or config.FMP_ASYNC_CONCURRENCY)
+
+    async def _call(self, func: Callable, *args, **kwargs) -> Any:
+        async with self._semaphore:
+            return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def get_quote(self, ticker: str) -> Optional[Dict]:
+        return await self._call(self.fmp.get_quote, ticker)
+
+    async def get_quotes(self, tickers: List[str]) -> Dict[str, Dict]:
+        return await self._call(self.fmp.get_quotes, tickers)
+
+    async def get_income_statement(self, ticker: str, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return await self._call(self.fmp.get_income_statement, ticker, period=period, limit=limit)
+
+    async def get_cash_flow_statement(self, ticker: str, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return await self._call(self.fmp.get_cash_flow_statement, ticker, period=period, limit=limit)
+
+    async def get_key_metrics(self, ticker: str, period: str = 'annual', limit: int = 1) -> List[Dict]:
+        return await self._call(self.fmp.get_key_metrics, ticker, period=period, limit=limit)
+
+    async def get_ratios_ttm(self, ticker: str) -> Optional[Dict]:
+        return await self._call(self.fmp.get_ratios_ttm, ticker)
+
+    async def get_financial_growth(self, ticker: str, limit: int = 5) -> List[Dict]:
+        return await self._call(self.fmp.get_financial_growth, ticker, limit=limit)
+
+    async def get_profile(self, ticker: str) -> Optional[Dict]:
+        return await self._call(self.fmp.get_profile, ticker)
+
+    async def get_historical_prices(self, ticker: str, start: str, end: str) -> List[Dict]:
+        return await self._call(self.fmp.get_historical_prices, ticker, start, end)
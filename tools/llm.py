@@ -1,35 +1,167 @@
-from typing import List, Optional, Dict, Any, Type
+from typing import List, Optional, Dict, Any, Type, Callable, Iterable, Set
 import json
+import threading
+import time
+from collections import Counter
+import openai
 from openai import OpenAI
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import config
+from tools.llm_cache import LLMCache, LLMReplayMissError
+from tools.batch import BatchRequest, LLMDeferredError
+from tools.telemetry import current_tags, llm_cost, telemetry
+
+# 可重试的错误: 限流、网络 / 超时、服务端 5xx
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
 
 class LLMClient:
-    def __init__(self):
-        self.client = OpenAI(base_url="https://openrouter.ai/api/v1",api_key=config.OPENAI_API_KEY)
-        self.model = "google/gemini-3-pro-preview" # or gpt-4-turbo
+    def __init__(self, cache: Optional[LLMCache] = None, replay: bool = False,
+                 routes: Optional[Dict[str, str]] = None, defer_routes: Optional[Iterable[str]] = None):
+        """
+        Args:
+            cache: 响应缓存 (默认使用 config.LLM_CACHE_PATH)
+            replay: 回放模式，只读缓存，未命中时抛出 LLMReplayMissError
+            routes: 覆盖 config.LLM_ROUTES 中的部分调用点档位 (如 {"kpi_extraction": "standard"})
+            defer_routes: 批量模式，这些调用点的结构化请求在缓存未命中时登记到批量队列并抛出 LLMDeferredError
+        """
+        self.client = OpenAI(base_url="https://openrouter.ai/api/v1",api_key=config.OPENAI_API_KEY,
+                             max_retries=0)  # 重试由 _request 负责，以便记录重试次数
+        # 未指定调用点 (route) 的请求使用默认档位
+        self.model = config.LLM_MODEL_TIERS[config.LLM_DEFAULT_TIER]
+        self.routes = {**config.LLM_ROUTES, **(routes or {})}
+        self.cache = cache or LLMCache(config.LLM_CACHE_PATH, ttl=config.LLM_CACHE_TTL)
+        self.replay = replay
+        # 同时在途的 LLM 请求上限 (所有线程共享；缓存命中不占用)
+        self._slots = threading.BoundedSemaphore(config.LLM_MAX_CONCURRENCY)
+        # 实际发出的请求数与 token 用量 (缓存命中不计)
+        self._usage = Counter()
+        self._usage_lock = threading.Lock()
+        # 批量模式: 待提交的请求 (按缓存键去重) 与批量失败、需改为同步请求的缓存键
+        self.defer_routes: Set[str] = set(defer_routes or ())
+        self._deferred: Dict[str, BatchRequest] = {}
+        self.batch_failed: Set[str] = set()
+
+    def model_for(self, route: Optional[str]) -> str:
+        """调用点 -> 档位 -> 模型 (未配置的调用点使用默认档位)"""
+        tier = self.routes.get(route or "", config.LLM_DEFAULT_TIER)
+        return config.LLM_MODEL_TIERS[tier]
+
+    def _record_usage(self, model: str, response: Any, latency: float, retries: int) -> None:
+        usage = getattr(response, "usage", None)
+        prompt_tokens = (usage.prompt_tokens or 0) if usage is not None else 0
+        completion_tokens = (usage.completion_tokens or 0) if usage is not None else 0
+        with self._usage_lock:
+            self._usage["calls"] += 1
+            self._usage["prompt_tokens"] += prompt_tokens
+            self._usage["completion_tokens"] += completion_tokens
+        telemetry.record("llm", model, latency, prompt_tokens=prompt_tokens,
+                         completion_tokens=completion_tokens, retries=retries,
+                         cost=llm_cost(model, prompt_tokens, completion_tokens))
+
+    def _request(self, create: Callable[..., Any], **kwargs) -> Any:
+        """
+        发送请求，限流 / 网络 / 5xx 错误按指数退避重试 (最多 LLM_MAX_RETRIES 次)
+
+        成功与最终失败都记入 telemetry (耗时包含排队与重试)。
+        """
+        start = time.perf_counter()
+        retries = 0
+        while True:
+            try:
+                with self._slots:
+                    response = create(**kwargs)
+                break
+            except RETRYABLE_ERRORS as e:
+                if retries >= config.LLM_MAX_RETRIES:
+                    telemetry.record("llm", kwargs["model"], time.perf_counter() - start, retries=retries,
+                                     error=type(e).__name__)
+                    raise
+                time.sleep(config.LLM_BACKOFF_FACTOR * (2 ** retries))
+                retries += 1
+            except Exception as e:
+                telemetry.record("llm", kwargs["model"], time.perf_counter() - start, retries=retries,
+                                 error=type(e).__name__)
+                raise
+        self._record_usage(kwargs["model"], response, time.perf_counter() - start, retries)
+        return response
+
+    def usage_stats(self) -> Dict[str, int]:
+        with self._usage_lock:
+            return {key: self._usage[key] for key in ("calls", "prompt_tokens", "completion_tokens")}
+
+    def take_deferred(self) -> List[BatchRequest]:
+        """取出并清空待提交的批量请求"""
+        with self._usage_lock:
+            requests = list(self._deferred.values())
+            self._deferred.clear()
+        return requests
+
+    def _cached(self, key: str, model: str) -> Optional[str]:
+        cached = self.cache.get(key)
+        if cached is None and self.replay:
+            raise LLMReplayMissError(f"No cached LLM response for request {key[:12]}")
+        if cached is not None:
+            telemetry.record("llm", model, 0.0, cached=True)
+        return cached
+
+    def analyze_text(self, prompt: str, system_prompt: str = "You are a financial analyst.",
+                     route: Optional[str] = None) -> str:
+        """
+        Args:
+            route: 调用点，决定使用的模型档位 (见 config.LLM_ROUTES)
+        """
+        temperature = 0.2
+        model = self.model_for(route)
+        key = LLMCache.make_key(model, system_prompt, prompt, temperature)
+        cached = self._cached(key, model)
+        if cached is not None:
+            return cached
 
-    def analyze_text(self, prompt: str, system_prompt: str = "You are a financial analyst.") -> str:
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            response = self._request(
+                self.client.chat.completions.create,
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0.2
+                temperature=temperature
             )
             if response and response.choices and len(response.choices) > 0:
-                return response.choices[0].message.content or ""
+                content = response.choices[0].message.content or ""
+                # 空响应不缓存，下次重新请求
+                if content:
+                    request = {"system_prompt": system_prompt, "prompt": prompt, "temperature": temperature}
+                    self.cache.set(key, model, "text", content, route=route or "", request=request)
+                return content
             return ""
         except Exception as e:
             print(f"LLM Error: {e}")
             return ""
 
-    def extract_structured_data(self, prompt: str, schema: Type[BaseModel], system_prompt: str = "You are a data extractor.") -> Optional[BaseModel]:
+    def extract_structured_data(self, prompt: str, schema: Type[BaseModel], system_prompt: str = "You are a data extractor.",
+                                route: Optional[str] = None) -> Optional[BaseModel]:
+        model = self.model_for(route)
+        key = LLMCache.make_key(model, system_prompt, prompt, None, schema.model_json_schema())
+        cached = self._cached(key, model)
+        if cached is not None:
+            try:
+                return schema.model_validate_json(cached)
+            except ValidationError:
+                # schema 变化后旧结果不再合法，视为未命中
+                if self.replay:
+                    raise LLMReplayMissError(f"Cached LLM response for request {key[:12]} no longer matches {schema.__name__}")
+
+        if route in self.defer_routes and key not in self.batch_failed:
+            with self._usage_lock:
+                self._deferred[key] = BatchRequest(custom_id=key, model=model, route=route, system_prompt=system_prompt,
+                                                   prompt=prompt, schema=schema, tags=current_tags())
+            raise LLMDeferredError(f"{route} request {key[:12]} deferred to batch")
+
         try:
-            completion = self.client.beta.chat.completions.parse(
-                model=self.model,
+            completion = self._request(
+                self.client.beta.chat.completions.parse,
+                model=model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt},
@@ -37,9 +169,13 @@ class LLMClient:
                 response_format=schema,
             )
             if completion and completion.choices and len(completion.choices) > 0:
-                return completion.choices[0].message.parsed
+                parsed = completion.choices[0].message.parsed
+                if parsed is not None:
+                    request = {"system_prompt": system_prompt, "prompt": prompt, "schema": schema.__name__}
+                    self.cache.set(key, model, "structured", parsed.model_dump_json(), route=route or "",
+                                   request=request)
+                return parsed
             return None
         except Exception as e:
             print(f"LLM Structure Error: {e}")
             return None
-
@@ -0,0 +1,119 @@
+"""
+LLM 响应缓存 (SQLite)
+====================
+以 hash(model, system prompt, user prompt, temperature, schema) 为键保存响应：
+相同请求 (如 --force 重跑同一只股票、重新翻译未变化的报告) 不再调用 API。
+结构化结果以校验后的 JSON 保存，读取时按 schema 重新校验。
+同时保存调用点 (route) 与请求内容，供 route_eval.py 在其他模型档位上回放。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class LLMReplayMissError(Exception):
+    """回放模式下缓存未命中 (回放模式禁止发起真实 LLM 请求)"""
+
+
+class LLMCache:
+    """
+    内容寻址的 LLM 响应缓存
+
+    同一进程内多线程共享一个连接，写入串行化；WAL 模式下多个进程可同时读取。
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """
+        Args:
+            path: SQLite 文件路径
+            ttl: 有效期 (秒)，None 表示永不过期
+        """
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                route TEXT NOT NULL DEFAULT '',
+                request TEXT
+            )
+        """)
+        # 旧版本缓存文件没有 route / request 列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "route" not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN route TEXT NOT NULL DEFAULT ''")
+        if "request" not in columns:
+            self._conn.execute("ALTER TABLE responses ADD COLUMN request TEXT")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, prompt: str, temperature: Optional[float],
+                 schema: Optional[Dict[str, Any]] = None) -> str:
+        """请求内容的稳定哈希 (schema 为 JSON Schema，按键排序后参与哈希)"""
+        payload = json.dumps([model, system_prompt, prompt, temperature, schema], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, model: str, kind: str, response: str, route: str = "",
+            request: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Args:
+            kind: "text" 或 "structured"
+            response: 文本响应或结构化结果的 JSON
+            route: 调用点 (见 config.LLM_ROUTES)
+            request: 请求内容 (system_prompt / prompt / temperature / schema 名称)，用于回放评估
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, kind, response, created_at, route, request) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, kind, response, time.time(), route,
+                 json.dumps(request, ensure_ascii=False) if request is not None else None))
+            self._conn.commit()
+
+    def recorded(self, model: Optional[str] = None, routes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        已记录请求内容的缓存条目 (按写入时间排序)
+
+        Args:
+            model: 只返回该模型的响应
+            routes: 只返回这些调用点的响应
+        """
+        sql = "SELECT key, model, kind, response, route, request FROM responses WHERE request IS NOT NULL"
+        params: List[Any] = []
+        if model:
+            sql += " AND model = ?"
+            params.append(model)
+        if routes:
+            sql += f" AND route IN ({', '.join('?' * len(routes))})"
+            params.extend(routes)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY created_at", params).fetchall()
+        return [{"key": key, "model": model, "kind": kind, "response": response, "route": route,
+                 "request": json.loads(request)}
+                for key, model, kind, response, route, request in rows]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,97 @@
+"""
+分析结果流式输出 (Streaming Results)
+===================================
+每只股票完成后立即把 CompanyData 以一行 JSON 追加到 results.jsonl (orjson 序列化，逐行 flush)，
+内存中不保留结果，下游可以 `tail -f` 实时读取。
+
+运行结束时可选压缩为原有的 results.json 格式 (按输入顺序排列的缩进 JSON 数组):
+先扫描一遍 JSONL 建立 ticker -> 行偏移的索引 (同一 ticker 多次出现时以最后一次为准)，
+再按输入顺序逐条 seek 读取、写出，内存只占用偏移索引。
+"""
+
+import os
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import orjson
+
+
+class ResultsWriter:
+    """
+    JSONL 追加写入 (线程安全)
+
+    用法:
+        with ResultsWriter("results.jsonl") as writer:
+            writer.write(data.model_dump())
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        """
+        Args:
+            append: 保留已有内容继续追加 (默认清空，开始新的一次运行)
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab" if append else "wb")
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        with self._lock:
+            self._file.write(line)
+            # 逐行 flush: 中断时已完成的股票不丢失，下游可实时读取
+            self._file.flush()
+            self.written += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def index_offsets(path: str, key: str = "ticker") -> Dict[str, int]:
+    """JSONL 中每个 key 最后一次出现的行偏移 (不完整的末行，如中断时写了一半，会被跳过)"""
+    offsets: Dict[str, int] = {}
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.endswith(b"\n"):
+                try:
+                    offsets[orjson.loads(line)[key]] = offset
+                except (orjson.JSONDecodeError, KeyError, TypeError):
+                    pass
+            offset += len(line)
+    return offsets
+
+
+def compact(jsonl_path: str, output_path: str, order: Optional[Iterable[str]] = None) -> int:
+    """
+    把 JSONL 压缩为 results.json 格式
+
+    Args:
+        order: 输出顺序 (如输入的股票列表)；不在 JSONL 中的跳过，None 时按首次写入的顺序
+
+    Returns:
+        写出的条数
+    """
+    offsets = index_offsets(jsonl_path)
+    keys = list(offsets) if order is None else [k for k in order if k in offsets]
+    tmp_path = f"{output_path}.tmp"
+    with open(jsonl_path, "rb") as source, open(tmp_path, "wb") as out:
+        out.write(b"[" if keys else b"[]")
+        for i, key in enumerate(keys):
+            source.seek(offsets[key])
+            record = orjson.loads(source.readline())
+            # 与 json.dump(indent=2) 的数组格式一致: 每个元素整体缩进两格
+            body = orjson.dumps(record, option=orjson.OPT_INDENT_2).replace(b"\n", b"\n  ")
+            out.write((b",\n  " if i else b"\n  ") + body)
+        if keys:
+            out.write(b"\n]")
+    os.replace(tmp_path, output_path)
+    return len(keys)
@@ -1,16 +1,126 @@
+import json
+import re
+import threading
+import time
+import requests
 from tavily import TavilyClient
+from tavily.errors import TimeoutError as TavilyTimeoutError
 import config
-from typing import List, Dict
+from typing import List, Dict, Optional
+from tools.cache import DiskCache
+from tools.doc_index import DocumentIndex
+from tools.telemetry import telemetry
+
+# 可重试的错误: 超时、网络错误、HTTP 5xx (额度不足 / 鉴权 / 参数错误等 4xx 不重试)
+RETRYABLE_ERRORS = (TavilyTimeoutError, requests.exceptions.RequestException)
+
+
+def _retryable(error: Exception) -> bool:
+    """HTTPError 也是 RequestException: Tavily 未映射的 4xx 经 raise_for_status 抛出，只重试 5xx"""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class TokenBucket:
+    """令牌桶限速: 平均每秒 rate 个请求，允许 capacity 个突发"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def normalize_query(query: str) -> str:
+    """缓存键用的查询规范化: 小写、去除首尾标点、合并空白"""
+    return re.sub(r"\s+", " ", query.lower()).strip(" \t\n.,;:!?\"'")
+
 
 class SearchClient:
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None, refresh: bool = False,
+                 index: Optional[DocumentIndex] = None):
+        """
+        Args:
+            cache_dir: 搜索结果磁盘缓存目录 (默认 config.SEARCH_CACHE_DIR)
+            refresh: 只接受本次运行中写入的缓存条目 (本地文档索引同样只用本次取回的文档)
+            index: 已取回文档的本地全文索引 (默认 config.DOC_INDEX_PATH)
+        """
         self.client = TavilyClient(api_key=config.TAVILY_API_KEY)
+        # 同时在途的 Tavily 请求上限 (所有线程共享)
+        self._slots = threading.BoundedSemaphore(config.SEARCH_MAX_CONCURRENCY)
+        # 请求速率上限 (所有线程共享；缓存命中不消耗令牌)
+        self._bucket = TokenBucket(config.SEARCH_RATE_PER_SECOND, config.SEARCH_RATE_BURST)
+        # 磁盘缓存: 键为规范化查询 + 深度 + 结果数，跨股票、跨运行复用
+        self.cache = DiskCache(cache_dir or config.SEARCH_CACHE_DIR)
+        self.refresh_since = time.time() if refresh else None
+        self.index = index or DocumentIndex(config.DOC_INDEX_PATH)
+        self._stats_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @staticmethod
+    def _cache_key(query: str, search_depth: str, max_results: int) -> str:
+        return json.dumps([normalize_query(query), search_depth, max_results])
 
-    def search(self, query: str, max_results: int = 5) -> List[Dict]:
+    def cache_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return {"hits": self.cache_hits, "misses": self.cache_misses}
+
+    def search(self, query: str, max_results: int = 5, search_depth: str = "advanced",
+               query_class: Optional[str] = None) -> List[Dict]:
+        """
+        Args:
+            query_class: 查询类别 (如 "insider" / "moat")，决定缓存有效期 (见 config.SEARCH_CACHE_TTL)
+        """
+        cache_key = self._cache_key(query, search_depth, max_results)
+        ttl = config.SEARCH_CACHE_TTL.get(query_class, config.SEARCH_CACHE_DEFAULT_TTL)
+        cached = self.cache.get(cache_key, ttl=ttl, not_before=self.refresh_since)
+        with self._stats_lock:
+            if cached is not None:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        if cached is not None:
+            telemetry.record("search", search_depth, 0.0, cached=True)
+            return cached
+
+        start = time.perf_counter()
+        retries = 0
         try:
-            response = self.client.search(query, max_results=max_results, search_depth="advanced")
-            return response.get('results', [])
+            while True:
+                try:
+                    self._bucket.acquire()
+                    with self._slots:
+                        response = self.client.search(query, max_results=max_results, search_depth=search_depth)
+                    break
+                except RETRYABLE_ERRORS as e:
+                    if not _retryable(e) or retries >= config.SEARCH_MAX_RETRIES:
+                        raise
+                    time.sleep(config.SEARCH_BACKOFF_FACTOR * (2 ** retries))
+                    retries += 1
+            telemetry.record("search", search_depth, time.perf_counter() - start, retries=retries,
+                             cost=config.SEARCH_COST_PER_CALL.get(search_depth, 0.0))
+            results = response.get('results', [])
+            # 空结果不缓存，下次重新搜索
+            if results:
+                self.cache.set(cache_key, results)
+            return results
         except Exception as e:
+            telemetry.record("search", search_depth, time.perf_counter() - start, retries=retries,
+                             error=type(e).__name__)
             print(f"Search Error: {e}")
             return []
-
@@ -0,0 +1,126 @@
+"""
+自适应搜索深度 (Adaptive Search Depth)
+====================================
+先用便宜、快速的 basic 深度搜索；结果"单薄"时才升级为 advanced:
+
+- few_results: 结果数少于 SEARCH_MIN_RESULTS
+- low_score: 最高相关性分数 (Tavily score) 低于 SEARCH_MIN_SCORE
+- not_found: 调用方 (KPI 提取) 在 basic 结果中找不到所需数据，显式要求升级
+
+请求速率由 SearchClient 的令牌桶限制，并发由调用方的线程池决定。
+每次查询的深度、升级原因与耗时记入 search_trace (main 在运行结束时输出汇总)。
+"""
+
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import config
+from tools.search import SearchClient, normalize_query
+from tools.telemetry import current_tags
+
+
+@dataclass
+class SearchTraceEntry:
+    ticker: str
+    query_class: str
+    query: str
+    depth: str
+    reason: Optional[str]       # 升级原因；basic 搜索为 None
+    latency: float
+    results: int
+    top_score: Optional[float]
+
+
+class SearchTrace:
+    """进程内的搜索深度记录 (线程安全)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries: List[SearchTraceEntry] = []
+
+    def record(self, entry: SearchTraceEntry) -> None:
+        with self._lock:
+            self.entries.append(entry)
+
+    def summary(self) -> Dict[str, object]:
+        with self._lock:
+            entries = list(self.entries)
+        seconds = Counter()
+        for entry in entries:
+            seconds[entry.depth] += entry.latency
+        return {
+            'searches': Counter(entry.depth for entry in entries),
+            'escalations': Counter(entry.reason for entry in entries if entry.reason),
+            'seconds': {depth: round(value, 3) for depth, value in seconds.items()},
+        }
+
+    def to_list(self) -> List[Dict]:
+        with self._lock:
+            return [asdict(entry) for entry in self.entries]
+
+
+# 进程内共享的搜索深度记录 (main 在运行结束时输出)
+search_trace = SearchTrace()
+
+
+class SearchExecutor:
+    """
+    用法:
+        executor = SearchExecutor(search_client)
+        results = executor.search(query, max_results=3, query_class="moat")
+        if not_found and executor.can_escalate(query):
+            results = executor.escalate(query, max_results=3, query_class="kpi", reason="not_found")
+    """
+
+    def __init__(self, client: SearchClient, initial_depth: Optional[str] = None,
+                 escalation_depth: Optional[str] = None):
+        self.client = client
+        self.initial_depth = initial_depth or config.SEARCH_INITIAL_DEPTH
+        self.escalation_depth = escalation_depth or config.SEARCH_ESCALATION_DEPTH
+        # 本实例中每个查询最后使用的深度 (避免重复升级)
+        self._depths: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def thin_reason(results: List[Dict]) -> Optional[str]:
+        """结果单薄的原因；足够时返回 None"""
+        if len(results) < config.SEARCH_MIN_RESULTS:
+            return "few_results"
+        scores = [r.get('score') for r in results if r.get('score') is not None]
+        if scores and max(scores) < config.SEARCH_MIN_SCORE:
+            return "low_score"
+        return None
+
+    def _run(self, query: str, max_results: int, query_class: Optional[str], depth: str,
+             reason: Optional[str]) -> List[Dict]:
+        start = time.perf_counter()
+        results = self.client.search(query, max_results=max_results, search_depth=depth, query_class=query_class)
+        scores = [r.get('score') for r in results if r.get('score') is not None]
+        search_trace.record(SearchTraceEntry(
+            ticker=current_tags().get("ticker", ""), query_class=query_class or "", query=query, depth=depth,
+            reason=reason, latency=round(time.perf_counter() - start, 3), results=len(results),
+            top_score=max(scores) if scores else None))
+        with self._lock:
+            self._depths[normalize_query(query)] = depth
+        return results
+
+    def can_escalate(self, query: str) -> bool:
+        with self._lock:
+            return self._depths.get(normalize_query(query)) != self.escalation_depth
+
+    def escalate(self, query: str, max_results: int = 5, query_class: Optional[str] = None,
+                 reason: str = "not_found") -> List[Dict]:
+        return self._run(query, max_results, query_class, self.escalation_depth, reason)
+
+    def search(self, query: str, max_results: int = 5, query_class: Optional[str] = None) -> List[Dict]:
+        results = self._run(query, max_results, query_class, self.initial_depth, None)
+        reason = self.thin_reason(results)
+        if reason and self.initial_depth != self.escalation_depth:
+            escalated = self.escalate(query, max_results, query_class, reason)
+            # 升级后仍无结果时保留 basic 结果
+            if escalated:
+                return escalated
+        return results
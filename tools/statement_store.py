@@ -0,0 +1,166 @@
+"""
+本地财报列式存储 (Parquet)
+==========================
+每只股票一个 Parquet 文件，每行对应一个 (报告类型, 报告期)，只保存各阶段实际用到的字段。
+刷新时只拉取比已存数据更新的报告期，历史随运行次数自然增长；读取完全不依赖网络。
+"""
+
+import math
+import os
+from datetime import date
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+import config
+from tools.fmp import FMPClient
+
+# 利润表字段 / 现金流量表字段 (netIncome 用于回测时按时点重建 TTM 净利率)
+INCOME_FIELDS = ['revenue', 'grossProfit', 'operatingExpenses', 'eps', 'weightedAverageShsOutDil', 'netIncome']
+CASH_FLOW_FIELDS = ['stockBasedCompensation']
+# FMP 以整数返回的金额/股数字段，读取时还原为 int，保证与直接请求 FMP 的计算结果一致
+INTEGER_FIELDS = {'revenue', 'grossProfit', 'operatingExpenses', 'weightedAverageShsOutDil', 'netIncome',
+                  'stockBasedCompensation'}
+KEY_COLUMNS = ['symbol', 'period_type', 'date', 'filingDate', 'period']
+COLUMNS = KEY_COLUMNS + INCOME_FIELDS + CASH_FLOW_FIELDS
+
+# 每个报告期的大致天数，用于估算自上次入库后新出现了多少期
+PERIOD_DAYS = {'quarter': 91, 'annual': 365}
+
+
+class StatementStore:
+    """
+    财报本地存储
+
+    职责：
+    - 首次入库时回填 STATEMENT_STORE_BACKFILL 指定的期数
+    - 之后只请求已存最新报告期之后的数据 (多拉一期用于核对重述)
+    - 以 FMP 相同的字典格式 (从新到旧) 提供给 IronGate 等调用方
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or config.STATEMENT_STORE_DIR
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.root, f"{ticker}.parquet")
+
+    def load(self, ticker: str) -> pd.DataFrame:
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=COLUMNS)
+        df = pd.read_parquet(path)
+        if set(COLUMNS) - set(df.columns):
+            # 旧版本存储缺少新增字段: 视为空，下次刷新时整体回填
+            return pd.DataFrame(columns=COLUMNS)
+        return df
+
+    def _save(self, ticker: str, df: pd.DataFrame) -> None:
+        path = self._path(ticker)
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def refresh(self, fmp: FMPClient, ticker: str, today: Optional[date] = None,
+                backfill: Optional[Dict[str, int]] = None) -> int:
+        """
+        增量刷新某只股票的财报
+
+        Args:
+            fmp: FMP 客户端
+            ticker: 股票代码
+            today: 当前日期 (默认今天，便于回放)
+            backfill: 各报告类型至少保留的期数 (默认 STATEMENT_STORE_BACKFILL)；
+                      已存期数不足时整体重新回填 (如回测需要更长历史)
+
+        Returns:
+            新写入的报告期行数
+        """
+        today = today or date.today()
+        backfill = backfill or config.STATEMENT_STORE_BACKFILL
+        stored = self.load(ticker)
+        frames = [stored]
+        new_rows = 0
+
+        for period_type, days in PERIOD_DAYS.items():
+            existing = stored[stored['period_type'] == period_type]
+            if len(existing) < backfill[period_type]:
+                # 首次入库或历史不足 (上市时间短的公司会反复走这里，由 FMP 磁盘缓存吸收重复请求)
+                limit = backfill[period_type]
+            else:
+                latest = date.fromisoformat(existing['date'].max())
+                elapsed_periods = (today - latest).days // days
+                if elapsed_periods == 0:
+                    continue
+                # 多拉一期，与已存最新期重叠，捕获重述
+                limit = elapsed_periods + 1
+
+            fetched = self._fetch(fmp, ticker, period_type, limit)
+            if fetched.empty:
+                continue
+            if not existing.empty:
+                new_rows += int((fetched['date'] > existing['date'].max()).sum())
+            else:
+                new_rows += len(fetched)
+            frames.append(fetched)
+
+        if len(frames) == 1:
+            return 0
+
+        merged = pd.concat([f for f in frames if not f.empty], ignore_index=True)
+        # 同一报告期以最新拉取的数据为准
+        merged = merged.drop_duplicates(subset=['period_type', 'date'], keep='last')
+        merged = merged.sort_values(['period_type', 'date'], ascending=[True, False]).reset_index(drop=True)
+        self._save(ticker, merged[COLUMNS])
+        return new_rows
+
+    def _fetch(self, fmp: FMPClient, ticker: str, period_type: str, limit: int) -> pd.DataFrame:
+        income = fmp.get_income_statement(ticker, period=period_type, limit=limit)
+        if not income:
+            return pd.DataFrame(columns=COLUMNS)
+        cash_flow = fmp.get_cash_flow_statement(ticker, period=period_type, limit=limit)
+        sbc_by_date = {row.get('date'): row.get('stockBasedCompensation') for row in cash_flow}
+
+        rows = []
+        for row in income:
+            record = {
+                'symbol': ticker,
+                'period_type': period_type,
+                'date': row.get('date'),
+                # stable 路径为 filingDate，旧版 v3 路径为 fillingDate
+                'filingDate': row.get('filingDate') or row.get('fillingDate'),
+                'period': row.get('period'),
+            }
+            for field in INCOME_FIELDS:
+                record[field] = row.get(field)
+            record['stockBasedCompensation'] = sbc_by_date.get(row.get('date'))
+            rows.append(record)
+
+        df = pd.DataFrame(rows, columns=COLUMNS)
+        for field in INCOME_FIELDS + CASH_FLOW_FIELDS:
+            df[field] = pd.to_numeric(df[field], errors='coerce').astype('float64')
+        return df
+
+    def _records(self, ticker: str, period_type: str, limit: int, fields: List[str]) -> List[Dict]:
+        df = self.load(ticker)
+        df = df[df['period_type'] == period_type].sort_values('date', ascending=False)
+        df = df.dropna(subset=fields, how='all').head(limit)
+
+        records = []
+        for row in df[['date', 'filingDate', 'period'] + fields].to_dict('records'):
+            record = {}
+            for key, value in row.items():
+                # 缺失值直接省略，保持与 FMP 响应一致 (调用方用 .get(field, 0) 兜底)
+                if isinstance(value, float) and math.isnan(value):
+                    continue
+                if key in INTEGER_FIELDS and value.is_integer():
+                    value = int(value)
+                record[key] = value
+            records.append(record)
+        return records
+
+    def income_statement(self, ticker: str, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return self._records(ticker, period, limit, INCOME_FIELDS)
+
+    def cash_flow_statement(self, ticker: str, period: str = 'annual', limit: int = 5) -> List[Dict]:
+        return self._records(ticker, period, limit, CASH_FLOW_FIELDS)
@@ -0,0 +1,154 @@
+"""
+LLM / 搜索调用埋点 (Per-call Telemetry)
+=====================================
+每次 LLM 与 Tavily 调用记录: 耗时、prompt / completion tokens、估算费用、重试次数、是否命中缓存，
+并带上调用时所处的标签 (ticker / phase / purpose)。
+
+标签通过 contextvars 传递:
+    with tag(ticker="DDOG", phase="intelligence"):
+        pool.submit(bind(task, purpose="moat"), ...)   # 线程池任务需用 bind 显式携带标签
+
+运行结束时 main 输出按阶段汇总的表格，并把全部调用明细写入 config.TELEMETRY_PATH (JSON)。
+"""
+
+import functools
+import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import config
+
+_tags: ContextVar[Dict[str, str]] = ContextVar("telemetry_tags", default={})
+
+
+@contextmanager
+def tag(**tags: str):
+    """在当前上下文中叠加标签 (退出时恢复)"""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> Dict[str, str]:
+    return dict(_tags.get())
+
+
+def bind(fn: Callable, **tags: str) -> Callable:
+    """
+    把当前标签 (及额外标签) 绑定到 fn
+
+    线程池的工作线程不继承提交方的 contextvars，提交任务前用 bind 包装即可沿用调用方的标签。
+    """
+    bound = {**_tags.get(), **tags}
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        with tag(**bound):
+            return fn(*args, **kwargs)
+    return run
+
+
+def llm_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """按 config.LLM_PRICING (美元 / 百万 token) 估算费用；未配置价格的模型记为 0"""
+    input_price, output_price = config.LLM_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class CallRecord:
+    provider: str               # "llm" / "llm_batch" / "search"
+    model: str                  # LLM 模型名；搜索为 search_depth
+    ticker: str
+    phase: str
+    purpose: str
+    latency: float              # 秒 (含重试与排队等待)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0           # 估算费用 (美元)
+    retries: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+
+
+class Telemetry:
+    """进程内的调用记录 (线程安全)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records: List[CallRecord] = []
+
+    def record(self, provider: str, model: str, latency: float, **fields) -> CallRecord:
+        """记录一次调用，ticker / phase / purpose 取自当前标签"""
+        tags = _tags.get()
+        record = CallRecord(provider=provider, model=model, latency=latency,
+                            ticker=tags.get("ticker", ""), phase=tags.get("phase", ""),
+                            purpose=tags.get("purpose", ""), **fields)
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def aggregate(self, keys: Iterable[str]) -> List[Dict]:
+        """按给定字段分组汇总 (调用数、缓存命中、耗时、tokens、费用、重试、错误)"""
+        keys = tuple(keys)
+        groups: Dict[Tuple, List[CallRecord]] = defaultdict(list)
+        with self._lock:
+            for record in self.records:
+                groups[tuple(getattr(record, key) for key in keys)].append(record)
+
+        rows = []
+        for group, records in sorted(groups.items()):
+            live = [r for r in records if not r.cached]
+            rows.append(dict(
+                zip(keys, group),
+                calls=len(live),
+                cached=len(records) - len(live),
+                seconds=round(sum(r.latency for r in live), 3),
+                max_seconds=round(max((r.latency for r in live), default=0.0), 3),
+                prompt_tokens=sum(r.prompt_tokens for r in live),
+                completion_tokens=sum(r.completion_tokens for r in live),
+                cost=round(sum(r.cost for r in live), 6),
+                retries=sum(r.retries for r in live),
+                errors=sum(1 for r in live if r.error),
+            ))
+        return rows
+
+    def print_summary(self) -> None:
+        rows = self.aggregate(("provider", "phase", "purpose"))
+        if not rows:
+            return
+        print(f"\n{'provider':<10}{'phase':<14}{'purpose':<24}{'calls':>6}{'cached':>7}{'seconds':>9}"
+              f"{'max s':>7}{'prompt tok':>11}{'compl tok':>10}{'cost $':>9}{'retries':>8}{'errors':>7}")
+        for row in rows:
+            print(f"{row['provider']:<10}{row['phase'][:13]:<14}{row['purpose'][:23]:<24}{row['calls']:>6}"
+                  f"{row['cached']:>7}{row['seconds']:>9.1f}{row['max_seconds']:>7.1f}{row['prompt_tokens']:>11}"
+                  f"{row['completion_tokens']:>10}{row['cost']:>9.3f}{row['retries']:>8}{row['errors']:>7}")
+        total = self.aggregate(())[0]
+        print(f"{'total':<48}{total['calls']:>6}{total['cached']:>7}{total['seconds']:>9.1f}{'':>7}"
+              f"{total['prompt_tokens']:>11}{total['completion_tokens']:>10}{total['cost']:>9.3f}"
+              f"{total['retries']:>8}{total['errors']:>7}")
+
+    def save(self, path: Optional[str] = None, extra: Optional[Dict] = None) -> str:
+        """写出汇总与全部调用明细 (JSON，extra 为附加的明细段落)，返回文件路径"""
+        path = path or config.TELEMETRY_PATH
+        with self._lock:
+            calls = [asdict(record) for record in self.records]
+        payload = {
+            'total': self.aggregate(())[0] if calls else {},
+            'by_phase': self.aggregate(("provider", "phase", "purpose")),
+            'by_ticker': self.aggregate(("provider", "ticker")),
+            'calls': calls,
+            **(extra or {}),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        return path
+
+
+# 进程内共享的调用记录 (main 在运行结束时输出)
+telemetry = Telemetry()
@@ -0,0 +1,200 @@
+"""
+报告翻译 (按章节并发 + 缓存)
+==========================
+- 报告按 Markdown 标题切分为章节，各章节并发翻译后按原顺序拼接
+- 模板文字 (标题、字段标签、Passed/Failed 等固定取值) 直接查双语对照表，不经过 LLM
+- 含自由文本的章节才调用 LLM，译文按章节内容哈希缓存：内容未变的章节不再产生 LLM 请求
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import config
+from tools.cache import DiskCache
+from tools.llm import LLMClient
+from tools.telemetry import bind
+
+# 章节标题
+HEADINGS = {
+    "Executive Summary": "执行摘要",
+    "Phase 1: The Iron Gate & Hygiene": "第一阶段：铁律与财务健康",
+    "Phase 2: DNA & KPIs": "第二阶段：商业模式与核心 KPI",
+    "Phase 3: Blue Sky & Intelligence": "第三阶段：蓝天与情报",
+    "Blue Sky (Option Value)": "蓝天 (期权价值)",
+    "Catalyst Calendar": "催化剂日历",
+    "Core Intelligence": "核心情报",
+    "Phase 4: Tribunal Logic": "第四阶段：裁决逻辑",
+}
+
+# 列表项标签 (* **Label**: value)
+LABELS = {
+    "Status": "状态",
+    "CAGR": "复合年均增长率 (CAGR)",
+    "Current Q Growth": "当季同比增速",
+    "Dilution Shield": "稀释盾",
+    "PEG Ratio": "PEG (市盈率相对盈利增长比率)",
+    "Gross Margin Slope": "毛利率斜率",
+    "Business Model": "商业模式",
+    "Key KPIs": "核心 KPI",
+    "Bear Case Hook": "看空逻辑",
+    "R&D Effectiveness": "研发有效性",
+    "TAM Expansion": "TAM 扩张能力",
+    "Upcoming Events": "近期事件",
+    "Variant Perception": "预期差",
+    "KPI Performance": "KPI 表现",
+    "Management": "管理层",
+    "Moat": "护城河",
+    "Insider Activity": "内部人交易",
+    "Dislocation": "价格错位",
+    "Growth Thesis Intact": "增长逻辑完好",
+    "Valuation Fit": "估值匹配",
+    "True Discount": "真折价",
+}
+
+# 固定取值
+VALUES = {
+    "Passed": "通过",
+    "Failed": "未通过",
+    "True": "是",
+    "False": "否",
+    "N/A": "N/A",
+    "High": "高",
+    "Medium": "中",
+    "Low": "低",
+    "SaaS": "SaaS",
+    "Consumption": "按量计费 (Consumption)",
+    "Marketplace": "平台市场 (Marketplace)",
+    "Advertising": "广告 (Advertising)",
+    "Hardware": "硬件 (Hardware)",
+    "Other": "其他",
+}
+
+# 整行模板 (正则 -> 译文，{0} {1} 为捕获组)
+LINE_PATTERNS = [
+    (re.compile(r"^# MGP V3\.2 Analysis: (\S+)$"), "# MGP V3.2 分析报告: {0}"),
+    (re.compile(r"^\*\*Date:\*\* (.+)$"), "**日期:** {0}"),
+    (re.compile(r"^\*\*Verdict:\*\* (.+) \((\w+) Confidence\)$"), "**评级:** {0} (置信度: {1})"),
+    (re.compile(r"^\*\*Price:\*\* (.+) \| \*\*Market Cap:\*\* (.+)$"), "**股价:** {0} | **市值:** {1}"),
+    (re.compile(r"^\* \*\*SBC/Rev Ratio\*\*: (.+) \(Threshold: <(.+)\)$"), "* **SBC/营收比**: {0} (阈值: <{1})"),
+    (re.compile(r"^\*Generated by MGP V3\.2 Auto-Analyst\*$"), "*由 MGP V3.2 自动分析系统生成*"),
+]
+
+_HEADING = re.compile(r"^(#+) (.+)$")
+_BULLET = re.compile(r"^\* \*\*(.+?)\*\*:\s?(.*)$")
+# 数字、金额、百分比等无需翻译的取值
+_NUMERIC = re.compile(r"^[\s$%\-+.,:\dBMKx/]*$")
+
+
+def _value(text: str) -> Optional[str]:
+    """固定取值或数字直接返回译文；自由文本返回 None"""
+    text = text.strip()
+    if text in VALUES:
+        return VALUES[text]
+    if _NUMERIC.match(text):
+        return text
+    return None
+
+
+def translate_static(line: str) -> Tuple[str, bool]:
+    """
+    用对照表翻译一行
+
+    Returns:
+        (译文, 是否完整翻译)；未完整翻译时返回已替换标签的部分译文，其余内容交给 LLM
+    """
+    if not line.strip() or line.strip() == "---":
+        return line, True
+    for pattern, template in LINE_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            groups = [_value(g) or g for g in match.groups()]
+            return template.format(*groups), True
+
+    heading = _HEADING.match(line)
+    if heading and heading.group(2) in HEADINGS:
+        return f"{heading.group(1)} {HEADINGS[heading.group(2)]}", True
+
+    bullet = _BULLET.match(line)
+    if bullet and bullet.group(1) in LABELS:
+        label = LABELS[bullet.group(1)]
+        value = _value(bullet.group(2)) if bullet.group(2) else ""
+        if value is not None:
+            return f"* **{label}**: {value}".rstrip(), True
+        return f"* **{label}**: {bullet.group(2)}", False
+    return line, False
+
+
+def split_sections(report: str) -> List[str]:
+    """按 Markdown 标题切分 (标题行归属其后的章节)"""
+    sections, current = [], []
+    for line in report.split("\n"):
+        if _HEADING.match(line) and current:
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    sections.append("\n".join(current))
+    return sections
+
+
+class ReportTranslator:
+    """
+    用法:
+        translated = ReportTranslator(llm).translate(report_content)
+    """
+
+    SYSTEM_PROMPT = "你是一位专业的金融翻译，擅长将英文投资研报翻译成地道的中文。"
+
+    def __init__(self, llm: LLMClient, cache: Optional[DiskCache] = None):
+        self.llm = llm
+        self.cache = cache or DiskCache(config.TRANSLATION_CACHE_DIR)
+
+    def _translate_with_llm(self, section: str) -> str:
+        key = "translation:" + hashlib.sha256(section.encode("utf-8")).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        prompt = f"""
+请将以下投资分析报告中的一个章节翻译成中文 (部分模板文字已翻译，保持不变即可)。要求：
+1. 保持原有的 Markdown 格式结构（标题、列表、分隔线等）
+2. 专业术语翻译准确（如 CAGR=复合年均增长率，PEG=市盈率相对盈利增长比率）
+3. 数字、股票代码、日期保持原样
+4. 翻译要流畅专业，符合金融分析报告的语言风格
+
+原文：
+{section}
+
+请直接输出翻译后的中文章节，不要添加任何解释说明：
+"""
+        translated = self.llm.analyze_text(prompt, self.SYSTEM_PROMPT, route="translation").strip()
+        if not translated:
+            # 翻译失败时保留 (部分翻译的) 原文，且不写入缓存
+            return section
+        self.cache.set(key, translated)
+        return translated
+
+    def translate_section(self, section: str) -> str:
+        lines, complete = [], True
+        for line in section.split("\n"):
+            translated, done = translate_static(line)
+            lines.append(translated)
+            complete = complete and done
+        text = "\n".join(lines)
+        if complete:
+            return text
+        # 章节首尾的空行不交给 LLM (译文会被 strip)，拼接时原样保留
+        body = text.strip("\n")
+        start = text.index(body) if body else 0
+        return text[:start] + self._translate_with_llm(body) + text[start + len(body):]
+
+    def translate(self, report: str) -> str:
+        sections = split_sections(report)
+        with ThreadPoolExecutor(max_workers=config.TRANSLATION_MAX_WORKERS) as pool:
+            # 以章节标题作为 telemetry 的 purpose
+            futures = [pool.submit(bind(self.translate_section, purpose=section.split("\n", 1)[0].lstrip("# ")),
+                                   section)
+                       for section in sections]
+            translated = [future.result() for future in futures]
+        return "\n".join(translated)